@@ -1,14 +1,34 @@
 """
 Flask Web应用
 """
-from flask import Flask, render_template, request, jsonify, redirect
-from database import init_db, get_db_session
+import json
+import os
+import time
+from typing import Optional
+from flask import Flask, render_template, request, jsonify, redirect, Response, g
+from flask.helpers import get_debug_flag
+from sqlalchemy import func
+from config import FLASK_DEBUG, ARTICLE_BATCH_CONCURRENCY, COZE_PUBLISH_CONCURRENCY
+from database import init_db, get_db_session, run_write
 from models import Topic, Title, Article, HTMLOutput, PromptTemplate, Config
-from services.title_service import generate_titles, save_titles_to_db
-from services.article_service import generate_article, save_article_to_db
-from services.html_service import generate_html, save_html_to_db
-from services.prompt_service import init_prompt_templates, get_prompt_templates, delete_prompt_template
-from services.coze_service import call_coze_api
+from services.title_service import stream_titles, save_titles_to_db, insert_titles
+from services.article_service import generate_article, stream_article, save_article_to_db
+from services.html_service import generate_html, stream_html, save_html_to_db
+from services.prompt_blob_service import store_prompt, get_record_prompt, fill_list_prompts
+from services.prompt_service import init_prompt_templates, get_prompt_templates, delete_prompt_template, create_prompt_template
+from services.publish_service import (create_publish_record, set_publish_job, get_publish_record, retry_publish, create_publish_fanout,
+                                      set_publishes_job, get_publish_report)
+from services.pipeline_service import create_pipeline_run, get_pipeline_run, resume_pipeline_run
+from services.job_service import start_job_workers, enqueue_job, get_job, wait_for_job, FINISHED_STATUSES
+from utils.text_parser import parse_titles
+from utils.response_cache import get_response_cache
+from utils.rate_limiter import get_gemini_limiter
+from utils.retry import get_retry_stats
+from utils.circuit_breaker import get_circuit_breaker, get_circuit_breakers, UPSTREAM_SETTINGS
+from utils.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS, render_metrics
+from utils.tracing import (start_span, activate, deactivate, parse_traceparent, bind_iterator, get_trace,
+                           list_traces)
+from utils.pagination import parse_list_args, select_columns, paginate, build_page
 from utils.logger import logger
 
 app = Flask(__name__)
@@ -26,6 +46,71 @@ try:
 except Exception as e:
     logger.error(f"提示词模板初始化失败: {e}", exc_info=True)
 
+def _is_reloader_monitor() -> bool:
+    """当前进程是否为 Werkzeug reloader 的监视进程（只在代码变化时重启子进程，不处理请求）"""
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        return False  # reloader 启动的子进程
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        return get_debug_flag()  # flask run：--debug 时默认启用 reloader
+    return __name__ == '__main__' and FLASK_DEBUG  # python app.py：app.run(debug=FLASK_DEBUG) 启用 reloader
+
+
+# 启动后台生成任务线程池，并恢复重启前未完成的任务（WSGI/ASGI 服务器导入本模块时同样启动）
+# reloader 的监视进程不处理任务，避免同一任务被两个进程执行
+if not _is_reloader_monitor():
+    start_job_workers()
+
+
+_UNTRACED_ENDPOINTS = {'static', 'metrics'}
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    # 每个请求一个追踪（请求带 traceparent 时沿用其中的追踪ID）；指标、追踪查看页和静态文件不记录
+    g.request_span = g.request_span_token = None
+    if request.endpoint in _UNTRACED_ENDPOINTS or request.path.startswith('/debug/'):
+        return
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    trace_id, parent_id = parse_traceparent(request.headers.get('traceparent'))
+    g.request_span = start_span(f"{request.method} {route}", trace_id=trace_id, parent_id=parent_id,
+                                path=request.path)
+    g.request_span_token = activate(g.request_span) if g.request_span else None
+
+
+@app.after_request
+def _record_request_metrics(response):
+    """按路由模板（而不是实际路径）记录请求耗时；流式响应在发送结束时记录"""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    method, status = request.method, str(response.status_code)
+    request_span = g.get('request_span')
+    if request_span:
+        request_span.set_attribute('status', response.status_code)
+        response.headers['X-Trace-Id'] = request_span.trace_id
+
+    def record():
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method, route)
+        HTTP_REQUESTS.inc(method, route, status)
+        if request_span:
+            request_span.end()
+
+    response.call_on_close(record)
+    return response
+
+
+@app.teardown_request
+def _deactivate_request_span(error=None):
+    """请求处理结束（流式响应体在此之后才发送，由 bind_iterator 带上请求的 span）"""
+    request_span = g.get('request_span')
+    if request_span and error is not None:
+        request_span.set_error(error)
+    token = g.pop('request_span_token', None)
+    if token is not None:
+        deactivate(token)
+
 
 @app.route('/')
 def index():
@@ -75,32 +160,100 @@ def config():
     return render_template('config.html')
 
 
+def _use_cache_flag(data: dict) -> bool:
+    """
+    生成类接口的 use_cache 参数
+
+    默认 False：界面上的生成/重新生成按钮不带此参数，每次都应得到新结果（结果仍会写入缓存）；
+    调用方传 true 时相同输入直接返回缓存结果。
+    """
+    return bool(data.get('use_cache', False))
+
+
+def _parse_concurrency(data: dict, limit: int) -> Optional[int]:
+    """
+    解析请求体中可选的 concurrency 参数
+
+    :param limit: 并发数上限，超出时取上限
+    :return: 并发数；未传时为 None（使用默认并发数）
+    :raises ValueError: 不是正整数
+    """
+    value = data.get('concurrency')
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("concurrency 必须是正整数")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError("concurrency 必须是正整数")
+    if value <= 0:
+        raise ValueError("concurrency 必须是正整数")
+    return min(value, limit)
+
+
+def _sse_event(event: str, data) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_generation_response(chunks, on_complete) -> Response:
+    """
+    把生成的文本片段逐个以 token 事件转发给浏览器
+    
+    :param chunks: 文本片段生成器
+    :param on_complete: 生成结束后的回调，参数为完整文本，返回值作为 done 事件的数据（用于保存到数据库）
+    """
+    def event_stream():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield _sse_event('token', {'text': chunk})
+            yield _sse_event('done', on_complete(''.join(parts).strip()))
+        except Exception as e:
+            logger.error(f"流式生成失败: {e}", exc_info=True)
+            yield _sse_event('error', {'error': str(e)})
+    
+    return Response(bind_iterator(event_stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# 列表接口可选字段（?fields=id,topic_text）；未指定时返回全部字段
+TOPIC_LIST_FIELDS = {
+    'id': Topic.id,
+    'topic_text': Topic.topic_text,
+    'status': Topic.status,
+    'created_at': Topic.created_at,
+    'titles_count': func.count(Title.id),
+}
+
+
 @app.route('/api/topics', methods=['GET'])
 def get_topics():
-    """获取所有主题"""
+    """获取所有主题（可选 limit/cursor 分页、fields 字段投影）"""
     logger.info("收到获取主题列表请求")
+    try:
+        fields, limit, cursor = parse_list_args(request.args, TOPIC_LIST_FIELDS, list(TOPIC_LIST_FIELDS))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     db = get_db_session()
     try:
-        topics = db.query(Topic).order_by(Topic.created_at.desc()).all()
-        logger.info(f"查询到 {len(topics)} 个主题")
-        result = []
-        for t in topics:
-            # 使用查询计数，避免关系加载问题
-            titles_count = db.query(Title).filter(Title.topic_id == t.id).count()
-            # 只返回有标题的主题（titles_count > 0）
-            if titles_count > 0:
-                result.append({
-                    'id': t.id,
-                    'topic_text': t.topic_text,
-                    'status': t.status,
-                    'created_at': t.created_at.isoformat(),
-                    'titles_count': titles_count
-                })
-        logger.info(f"过滤后返回 {len(result)} 个有标题的主题（已过滤 {len(topics) - len(result)} 个无标题主题）")
+        # 按主题分组统计标题数，内连接只保留有标题的主题（固定一条SQL，不随主题数增长）
+        query = db.query(*select_columns(TOPIC_LIST_FIELDS, fields, Topic.created_at, Topic.id)).join(
+            Title, Title.topic_id == Topic.id
+        ).group_by(Topic.id)
+        rows = paginate(query, Topic.created_at, Topic.id, limit, cursor).all()
+        result, next_cursor = build_page(rows, fields, limit)
+        logger.info(f"返回 {len(result)} 个有标题的主题")
         return jsonify({
             'success': True,
-            'data': result
+            'data': result,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取主题列表失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -132,30 +285,9 @@ def create_prompt():
         logger.warning("模板内容为空")
         return jsonify({'success': False, 'error': '模板内容不能为空'}), 400
     
-    db = get_db_session()
     try:
-        # 如果设置为默认模板，需要先取消同分类下其他模板的默认状态
-        if is_default:
-            logger.info(f"设置为默认模板，取消同分类下其他模板的默认状态")
-            existing_defaults = db.query(PromptTemplate).filter(
-                PromptTemplate.category == category,
-                PromptTemplate.is_default == True
-            ).all()
-            for template in existing_defaults:
-                template.is_default = False
-        
-        # 创建新模板
         logger.info(f"正在创建提示词模板: {name}")
-        template = PromptTemplate(
-            category=category,
-            name=name,
-            description=description,
-            content=content,
-            is_default=is_default
-        )
-        db.add(template)
-        db.commit()
-        template_id = template.id
+        template_id = create_prompt_template(category, name, content, description=description, is_default=is_default)
         logger.info(f"提示词模板创建成功，ID: {template_id}")
         
         return jsonify({
@@ -169,11 +301,8 @@ def create_prompt():
             }
         })
     except Exception as e:
-        db.rollback()
         logger.error(f"创建提示词模板失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/prompts/<category>', methods=['GET'])
@@ -369,6 +498,7 @@ def create_topic():
     data = request.json
     topic_text = data.get('topic_text', '').strip()
     template_id = data.get('template_id', None)  # 可选的提示词模板ID
+    use_cache = _use_cache_flag(data)
     
     logger.info(f"收到创建主题请求: topic='{topic_text}', template_id={template_id}")
     
@@ -387,35 +517,74 @@ def create_topic():
         db.close()
         logger.info(f"主题创建成功，ID: {topic_id}")
         
-        # 2. 生成标题（使用指定的模板）
-        logger.info(f"开始生成标题，使用模板ID: {template_id}")
-        titles, prompt_text, used_template_id = generate_titles(topic_text, template_id)
-        logger.info(f"标题生成完成，共生成 {len(titles)} 个标题")
-        
-        if not titles:
-            logger.warning("未能生成任何标题")
-            return jsonify({'success': False, 'error': '未能生成标题'}), 500
-        
-        # 3. 保存标题到数据库
-        logger.info(f"正在保存 {len(titles)} 个标题到数据库")
-        title_ids = save_titles_to_db(topic_id, titles, prompt_text, used_template_id)
-        logger.info(f"标题保存成功，ID列表: {title_ids}")
+        # 2. 创建标题生成任务（后台执行，立即返回任务ID）
+        job_id = enqueue_job('title', {
+            'topic_id': topic_id,
+            'topic_text': topic_text,
+            'template_id': template_id,
+            'use_cache': use_cache
+        })
+        logger.info(f"标题生成任务已创建: job_id={job_id}, template_id={template_id}")
         
         return jsonify({
             'success': True,
             'data': {
+                'job_id': job_id,
+                'status': 'pending',
                 'topic_id': topic_id,
-                'topic_text': topic_text,
-                'titles': titles,
-                'title_ids': title_ids,
-                'template_id': used_template_id
+                'topic_text': topic_text
             }
-        })
+        }), 202
     except Exception as e:
         logger.error(f"创建主题失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/topics/stream', methods=['POST'])
+def create_topic_stream():
+    """创建主题并流式生成标题（Server-Sent Events）"""
+    data = request.json
+    topic_text = data.get('topic_text', '').strip()
+    template_id = data.get('template_id', None)  # 可选的提示词模板ID
+    use_cache = _use_cache_flag(data)
+    
+    logger.info(f"收到流式创建主题请求: topic='{topic_text}', template_id={template_id}")
+    
+    if not topic_text:
+        logger.warning("主题为空，拒绝请求")
+        return jsonify({'success': False, 'error': '主题不能为空'}), 400
+    
+    try:
+        db = get_db_session()
+        topic = Topic(topic_text=topic_text, status="draft")
+        db.add(topic)
+        db.commit()
+        topic_id = topic.id
+        db.close()
+        logger.info(f"主题创建成功，ID: {topic_id}")
+        
+        chunks, prompt_text, used_template_id = stream_titles(topic_text, template_id, use_cache=use_cache)
+    except Exception as e:
+        logger.error(f"创建主题失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    def on_complete(raw_output):
+        titles = parse_titles(raw_output)
+        if not titles:
+            raise Exception("未能生成标题")
+        title_ids = save_titles_to_db(topic_id, titles, prompt_text, used_template_id)
+        logger.info(f"流式标题生成完成并保存，ID列表: {title_ids}")
+        return {
+            'topic_id': topic_id,
+            'topic_text': topic_text,
+            'titles': titles,
+            'title_ids': title_ids,
+            'template_id': used_template_id
+        }
+    
+    return _sse_generation_response(chunks, on_complete)
+
+
 @app.route('/api/topics/custom', methods=['POST'])
 def create_topic_with_custom_titles():
     """创建主题并保存自定义标题"""
@@ -434,44 +603,19 @@ def create_topic_with_custom_titles():
         return jsonify({'success': False, 'error': '至少需要输入一个标题'}), 400
     
     try:
-        # 1. 创建主题
-        logger.info(f"正在创建主题: {topic_text}")
-        db = get_db_session()
-        topic = Topic(topic_text=topic_text, status="draft")
-        db.add(topic)
-        db.commit()
-        topic_id = topic.id
-        db.close()
-        logger.info(f"主题创建成功，ID: {topic_id}")
+        # 创建主题并批量保存自定义标题（不需要prompt_text，因为是手动输入的），在同一个事务中提交
+        logger.info(f"正在创建主题并保存 {len(titles)} 个自定义标题: {topic_text}")
         
-        # 2. 保存自定义标题到数据库（不需要prompt_text，因为是手动输入的）
-        logger.info(f"正在保存 {len(titles)} 个自定义标题")
-        title_ids = []
-        db = get_db_session()
-        try:
-            for idx, title_text in enumerate(titles, 1):
-                logger.debug(f"保存标题 {idx}/{len(titles)}: '{title_text[:30]}...'")
-                title = Title(
-                    topic_id=topic_id,
-                    title_text=title_text,
-                    prompt_text="自定义标题（手动输入）",  # 标记为自定义标题
-                    prompt_template_id=None,
-                    selected=False
-                )
-                db.add(title)
-                db.flush()
-                title_ids.append(title.id)
-            
-            db.commit()
-            logger.info(f"自定义标题保存成功，共 {len(title_ids)} 个，ID列表: {title_ids}")
-        except Exception as e:
-            db.rollback()
-            logger.error(f"保存自定义标题失败: {e}", exc_info=True)
-            raise
-        finally:
-            db.close()
+        def write(db):
+            topic = Topic(topic_text=topic_text, status="draft")
+            db.add(topic)
+            db.flush()
+            return topic.id, insert_titles(db, topic.id, titles, "自定义标题（手动输入）")  # 标记为自定义标题
+        
+        topic_id, title_ids = run_write(write)
+        logger.info(f"主题创建成功，ID: {topic_id}；自定义标题保存成功，共 {len(title_ids)} 个，ID列表: {title_ids}")
         
-        # 3. 返回结果
+        # 返回结果
         return jsonify({
             'success': True,
             'data': {
@@ -485,19 +629,39 @@ def create_topic_with_custom_titles():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+TITLE_LIST_FIELDS = {
+    'id': Title.id,
+    'title_text': Title.title_text,
+    'prompt_text': Title.prompt_hash,  # 查询哈希，返回前替换为完整提示词
+    'selected': Title.selected,
+    'created_at': Title.created_at,
+}
+# 默认只返回轻量字段；提示词需通过 fields 显式请求，或使用 /prompt 接口
+TITLE_LIST_DEFAULT_FIELDS = ['id', 'title_text', 'selected', 'created_at']
+
+
 @app.route('/api/topics/<int:topic_id>/titles', methods=['GET'])
 def get_titles(topic_id):
-    """获取主题下的所有标题"""
+    """获取主题下的所有标题（可选 limit/cursor 分页、fields 字段投影）"""
     logger.info(f"收到获取标题请求: topic_id={topic_id}")
+    try:
+        fields, limit, cursor = parse_list_args(request.args, TITLE_LIST_FIELDS, TITLE_LIST_DEFAULT_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     db = get_db_session()
     try:
-        topic = db.query(Topic).filter(Topic.id == topic_id).first()
+        topic = db.query(Topic.id, Topic.topic_text).filter(Topic.id == topic_id).first()
         if not topic:
             logger.warning(f"主题不存在: topic_id={topic_id}")
             return jsonify({'success': False, 'error': '主题不存在'}), 404
         
         # 直接查询标题，避免关系加载问题
-        titles = db.query(Title).filter(Title.topic_id == topic_id).order_by(Title.created_at.desc()).all()
+        query = db.query(*select_columns(TITLE_LIST_FIELDS, fields, Title.created_at, Title.id)).filter(Title.topic_id == topic_id)
+        rows = paginate(query, Title.created_at, Title.id, limit, cursor).all()
+        titles, next_cursor = build_page(rows, fields, limit)
+        if 'prompt_text' in fields:
+            fill_list_prompts(db, titles)
         logger.info(f"查询到 {len(titles)} 个标题")
         
         return jsonify({
@@ -507,15 +671,12 @@ def get_titles(topic_id):
                     'id': topic.id,
                     'topic_text': topic.topic_text
                 },
-                'titles': [{
-                    'id': t.id,
-                    'title_text': t.title_text,
-                    'prompt_text': t.prompt_text,
-                    'selected': t.selected,
-                    'created_at': t.created_at.isoformat()
-                } for t in titles]
-            }
+                'titles': titles
+            },
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取标题失败: topic_id={topic_id}, error={e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -537,7 +698,7 @@ def get_title_prompt(title_id):
             'data': {
                 'id': title.id,
                 'title_text': title.title_text,
-                'prompt_text': title.prompt_text,
+                'prompt_text': get_record_prompt(db, title),
                 'created_at': title.created_at.isoformat()
             }
         })
@@ -562,7 +723,7 @@ def get_article_prompt(article_id):
                 'id': article.id,
                 'title_text': article.title.title_text,
                 'article_text': article.article_text[:100] + '...',
-                'prompt_text': article.prompt_text,
+                'prompt_text': get_record_prompt(db, article),
                 'created_at': article.created_at.isoformat()
             }
         })
@@ -588,7 +749,7 @@ def get_html_prompt(html_id):
             'data': {
                 'id': html_output.id,
                 'article_title': html_output.article.title.title_text,
-                'prompt_text': html_output.prompt_text,
+                'prompt_text': get_record_prompt(db, html_output),
                 'created_at': html_output.created_at.isoformat()
             }
         })
@@ -644,7 +805,8 @@ def create_custom_article():
         title = Title(
             topic_id=topic_id,
             title_text=title_text,
-            prompt_text="自定义标题和短文（手动输入）",
+            prompt_text="",
+            prompt_hash=store_prompt(db, "自定义标题和短文（手动输入）"),
             prompt_template_id=None,
             selected=False
         )
@@ -658,7 +820,8 @@ def create_custom_article():
         article = Article(
             title_id=title_id,
             article_text=article_text,
-            prompt_text="自定义短文（手动输入）",
+            prompt_text="",
+            prompt_hash=store_prompt(db, "自定义短文（手动输入）"),
             prompt_template_id=None,
             selected=False
         )
@@ -692,6 +855,7 @@ def create_article(title_id):
     """为标题生成短文"""
     data = request.json or {}
     template_id = data.get('template_id', None)  # 可选的提示词模板ID
+    use_cache = _use_cache_flag(data)
     
     logger.info(f"收到生成短文请求: title_id={title_id}, template_id={template_id}")
     
@@ -702,49 +866,229 @@ def create_article(title_id):
             logger.warning(f"标题不存在: title_id={title_id}")
             return jsonify({'success': False, 'error': '标题不存在'}), 404
         
-        logger.info(f"开始为标题生成短文: '{title.title_text}'")
-        # 生成短文（使用指定的模板）
-        article_text, prompt_text, used_template_id = generate_article(title.title_text, template_id)
-        logger.info(f"短文生成完成，长度: {len(article_text)} 字符")
+        # 创建短文生成任务（后台执行，立即返回任务ID）
+        title_text = title.title_text
+        job_id = enqueue_job('article', {'title_id': title_id, 'template_id': template_id, 'use_cache': use_cache})
+        logger.info(f"短文生成任务已创建: job_id={job_id}, title='{title_text}'")
         
-        # 保存到数据库
-        logger.info(f"正在保存短文到数据库")
+        return jsonify({
+            'success': True,
+            'data': {
+                'job_id': job_id,
+                'status': 'pending',
+                'title_id': title_id
+            }
+        }), 202
+    except Exception as e:
+        logger.error(f"创建短文生成任务失败: title_id={title_id}, error={e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
+
+
+@app.route('/api/titles/<int:title_id>/articles/stream', methods=['POST'])
+def create_article_stream(title_id):
+    """为标题流式生成短文（Server-Sent Events）"""
+    data = request.json or {}
+    template_id = data.get('template_id', None)  # 可选的提示词模板ID
+    use_cache = _use_cache_flag(data)
+    
+    logger.info(f"收到流式生成短文请求: title_id={title_id}, template_id={template_id}")
+    
+    db = get_db_session()
+    try:
+        title = db.query(Title).filter(Title.id == title_id).first()
+        if not title:
+            logger.warning(f"标题不存在: title_id={title_id}")
+            return jsonify({'success': False, 'error': '标题不存在'}), 404
+        title_text = title.title_text
+    finally:
+        db.close()
+    
+    try:
+        chunks, prompt_text, used_template_id = stream_article(title_text, template_id, use_cache=use_cache)
+    except Exception as e:
+        logger.error(f"生成短文失败: title_id={title_id}, error={e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    def on_complete(article_text):
         article_id = save_article_to_db(title_id, article_text, prompt_text, used_template_id)
-        logger.info(f"短文保存成功，ID: {article_id}")
+        return {
+            'article_id': article_id,
+            'article_text': article_text,
+            'template_id': used_template_id
+        }
+    
+    return _sse_generation_response(chunks, on_complete)
+
+
+@app.route('/api/articles/batch', methods=['POST'])
+def create_articles_batch():
+    """批量为标题生成短文（后台任务，并发数受限）"""
+    data = request.json or {}
+    title_ids = data.get('title_ids', [])
+    template_id = data.get('template_id', None)  # 可选的提示词模板ID
+    use_cache = _use_cache_flag(data)
+    
+    logger.info(f"收到批量生成短文请求: title_ids={title_ids}, template_id={template_id}, concurrency={data.get('concurrency')}")
+    
+    try:
+        concurrency = _parse_concurrency(data, ARTICLE_BATCH_CONCURRENCY)  # 可选的并发数（不超过 ARTICLE_BATCH_CONCURRENCY）
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if not isinstance(title_ids, list) or not title_ids:
+        logger.warning("标题ID列表为空，拒绝请求")
+        return jsonify({'success': False, 'error': '标题ID列表不能为空'}), 400
+    
+    try:
+        title_ids = [int(tid) for tid in title_ids]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': '标题ID必须是整数'}), 400
+    
+    try:
+        job_id = enqueue_job('article_batch', {
+            'title_ids': title_ids,
+            'template_id': template_id,
+            'use_cache': use_cache,
+            'concurrency': concurrency
+        })
+        logger.info(f"批量短文生成任务已创建: job_id={job_id}, 标题数: {len(title_ids)}")
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'job_id': job_id,
+                'status': 'pending',
+                'title_ids': title_ids
+            }
+        }), 202
+    except Exception as e:
+        logger.error(f"创建批量短文生成任务失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/pipelines', methods=['POST'])
+def create_pipeline():
+    """创建完整流水线：主题 → 标题 → 短文 → HTML → Coze 发布（后台任务）"""
+    data = request.json or {}
+    topic_text = data.get('topic', '').strip()
+    title_count = data.get('title_count', None)  # 可选：选取前几个标题继续生成，默认全部
+    publish = data.get('publish', True)  # 为 False 时只生成到 HTML，不调用 Coze
+    wechat_config_name = data.get('wechat_config_name', None)  # 可选的微信配置名称
+    
+    logger.info(f"收到流水线请求: topic='{topic_text}', title_count={title_count}, publish={publish}")
+    
+    if not topic_text:
+        logger.warning("主题为空，拒绝请求")
+        return jsonify({'success': False, 'error': '主题不能为空'}), 400
+    
+    try:
+        run_id = create_pipeline_run(
+            topic_text,
+            title_count=int(title_count) if title_count else None,
+            title_template_id=data.get('title_template_id', None),
+            article_template_id=data.get('article_template_id', None),
+            html_template_id=data.get('html_template_id', None),
+            wechat_config_name=wechat_config_name,
+            publish=publish
+        )
+        job_id = enqueue_job('pipeline', {'run_id': run_id})
+        logger.info(f"流水线任务已创建: run_id={run_id}, job_id={job_id}")
         
         return jsonify({
             'success': True,
             'data': {
-                'article_id': article_id,
-                'article_text': article_text,
-                'template_id': used_template_id
+                'run_id': run_id,
+                'job_id': job_id,
+                'status': 'pending'
             }
+        }), 202
+    except Exception as e:
+        logger.error(f"创建流水线失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/pipelines/<int:run_id>', methods=['GET'])
+def get_pipeline(run_id):
+    """查询流水线运行状态及每个标题的进度"""
+    try:
+        run = get_pipeline_run(run_id)
+        if not run:
+            return jsonify({'success': False, 'error': '流水线不存在'}), 404
+        return jsonify({
+            'success': True,
+            'data': run
         })
     except Exception as e:
-        logger.error(f"生成短文失败: title_id={title_id}, error={e}", exc_info=True)
+        logger.error(f"查询流水线失败: run_id={run_id}, error={e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        db.close()
+
+
+@app.route('/api/pipelines/<int:run_id>/resume', methods=['POST'])
+def resume_pipeline(run_id):
+    """从检查点继续执行失败的流水线（已完成的阶段不会重复执行）"""
+    try:
+        if not resume_pipeline_run(run_id):
+            run = get_pipeline_run(run_id)
+            if not run:
+                return jsonify({'success': False, 'error': '流水线不存在'}), 404
+            return jsonify({'success': False, 'error': f"只有失败的流水线可以继续，当前状态: {run['status']}"}), 409
+        
+        job_id = enqueue_job('pipeline', {'run_id': run_id})
+        logger.info(f"流水线继续执行: run_id={run_id}, job_id={job_id}")
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'run_id': run_id,
+                'job_id': job_id,
+                'status': 'pending'
+            }
+        }), 202
+    except Exception as e:
+        logger.error(f"继续执行流水线失败: run_id={run_id}, error={e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+ARTICLE_LIST_FIELDS = {
+    'id': Article.id,
+    'title_id': Article.title_id,
+    'title_text': Title.title_text,
+    'article_text': Article.article_text,
+    'prompt_text': Article.prompt_hash,  # 查询哈希，返回前替换为完整提示词
+    'preview': Article.preview,  # 前100个字符，写入短文时保存的明文预览（压缩存储时也不需要读取全文）
+    'selected': Article.selected,
+    'created_at': Article.created_at,
+}
+# 默认只返回轻量字段；短文全文和提示词需通过 fields 显式请求，或使用详情和 /prompt 接口
+ARTICLE_LIST_DEFAULT_FIELDS = ['id', 'title_id', 'title_text', 'preview', 'selected', 'created_at']
 
 
 @app.route('/api/articles', methods=['GET'])
 def get_articles():
-    """获取所有短文"""
+    """获取所有短文（可选 limit/cursor 分页、fields 字段投影，如 fields=id,title_text,preview）"""
+    try:
+        fields, limit, cursor = parse_list_args(request.args, ARTICLE_LIST_FIELDS, ARTICLE_LIST_DEFAULT_FIELDS)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     db = get_db_session()
     try:
-        articles = db.query(Article).order_by(Article.created_at.desc()).all()
+        query = db.query(*select_columns(ARTICLE_LIST_FIELDS, fields, Article.created_at, Article.id)).join(
+            Title, Article.title_id == Title.id
+        )
+        rows = paginate(query, Article.created_at, Article.id, limit, cursor).all()
+        articles, next_cursor = build_page(rows, fields, limit)
+        if 'prompt_text' in fields:
+            fill_list_prompts(db, articles)
         return jsonify({
             'success': True,
-            'data': [{
-                'id': a.id,
-                'title_id': a.title_id,
-                'title_text': a.title.title_text,
-                'article_text': a.article_text,
-                'prompt_text': a.prompt_text,
-                'selected': a.selected,
-                'created_at': a.created_at.isoformat()
-            } for a in articles]
+            'data': articles,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
@@ -756,6 +1100,7 @@ def create_html(article_id):
     """为短文生成HTML"""
     data = request.json or {}
     template_id = data.get('template_id', None)  # 可选的提示词模板ID
+    use_cache = _use_cache_flag(data)
     
     db = get_db_session()
     try:
@@ -763,26 +1108,229 @@ def create_html(article_id):
         if not article:
             return jsonify({'success': False, 'error': '短文不存在'}), 404
         
-        # 生成HTML（使用指定的模板）
-        html_content, prompt_text, used_template_id = generate_html(article.article_text, template_id)
-        
-        # 保存到数据库
-        html_id = save_html_to_db(article_id, html_content, prompt_text, used_template_id)
+        # 创建HTML生成任务（后台执行，立即返回任务ID）
+        job_id = enqueue_job('html', {'article_id': article_id, 'template_id': template_id, 'use_cache': use_cache})
+        logger.info(f"HTML生成任务已创建: job_id={job_id}, article_id={article_id}")
         
         return jsonify({
             'success': True,
             'data': {
-                'html_id': html_id,
-                'html_content': html_content,
-                'template_id': used_template_id
+                'job_id': job_id,
+                'status': 'pending',
+                'article_id': article_id
             }
-        })
+        }), 202
     except Exception as e:
+        logger.error(f"创建HTML生成任务失败: article_id={article_id}, error={e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         db.close()
 
 
+@app.route('/api/articles/<int:article_id>/html/stream', methods=['POST'])
+def create_html_stream(article_id):
+    """为短文流式生成HTML（Server-Sent Events）"""
+    data = request.json or {}
+    template_id = data.get('template_id', None)  # 可选的提示词模板ID
+    use_cache = _use_cache_flag(data)
+    
+    logger.info(f"收到流式生成HTML请求: article_id={article_id}, template_id={template_id}")
+    
+    db = get_db_session()
+    try:
+        article = db.query(Article).filter(Article.id == article_id).first()
+        if not article:
+            return jsonify({'success': False, 'error': '短文不存在'}), 404
+        article_text = article.article_text
+    finally:
+        db.close()
+    
+    try:
+        chunks, prompt_text, used_template_id = stream_html(article_text, template_id, use_cache=use_cache)
+    except Exception as e:
+        logger.error(f"生成HTML失败: article_id={article_id}, error={e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    def on_complete(html_content):
+        html_id = save_html_to_db(article_id, html_content, prompt_text, used_template_id)
+        return {
+            'html_id': html_id,
+            'html_content': html_content,
+            'template_id': used_template_id
+        }
+    
+    return _sse_generation_response(chunks, on_complete)
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """获取Gemini响应缓存的命中统计"""
+    cache = get_response_cache()
+    if not cache:
+        return jsonify({'success': True, 'data': {'enabled': False}})
+    return jsonify({
+        'success': True,
+        'data': cache.stats()
+    })
+
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    """清空Gemini响应缓存"""
+    cache = get_response_cache()
+    if cache:
+        cache.clear()
+        logger.info("Gemini响应缓存已清空")
+    return jsonify({'success': True})
+
+
+@app.route('/api/limiter/stats', methods=['GET'])
+def get_limiter_stats():
+    """获取Gemini限流器状态（RPM/TPM 余量、当前并发上限、排队深度）"""
+    limiter = get_gemini_limiter()
+    if not limiter:
+        return jsonify({'success': True, 'data': {'enabled': False}})
+    return jsonify({
+        'success': True,
+        'data': limiter.stats()
+    })
+
+
+@app.route('/api/retry/stats', methods=['GET'])
+def get_retry_stats_api():
+    """获取Gemini重试统计（按标题/短文/HTML分别统计重试、对冲次数和耗时分位数）"""
+    return jsonify({
+        'success': True,
+        'data': get_retry_stats()
+    })
+
+
+@app.route('/api/circuit-breakers', methods=['GET'])
+def list_circuit_breakers():
+    """获取各上游（Gemini / Coze）熔断器的状态和失败统计"""
+    breakers = get_circuit_breakers()
+    if not breakers:
+        return jsonify({'success': True, 'data': {'enabled': False}})
+    return jsonify({
+        'success': True,
+        'data': [breaker.snapshot() for breaker in breakers]
+    })
+
+
+@app.route('/api/circuit-breakers/<name>/reset', methods=['POST'])
+def reset_circuit_breaker(name):
+    """手动将熔断器恢复为闭合状态（确认上游已恢复时使用）"""
+    if name not in UPSTREAM_SETTINGS:
+        return jsonify({'success': False, 'error': f'未知的上游: {name}'}), 404
+    breaker = get_circuit_breaker(name)
+    if not breaker:
+        return jsonify({'success': False, 'error': '熔断器未启用'}), 400
+    breaker.reset()
+    return jsonify({
+        'success': True,
+        'data': breaker.snapshot()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的指标：各阶段耗时直方图、上游调用次数和 Gemini token 用量"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/traces', methods=['GET'])
+def list_recent_traces():
+    """最近的追踪（可选 limit 参数，其他查询参数按 span 属性过滤，例如 ?job_id=12）"""
+    limit = request.args.get('limit', 50, type=int)
+    filters = {key: value for key, value in request.args.items() if key != 'limit'}
+    return jsonify({
+        'success': True,
+        'data': list_traces(limit, filters)
+    })
+
+
+@app.route('/debug/traces/<trace_id>', methods=['GET'])
+def show_trace(trace_id):
+    """某个追踪的瀑布图（?format=json 返回 span 列表）"""
+    spans = get_trace(trace_id)
+    if spans is None:
+        if request.args.get('format') == 'json':
+            return jsonify({'success': False, 'error': '追踪不存在或已过期'}), 404
+        return render_template('trace.html', trace_id=trace_id, rows=None), 404
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, 'data': spans})
+    return render_template('trace.html', trace_id=trace_id, rows=_waterfall_rows(spans))
+
+
+def _waterfall_rows(spans):
+    """按父子关系排序并计算每个 span 在时间轴上的位置（百分比）"""
+    start = min(s['start_time'] for s in spans)
+    end = max(s['start_time'] + (s['duration_ms'] or 0) / 1000 for s in spans)
+    total = max(end - start, 1e-6)
+    ids = {s['span_id'] for s in spans}
+    children = {}
+    for s in spans:
+        parent = s['parent_id'] if s['parent_id'] in ids else None
+        children.setdefault(parent, []).append(s)
+
+    rows = []
+
+    def visit(parent, depth):
+        for s in children.get(parent, []):
+            rows.append({
+                **s,
+                'depth': depth,
+                'offset_ms': round((s['start_time'] - start) * 1000, 1),
+                'left': (s['start_time'] - start) / total * 100,
+                'width': max((s['duration_ms'] or 0) / 1000 / total * 100, 0.2),
+            })
+            visit(s['span_id'], depth + 1)
+
+    visit(None, 0)
+    return rows
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """查询生成任务状态（可选 wait 参数：最长等待秒数，任务结束后立即返回）"""
+    wait = request.args.get('wait', type=float)
+    try:
+        if wait:
+            job = wait_for_job(job_id, timeout=min(wait, 30.0))
+        else:
+            job = get_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': '任务不存在'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': job
+        })
+    except Exception as e:
+        logger.error(f"查询任务状态失败: job_id={job_id}, error={e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<int:job_id>/events', methods=['GET'])
+def subscribe_job(job_id):
+    """订阅生成任务状态（Server-Sent Events，任务结束后关闭连接）"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    
+    def event_stream():
+        current = job
+        while True:
+            yield _sse_event(current['status'], current)
+            if current['status'] in FINISHED_STATUSES:
+                break
+            current = wait_for_job(job_id, timeout=15.0)
+            if not current:
+                break
+    
+    return Response(event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
 @app.route('/api/html/<int:html_id>', methods=['GET'])
 def get_html(html_id):
     """获取HTML输出"""
@@ -807,22 +1355,38 @@ def get_html(html_id):
         db.close()
 
 
+HTML_LIST_FIELDS = {
+    'id': HTMLOutput.id,
+    'article_id': HTMLOutput.article_id,
+    'article_title': Title.title_text,
+    'created_at': HTMLOutput.created_at,
+}
+
+
 @app.route('/api/html', methods=['GET'])
 def list_html_outputs():
-    """获取所有HTML输出列表（不包含HTML内容）"""
+    """获取所有HTML输出列表（不包含HTML内容，可选 limit/cursor 分页、fields 字段投影）"""
+    try:
+        fields, limit, cursor = parse_list_args(request.args, HTML_LIST_FIELDS, list(HTML_LIST_FIELDS))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     db = get_db_session()
     try:
-        html_outputs = db.query(HTMLOutput).order_by(HTMLOutput.created_at.desc()).all()
+        # 只查询列表需要的列，不加载 html_content
+        query = db.query(*select_columns(HTML_LIST_FIELDS, fields, HTMLOutput.created_at, HTMLOutput.id)).join(
+            Article, HTMLOutput.article_id == Article.id
+        ).join(Title, Article.title_id == Title.id)
+        rows = paginate(query, HTMLOutput.created_at, HTMLOutput.id, limit, cursor).all()
+        html_outputs, next_cursor = build_page(rows, fields, limit)
         logger.info(f"获取HTML输出列表，共 {len(html_outputs)} 条")
         return jsonify({
             'success': True,
-            'data': [{
-                'id': h.id,
-                'article_id': h.article_id,
-                'article_title': h.article.title.title_text,
-                'created_at': h.created_at.isoformat()
-            } for h in html_outputs]
+            'data': html_outputs,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取HTML输出列表失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -848,7 +1412,7 @@ def get_html_output(html_id):
                 'article_id': html_output.article_id,
                 'article_title': html_output.article.title.title_text,
                 'html_content': html_output.html_content,
-                'prompt_text': html_output.prompt_text,
+                'prompt_text': get_record_prompt(db, html_output),
                 'created_at': html_output.created_at.isoformat()
             }
         })
@@ -861,7 +1425,7 @@ def get_html_output(html_id):
 
 @app.route('/api/titles/<int:title_id>/coze', methods=['POST'])
 def call_coze_for_title(title_id):
-    """为标题生成HTML并调用Coze API"""
+    """为标题生成HTML并调用Coze API（后台执行，立即返回发布ID）"""
     data = request.json or {}
     html_template_id = data.get('html_template_id', None)  # 可选的HTML提示词模板ID
     wechat_config_name = data.get('wechat_config_name', None)  # 可选的微信配置名称
@@ -870,84 +1434,138 @@ def call_coze_for_title(title_id):
     
     db = get_db_session()
     try:
-        title = db.query(Title).filter(Title.id == title_id).first()
+        title = db.query(Title.id).filter(Title.id == title_id).first()
         if not title:
             logger.warning(f"标题不存在: title_id={title_id}")
             return jsonify({'success': False, 'error': '标题不存在'}), 404
+    finally:
+        db.close()
+
+    try:
+        # 创建发布记录和后台任务（生成短文/HTML、调用 Coze 均在后台执行）
+        publish_id = create_publish_record(title_id, html_template_id, wechat_config_name)
+        job_id = enqueue_job('coze_publish', {'publish_id': publish_id})
+        set_publish_job(publish_id, job_id)
+        logger.info(f"Coze发布任务已创建: publish_id={publish_id}, job_id={job_id}")
         
-        # 1. 检查是否已有短文，如果没有则生成
-        article = db.query(Article).filter(Article.title_id == title_id).first()
-        if not article:
-            logger.info(f"标题没有对应的短文，开始生成短文")
-            article_text, prompt_text, used_template_id = generate_article(title.title_text)
-            article_id = save_article_to_db(title_id, article_text, prompt_text, used_template_id)
-            article = db.query(Article).filter(Article.id == article_id).first()
-        else:
-            logger.info(f"使用已有短文: article_id={article.id}")
-        
-        # 2. 检查是否已有HTML，如果没有则生成
-        html_output = db.query(HTMLOutput).filter(HTMLOutput.article_id == article.id).first()
-        if not html_output:
-            logger.info(f"短文没有对应的HTML，开始生成HTML")
-            html_content, html_prompt_text, used_html_template_id = generate_html(article.article_text, html_template_id)
-            html_id = save_html_to_db(article.id, html_content, html_prompt_text, used_html_template_id)
-            html_output = db.query(HTMLOutput).filter(HTMLOutput.id == html_id).first()
-        else:
-            logger.info(f"使用已有HTML: html_id={html_output.id}")
-        
-        # 3. 获取微信配置（如果提供了配置名称）
-        wechat_app_id = None
-        wechat_app_secret = None
-        if wechat_config_name:
-            logger.info(f"获取微信配置: name='{wechat_config_name}'")
-            app_id_config = db.query(Config).filter(
-                Config.name == wechat_config_name,
-                Config.key == 'WECHAT_APP_ID'
-            ).first()
-            app_secret_config = db.query(Config).filter(
-                Config.name == wechat_config_name,
-                Config.key == 'WECHAT_APP_SECRET'
-            ).first()
-            
-            if app_id_config:
-                wechat_app_id = app_id_config.value
-                logger.info(f"获取到微信AppID: {app_id_config.value[:4]}...{app_id_config.value[-4:] if len(app_id_config.value) > 8 else '****'}")
-            else:
-                logger.warning(f"未找到微信配置: name='{wechat_config_name}', key='WECHAT_APP_ID'")
-            
-            if app_secret_config:
-                wechat_app_secret = app_secret_config.value
-                logger.info(f"获取到微信AppSecret: {app_secret_config.value[:4]}...{app_secret_config.value[-4:] if len(app_secret_config.value) > 8 else '****'}")
-            else:
-                logger.warning(f"未找到微信配置: name='{wechat_config_name}', key='WECHAT_APP_SECRET'")
-        
-        # 4. 调用Coze API
-        logger.info(f"开始调用Coze API: title='{title.title_text}', wechat_config_name={wechat_config_name}")
-        coze_result = call_coze_api(
-            title.title_text, 
-            html_output.html_content,
-            wechat_app_id=wechat_app_id,
-            wechat_app_secret=wechat_app_secret
-        )
-        
-        logger.info(f"Coze API调用成功: title_id={title_id}")
         return jsonify({
             'success': True,
             'data': {
-                'title_id': title_id,
-                'title_text': title.title_text,
-                'html_id': html_output.id,
-                'wechat_config_name': wechat_config_name,
-                'wechat_app_id': wechat_app_id,
-                'coze_result': coze_result
+                'publish_id': publish_id,
+                'job_id': job_id,
+                'status': 'pending',
+                'title_id': title_id
             }
-        })
+        }), 202
     except Exception as e:
-        logger.error(f"调用Coze API失败: title_id={title_id}, error={e}", exc_info=True)
+        logger.error(f"创建Coze发布任务失败: title_id={title_id}, error={e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/titles/<int:title_id>/coze/fanout', methods=['POST'])
+def call_coze_fanout_for_title(title_id):
+    """将标题对应的HTML并发发布到多个公众号（后台执行，立即返回任务ID和各公众号的发布ID）"""
+    data = request.json or {}
+    wechat_config_names = data.get('wechat_config_names') or []  # 微信配置名称列表
+    html_template_id = data.get('html_template_id', None)  # 可选的HTML提示词模板ID
+    
+    logger.info(f"收到多公众号发布请求: title_id={title_id}, wechat_config_names={wechat_config_names}, concurrency={data.get('concurrency')}")
+    
+    try:
+        concurrency = _parse_concurrency(data, COZE_PUBLISH_CONCURRENCY)  # 可选的并发数（不超过 COZE_PUBLISH_CONCURRENCY）
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not isinstance(wechat_config_names, list) or not all(isinstance(n, str) and n.strip() for n in wechat_config_names):
+        return jsonify({'success': False, 'error': 'wechat_config_names 必须是非空的微信配置名称列表'}), 400
+    if not wechat_config_names:
+        return jsonify({'success': False, 'error': '请至少选择一个微信配置'}), 400
+    
+    db = get_db_session()
+    try:
+        title = db.query(Title.id).filter(Title.id == title_id).first()
+        if not title:
+            logger.warning(f"标题不存在: title_id={title_id}")
+            return jsonify({'success': False, 'error': '标题不存在'}), 404
     finally:
         db.close()
 
+    try:
+        publish_ids = create_publish_fanout(title_id, [n.strip() for n in wechat_config_names], html_template_id)
+        job_id = enqueue_job('coze_publish_fanout', {'publish_ids': publish_ids, 'concurrency': concurrency})
+        set_publishes_job(publish_ids, job_id)
+        logger.info(f"多公众号发布任务已创建: job_id={job_id}, publish_ids={publish_ids}")
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'job_id': job_id,
+                'publish_ids': publish_ids,
+                'status': 'pending',
+                'title_id': title_id
+            }
+        }), 202
+    except Exception as e:
+        logger.error(f"创建多公众号发布任务失败: title_id={title_id}, error={e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/publishes', methods=['GET'])
+def get_publishes_report():
+    """按任务ID获取多公众号发布的汇总报告（?job_id=，执行中也可查询各公众号的进度）"""
+    job_id = request.args.get('job_id', type=int)
+    if not job_id:
+        return jsonify({'success': False, 'error': '缺少 job_id 参数'}), 400
+    report = get_publish_report(job_id)
+    if not report:
+        return jsonify({'success': False, 'error': '该任务没有发布记录'}), 404
+    return jsonify({
+        'success': True,
+        'data': report
+    })
+
+
+@app.route('/api/publishes/<int:publish_id>', methods=['GET'])
+def get_publish(publish_id):
+    """获取Coze发布记录（状态、已收到的工作流事件数、最近一个事件和最终结果）"""
+    record = get_publish_record(publish_id)
+    if not record:
+        return jsonify({'success': False, 'error': '发布记录不存在'}), 404
+    return jsonify({
+        'success': True,
+        'data': record
+    })
+
+
+
+@app.route('/api/publishes/<int:publish_id>/retry', methods=['POST'])
+def retry_publish_record(publish_id):
+    """重新执行失败的发布（执行中断的发布不会自动重发，确认公众号未收到文章后通过此接口重试）"""
+    record = get_publish_record(publish_id)
+    if not record:
+        return jsonify({'success': False, 'error': '发布记录不存在'}), 404
+    job = get_job(record['job_id']) if record['job_id'] else None
+    if job and job['status'] not in FINISHED_STATUSES:
+        # 所属任务还可能执行这条发布（如多公众号发布任务仍在进行或等待恢复）
+        return jsonify({'success': False, 'error': f"发布所属的任务尚未结束: job_id={job['id']}"}), 409
+    if not retry_publish(publish_id):
+        return jsonify({'success': False, 'error': f"只有失败的发布可以重试，当前状态: {record['status']}"}), 409
+
+    try:
+        job_id = enqueue_job('coze_publish', {'publish_id': publish_id})
+        set_publish_job(publish_id, job_id)
+        logger.info(f"Coze发布重试任务已创建: publish_id={publish_id}, job_id={job_id}")
+        return jsonify({
+            'success': True,
+            'data': {
+                'publish_id': publish_id,
+                'job_id': job_id,
+                'status': 'pending'
+            }
+        }), 202
+    except Exception as e:
+        logger.error(f"创建Coze发布重试任务失败: publish_id={publish_id}, error={e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 
 if __name__ == '__main__':
     from config import FLASK_HOST, FLASK_PORT, FLASK_DEBUG
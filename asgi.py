@@ -0,0 +1,44 @@
+"""
+ASGI 入口
+
+用法: uvicorn asgi:application --host 0.0.0.0 --port 5001
+
+app.py 中的路由不变，由 a2wsgi 在线程池（ASGI_THREADS 个线程）中执行；服务器的事件循环同时作为共享事件循环，
+视图和后台任务中通过 run_async 发起的异步上游调用（ASYNC_HTTP_ENABLED）都在这一个循环中并发执行。
+需要安装 uvicorn 和 a2wsgi（异步上游调用还需要 httpx）。
+"""
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+
+from app import app
+from config import ASGI_THREADS
+from services.job_service import start_job_workers
+from utils.async_runtime import use_event_loop
+from utils.http_client import async_http_available, close_async_http_client
+from utils.logger import logger
+
+_wsgi_application = WSGIMiddleware(app, workers=ASGI_THREADS)
+
+
+async def _lifespan(receive, send):
+    """启动时接管事件循环并启动后台任务线程池（恢复重启前未完成的任务），关闭时释放异步 HTTP 连接"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            use_event_loop(asyncio.get_running_loop())
+            start_job_workers()
+            logger.info(f"ASGI 服务已启动: threads={ASGI_THREADS}")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if async_http_available():
+                await close_async_http_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    await _wsgi_application(scope, receive, send)
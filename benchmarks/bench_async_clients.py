@@ -0,0 +1,245 @@
+"""
+异步上游调用基准测试 / 回归检查
+
+用法: python -m benchmarks.bench_async_clients [--calls 300] [--latency 0.5] [--coze-calls 50]
+
+本地桩服务（在本进程中运行，每个请求处理 --latency 秒）模拟 Gemini 和 Coze，各配置在独立子进程中运行：
+- threads：--calls 个线程同时调用 get_gemini_response（原同步方式，每个在途请求占用一个线程）
+- async：同一个事件循环中同时执行 --calls 个 async_get_gemini_response
+- batch：ASYNC_HTTP_ENABLED=true 时 generate_articles_batch 为 --calls 个标题生成短文（共享事件循环 + 数据库写入）
+- coze：同一个事件循环中同时执行 --coze-calls 个 async_call_coze_api（SSE 逐条解析）
+- asgi：uvicorn 启动 asgi:application，请求 app.py 的接口并通过 ASYNC_HTTP_ENABLED 的批量接口生成短文
+限流并发上限设为 --calls，比较耗时、上游同时处理的请求数和进程的最大线程数。
+异步调用失败、没有并发执行或线程数随并发增长时退出码非 0。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("threads", "async", "batch", "coze", "asgi")
+
+
+class ThreadSampler:
+    """后台每 10ms 记录一次进程的线程数"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _seed_titles(count: int):
+    """在当前目录的新数据库中写入默认短文模板和 count 个标题，返回标题ID列表"""
+    from database import init_db, get_db_session
+    from models import Topic, Title, PromptTemplate
+    init_db()
+    db = get_db_session()
+    try:
+        db.add(PromptTemplate(category="article", name="基准测试", content="写一篇关于[在此输入你的主题]的短文",
+                              is_default=True))
+        topic = Topic(topic_text="异步测试", status="draft")
+        db.add(topic)
+        db.flush()
+        titles = [Title(topic_id=topic.id, title_text=f"异步测试标题{i}", prompt_text="") for i in range(count)]
+        db.add_all(titles)
+        db.commit()
+        return [title.id for title in titles]
+    finally:
+        db.close()
+
+
+def _run_mode(mode: str, calls: int, coze_calls: int):
+    """在当前进程中执行一种配置，结果以 JSON 输出到标准输出"""
+    os.chdir(tempfile.mkdtemp(prefix="bench_async_clients_"))
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+
+    baseline = threading.active_count()
+    failures = []
+    result = {}
+    start = time.perf_counter()
+
+    if mode == "threads":
+        from utils.api import get_gemini_response
+
+        def call(i):
+            try:
+                get_gemini_response(f"prompt {i}")
+            except Exception as e:
+                failures.append(str(e)[:80])
+
+        with ThreadSampler() as sampler, ThreadPoolExecutor(max_workers=calls) as executor:
+            list(executor.map(call, range(calls)))
+
+    elif mode == "async":
+        from utils.api import async_get_gemini_response
+
+        async def main():
+            outcomes = await asyncio.gather(*(async_get_gemini_response(f"prompt {i}") for i in range(calls)),
+                                            return_exceptions=True)
+            failures.extend(str(o)[:80] for o in outcomes if isinstance(o, BaseException))
+
+        with ThreadSampler() as sampler:
+            asyncio.run(main())
+
+    elif mode == "batch":
+        from services.article_service import generate_articles_batch
+        title_ids = _seed_titles(calls)
+        start = time.perf_counter()
+        with ThreadSampler() as sampler:
+            outcomes = generate_articles_batch(title_ids, use_cache=False)
+        failures.extend(o['error'][:80] for o in outcomes if not o['success'])
+
+    elif mode == "coze":
+        from services.coze_service import async_call_coze_api
+
+        async def main():
+            outcomes = await asyncio.gather(*(async_call_coze_api(f"标题{i}", "<p>内容</p>") for i in range(coze_calls)),
+                                            return_exceptions=True)
+            for outcome in outcomes:
+                if isinstance(outcome, BaseException):
+                    failures.append(str(outcome)[:80])
+                elif len(outcome.get('stream_data', [])) != 3:
+                    failures.append(f"事件数不符: {outcome}")
+
+        with ThreadSampler() as sampler:
+            asyncio.run(main())
+
+    else:  # asgi
+        import requests
+        title_ids = _seed_titles(calls)
+        port = _free_port()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "asgi:application", "--port", str(port),
+                                   "--log-level", "warning"], cwd=os.getcwd(),
+                                  env=dict(os.environ, PYTHONPATH=ROOT))
+        sampler = ThreadSampler()
+        try:
+            for _ in range(100):
+                try:
+                    requests.get(f"http://127.0.0.1:{port}/api/limiter/stats", timeout=1)
+                    break
+                except requests.exceptions.ConnectionError:
+                    time.sleep(0.2)
+            start = time.perf_counter()
+            response = requests.post(f"http://127.0.0.1:{port}/api/articles/batch",
+                                     json={'title_ids': title_ids, 'use_cache': False}, timeout=60)
+            job_id = response.json()['data']['job_id']
+            while True:
+                job = requests.get(f"http://127.0.0.1:{port}/api/jobs/{job_id}?wait=5", timeout=10).json()['data']
+                if job['status'] in ("completed", "failed"):
+                    break
+            succeeded = [item for item in (job['result'] or {}).get('items', []) if item['success']]
+            if job['status'] != "completed" or len(succeeded) != calls:
+                failures.append(f"批量任务 {job['status']}，成功 {len(succeeded)}: {job['error']}")
+            result['server_threads'] = int(subprocess.run(["ps", "-o", "nlwp=", "-p", str(server.pid)],
+                                                          capture_output=True, text=True).stdout.strip() or 0)
+        finally:
+            server.terminate()
+            server.wait()
+
+    result.update({
+        'elapsed': time.perf_counter() - start,
+        'failures': len(failures),
+        'failure_samples': sorted(set(failures))[:3],
+        'baseline_threads': baseline,
+        'peak_threads': sampler.peak,
+    })
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步上游调用基准测试")
+    parser.add_argument("--calls", type=int, default=300, help="同时发起的 Gemini 调用数")
+    parser.add_argument("--latency", type=float, default=0.5, help="桩服务每个请求的处理时间（秒）")
+    parser.add_argument("--coze-calls", type=int, default=50, help="同时发起的 Coze 工作流调用数")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args.mode, args.calls, args.coze_calls)
+        return
+
+    from benchmarks.stub_gemini import StubGeminiServer
+    server = StubGeminiServer(latency=args.latency, stream_chunks=2, chunk_interval=args.latency / 2).start()
+    env = dict(os.environ, **{
+        "GEMINI_BASE_URL": server.base_url,
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench-api-key-0000000000"),
+        "COZE_API_URL": f"{server.base_url}/v1/workflow/stream_run",
+        "COZE_API_TOKEN": "bench-coze-token",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "GEMINI_CONCURRENCY_INITIAL": str(args.calls),
+        "GEMINI_CONCURRENCY_MAX": str(args.calls),
+        "ARTICLE_BATCH_CONCURRENCY": str(args.calls),
+        "HTTP_POOL_MAXSIZE": str(args.calls),
+        "ASYNC_HTTP_MAX_CONNECTIONS": str(args.calls),
+        "ASYNC_HTTP_ENABLED": "true",
+    })
+
+    print(f"{args.calls} 个并发 Gemini 调用，桩服务单次处理 {args.latency}s；{args.coze_calls} 个并发 Coze 工作流")
+    problems = []
+    for mode in MODES:
+        server.reset_counters()
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_async_clients", "--mode", mode, "--calls", str(args.calls),
+             "--coze-calls", str(args.coze_calls)],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            print(output.stderr[-2000:])
+            problems.append(f"{mode} 运行失败")
+            continue
+        r = json.loads(output.stdout.strip().splitlines()[-1])
+        threads = f"最大线程数={r['peak_threads']:4d}（初始 {r['baseline_threads']}）"
+        if 'server_threads' in r:
+            threads = f"服务进程线程数={r['server_threads']:4d}"
+        print(f"{mode:8s} 耗时={r['elapsed']:6.2f}s 上游请求={server.requests:4d} 上游最大并发={server.peak_active:4d} "
+              f"{threads} 失败={r['failures']} {r['failure_samples'] or ''}")
+
+        expected = args.coze_calls if mode == "coze" else args.calls
+        if r['failures']:
+            problems.append(f"{mode} 有 {r['failures']} 次调用失败")
+        if mode != "threads" and server.peak_active < expected * 0.8:
+            problems.append(f"{mode} 没有并发执行（上游最大并发 {server.peak_active}）")
+        if mode in ("async", "batch", "coze") and r['peak_threads'] - r['baseline_threads'] > 20:
+            problems.append(f"{mode} 线程数随并发增长（{r['baseline_threads']} -> {r['peak_threads']}）")
+        if mode == "asgi" and r['server_threads'] > expected / 2:
+            problems.append(f"asgi 服务进程线程数随并发增长（{r['server_threads']}）")
+    server.stop()
+
+    for problem in problems:
+        print(f"不符合预期: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
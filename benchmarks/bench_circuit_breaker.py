@@ -0,0 +1,182 @@
+"""
+上游熔断基准测试 / 回归检查
+
+用法: python -m benchmarks.bench_circuit_breaker [--calls 40] [--threads 8] [--timeout 1]
+
+本地桩服务同时充当 Gemini 中转服务和 Coze 工作流接口，依次模拟：
+1. Gemini 挂起（请求不返回）：--threads 个线程共调用 --calls 次 get_gemini_response，单次超时 --timeout 秒
+2. Gemini 恢复：冷却时间过后的探测请求应成功，熔断器恢复闭合
+3. Coze 返回 503：顺序调用 call_coze_api，之后恢复并探测
+对比关闭熔断（CIRCUIT_BREAKER_ENABLED=false）和开启熔断两种配置（各自在独立子进程中运行），
+输出各阶段耗时、上游实际收到的请求数和被熔断直接拒绝的次数。开启熔断时行为不符合预期则退出码非 0。
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FAILURE_THRESHOLD = 3
+RECOVERY_TIMEOUT = 1.5
+COZE_CALLS = 10
+
+MODES = {
+    "off": {"CIRCUIT_BREAKER_ENABLED": "false"},
+    "on": {"CIRCUIT_BREAKER_ENABLED": "true"},
+}
+
+
+def _run_mode(calls: int, threads: int, timeout: float):
+    """在当前进程中执行一种配置，结果以 JSON 输出到标准输出"""
+    from benchmarks.stub_gemini import StubGeminiServer
+
+    server = StubGeminiServer().start()
+    os.environ.update({
+        "GEMINI_BASE_URL": server.base_url,
+        "COZE_API_URL": f"{server.base_url}/v1/workflow/stream_run",
+        "COZE_API_TOKEN": "bench-coze-token",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "GEMINI_DEFAULT_TIMEOUT": str(timeout),
+        "COZE_READ_TIMEOUT": str(timeout),
+        "GEMINI_RETRY_MAX_ATTEMPTS": "1",
+        "GEMINI_CIRCUIT_FAILURE_THRESHOLD": str(FAILURE_THRESHOLD),
+        "GEMINI_CIRCUIT_RECOVERY_TIMEOUT": str(RECOVERY_TIMEOUT),
+        "COZE_CIRCUIT_FAILURE_THRESHOLD": str(FAILURE_THRESHOLD),
+        "COZE_CIRCUIT_RECOVERY_TIMEOUT": str(RECOVERY_TIMEOUT),
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+    from utils.api import get_gemini_response
+    from utils.circuit_breaker import CircuitOpenError, get_circuit_breaker
+    from services.coze_service import call_coze_api
+
+    def state(name):
+        breaker = get_circuit_breaker(name)
+        return breaker.state if breaker else None
+
+    def gemini_call(i):
+        try:
+            get_gemini_response(f"prompt {i}")
+            return "ok"
+        except CircuitOpenError:
+            return "rejected"
+        except Exception:
+            return "failed"
+
+    result = {}
+
+    # 1. Gemini 挂起
+    server.hang = True
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(gemini_call, range(calls)))
+    result['gemini_down'] = {
+        'elapsed': time.perf_counter() - start,
+        'server_requests': server.requests,
+        'failed': outcomes.count("failed"),
+        'rejected': outcomes.count("rejected"),
+        'state': state("gemini"),
+    }
+
+    # 2. Gemini 恢复
+    server.hang = False
+    time.sleep(RECOVERY_TIMEOUT + 0.1)
+    result['gemini_recovered'] = {'probe': gemini_call(-1), 'state': state("gemini")}
+
+    # 3. Coze 返回 503，之后恢复
+    server.reset_counters()
+    server.fail_rate = 1.0
+    coze_outcomes = []
+    start = time.perf_counter()
+    for i in range(COZE_CALLS):
+        try:
+            call_coze_api(f"标题 {i}", "<p>内容</p>")
+            coze_outcomes.append("ok")
+        except CircuitOpenError:
+            coze_outcomes.append("rejected")
+        except Exception:
+            coze_outcomes.append("failed")
+    result['coze_down'] = {
+        'elapsed': time.perf_counter() - start,
+        'server_requests': server.requests,
+        'failed': coze_outcomes.count("failed"),
+        'rejected': coze_outcomes.count("rejected"),
+        'state': state("coze"),
+    }
+    server.fail_rate = 0.0
+    time.sleep(RECOVERY_TIMEOUT + 0.1)
+    try:
+        call_coze_api("标题", "<p>内容</p>")
+        probe = "ok"
+    except Exception:
+        probe = "failed"
+    result['coze_recovered'] = {'probe': probe, 'state': state("coze")}
+
+    print(json.dumps(result, ensure_ascii=False))
+    server.stop()
+
+
+def _check(r, threads: int):
+    """开启熔断时的预期行为，返回不符合预期的描述列表"""
+    problems = []
+    down = r['gemini_down']
+    # 熔断前最多有 阈值 + 线程数 个请求已经发出
+    if down['server_requests'] > FAILURE_THRESHOLD + threads:
+        problems.append(f"Gemini 熔断后仍有请求发往上游（{down['server_requests']} 次）")
+    if down['rejected'] == 0 or down['state'] != "open":
+        problems.append("Gemini 挂起时没有熔断")
+    if r['gemini_recovered'] != {'probe': "ok", 'state': "closed"}:
+        problems.append(f"Gemini 恢复后熔断器未闭合: {r['gemini_recovered']}")
+    coze = r['coze_down']
+    if coze['server_requests'] != FAILURE_THRESHOLD or coze['rejected'] != COZE_CALLS - FAILURE_THRESHOLD:
+        problems.append(f"Coze 熔断不符合预期: {coze}")
+    if r['coze_recovered'] != {'probe': "ok", 'state': "closed"}:
+        problems.append(f"Coze 恢复后熔断器未闭合: {r['coze_recovered']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游熔断基准测试")
+    parser.add_argument("--calls", type=int, default=40, help="Gemini 挂起期间的调用次数")
+    parser.add_argument("--threads", type=int, default=8, help="同时发起调用的线程数")
+    parser.add_argument("--timeout", type=float, default=1.0, help="单次请求超时（秒，模拟 60s/600s 的缩短版）")
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args.calls, args.threads, args.timeout)
+        return
+
+    print(f"Gemini 挂起期间调用 {args.calls} 次（{args.threads} 个线程），单次超时 {args.timeout}s；"
+          f"熔断阈值 {FAILURE_THRESHOLD} 次，冷却 {RECOVERY_TIMEOUT}s")
+    problems = []
+    for mode, env in MODES.items():
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_circuit_breaker", "--mode", mode, "--calls", str(args.calls),
+             "--threads", str(args.threads), "--timeout", str(args.timeout)],
+            cwd=ROOT, env=dict(os.environ, **env), capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        for phase in ('gemini_down', 'coze_down'):
+            p = r[phase]
+            print(f"熔断{mode:3s} {phase:11s} 耗时={p['elapsed']:6.2f}s 上游请求={p['server_requests']:3d} "
+                  f"超时/失败={p['failed']:3d} 熔断拒绝={p['rejected']:3d} 状态={p['state']}")
+        print(f"熔断{mode:3s} 恢复探测: gemini={r['gemini_recovered']} coze={r['coze_recovered']}")
+        if mode == "on":
+            problems = _check(r, args.threads)
+
+    for problem in problems:
+        print(f"不符合预期: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
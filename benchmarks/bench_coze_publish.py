@@ -0,0 +1,153 @@
+"""
+Coze 异步发布基准测试 / 回归检查
+
+用法: python -m benchmarks.bench_coze_publish [--events 10] [--interval 0.2] [--publishes 4] [--accounts 12]
+
+在临时目录中创建 SQLite 数据库并写入带 HTML 的标题，本地桩服务模拟 Coze stream_run
+（每隔 --interval 秒返回一个工作流事件）。同时为 --publishes 个标题调用 POST /api/titles/<id>/coze，统计：
+- 接口返回耗时（应与工作流耗时无关）
+- 发布过程中 /api/publishes/<id> 观察到的事件进度（边接收边记录，而不是结束后一次写入）
+- 发布结束后的状态和事件数
+之后调用 POST /api/titles/<id>/coze/fanout 把同一篇文章发布到 --accounts 个公众号（另加一个不存在的配置），统计：
+- 总耗时（按 COZE_PUBLISH_CONCURRENCY 并发，约为 账号数 / 并发数 个工作流耗时）
+- 查询微信配置的 SQL 条数（应为 1）
+- 汇总报告中成功/失败的公众号数
+接口耗时超过工作流耗时的一半、进度没有逐步增长、发布未成功、汇总报告不符或配置查询不止一条时以非零状态退出。
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coze 异步发布基准测试")
+    parser.add_argument("--events", type=int, default=10, help="桩服务返回的工作流 Message 事件数")
+    parser.add_argument("--interval", type=float, default=0.2, help="相邻事件的间隔（秒）")
+    parser.add_argument("--publishes", type=int, default=4, help="同时发布的标题数")
+    parser.add_argument("--accounts", type=int, default=12, help="多公众号发布的微信配置数")
+    args = parser.parse_args()
+
+    from benchmarks.stub_gemini import StubGeminiServer
+    server = StubGeminiServer(stream_chunks=args.events, chunk_interval=args.interval).start()
+    os.environ["COZE_API_URL"] = f"{server.base_url}/v1/workflow/stream_run"
+    os.environ["COZE_API_TOKEN"] = "bench-coze-token"
+    os.environ["JOB_WORKERS"] = str(max(4, args.publishes))
+
+    workdir = tempfile.mkdtemp(prefix="bench_coze_publish_")
+    os.chdir(workdir)
+
+    from utils.logger import logger
+    logger.setLevel(logging.WARNING)
+    from sqlalchemy import event
+    from config import COZE_PUBLISH_CONCURRENCY
+    from database import engine, get_db_session
+    from models import Topic, Title, Article, HTMLOutput, Config
+    import app as app_module
+
+    db = get_db_session()
+    try:
+        topic = Topic(topic_text="发布测试", status="draft")
+        db.add(topic)
+        db.flush()
+        title_ids = []
+        for i in range(args.publishes):
+            title = Title(topic_id=topic.id, title_text=f"发布测试标题{i}", prompt_text="")
+            db.add(title)
+            db.flush()
+            article = Article(title_id=title.id, article_text="短文内容" * 50, prompt_text="")
+            db.add(article)
+            db.flush()
+            db.add(HTMLOutput(article_id=article.id, html_content="<p>HTML内容</p>" * 50, prompt_text=""))
+            title_ids.append(title.id)
+        for i in range(args.accounts):
+            db.add(Config(name=f"公众号{i}", key="WECHAT_APP_ID", value=f"wx-app-{i:04d}"))
+            db.add(Config(name=f"公众号{i}", key="WECHAT_APP_SECRET", value=f"wx-secret-{i:04d}"))
+        db.commit()
+    finally:
+        db.close()
+
+    client = app_module.app.test_client()
+    workflow_seconds = (args.events + 1) * args.interval
+    print(f"{args.publishes} 个标题同时发布；桩工作流 {args.events + 1} 个事件，间隔 {args.interval}s（约 {workflow_seconds:.1f}s）")
+
+    publish_ids = []
+    response_times = []
+    for title_id in title_ids:
+        start = time.perf_counter()
+        response = client.post(f"/api/titles/{title_id}/coze", json={})
+        response_times.append(time.perf_counter() - start)
+        assert response.status_code == 202, response.get_json()
+        publish_ids.append(response.get_json()['data']['publish_id'])
+    print(f"POST /api/titles/<id>/coze 返回耗时: 最大 {max(response_times) * 1000:.1f}ms")
+
+    # 轮询进度，记录每个发布观察到的不同事件数
+    observed = {publish_id: set() for publish_id in publish_ids}
+    records = {}
+    start = time.perf_counter()
+    while time.perf_counter() - start < workflow_seconds * 3 + 10:
+        for publish_id in publish_ids:
+            records[publish_id] = client.get(f"/api/publishes/{publish_id}").get_json()['data']
+            observed[publish_id].add(records[publish_id]['event_count'])
+        if all(r['status'] in ("completed", "failed") for r in records.values()):
+            break
+        time.sleep(args.interval / 4)
+    elapsed = time.perf_counter() - start
+
+    problems = []
+    if max(response_times) > workflow_seconds / 2:
+        problems.append("接口返回耗时与工作流耗时相当，发布没有在后台执行")
+    for publish_id, record in records.items():
+        progress = sorted(observed[publish_id])
+        print(f"publish_id={publish_id} 状态={record['status']} 事件数={record['event_count']} "
+              f"轮询观察到的进度={progress} 最近事件={record['last_event'] and record['last_event']['event']}")
+        if record['status'] != "completed":
+            problems.append(f"publish_id={publish_id} 未成功: {record['error']}")
+        elif record['event_count'] != args.events + 1 or len(record['result']['stream_data']) != args.events + 1:
+            problems.append(f"publish_id={publish_id} 事件数不符: {record['event_count']}")
+        if len([n for n in progress if 0 < n < args.events + 1]) < 2:
+            problems.append(f"publish_id={publish_id} 进度没有逐步更新")
+    print(f"全部发布完成耗时: {elapsed:.2f}s")
+
+    # 多公众号发布
+    config_queries = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, sql, *a: config_queries.append(sql) if "FROM configs" in sql else None)
+    names = [f"公众号{i}" for i in range(args.accounts)] + ["不存在的公众号"]
+    start = time.perf_counter()
+    response = client.post(f"/api/titles/{title_ids[0]}/coze/fanout", json={'wechat_config_names': names})
+    assert response.status_code == 202, response.get_json()
+    job_id = response.get_json()['data']['job_id']
+    while True:
+        job = client.get(f"/api/jobs/{job_id}?wait=5").get_json()['data']
+        if job['status'] in ("completed", "failed"):
+            break
+    elapsed = time.perf_counter() - start
+    report = client.get(f"/api/publishes?job_id={job_id}").get_json()['data']
+    waves = -(-args.accounts // COZE_PUBLISH_CONCURRENCY)
+    print(f"多公众号发布: {len(names)} 个配置，并发 {COZE_PUBLISH_CONCURRENCY}，耗时 {elapsed:.2f}s"
+          f"（顺序执行约 {args.accounts * workflow_seconds:.1f}s，预期约 {waves * workflow_seconds:.1f}s）；"
+          f"查询微信配置 SQL {len(config_queries)} 条；成功 {report['succeeded']}，失败 {report['failed']}")
+    for item in report['items']:
+        if item['status'] != "completed":
+            print(f"  {item['wechat_config_name']}: {item['status']} {item['error']}")
+    if job['status'] != "completed" or report['succeeded'] != args.accounts or report['failed'] != 1:
+        problems.append(f"多公众号发布汇总不符: 任务 {job['status']}，成功 {report['succeeded']}，失败 {report['failed']}")
+    if len(config_queries) != 1:
+        problems.append(f"多公众号发布查询微信配置 {len(config_queries)} 次")
+    if elapsed > args.accounts * workflow_seconds * 0.75:
+        problems.append("多公众号发布没有并发执行")
+    server.stop()
+
+    for problem in problems:
+        print(f"不符合预期: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+SQLite 并发读写压力测试
+
+用法: python -m benchmarks.bench_db_concurrency [--writers 8] [--writes 50] [--readers 4]
+
+多个线程并发保存短文（模拟后台生成任务同时完成），同时多个线程不断请求列表接口，
+统计保存失败次数（database is locked 等）和列表接口的延迟分布。
+分别以两种配置在独立子进程中运行：
+- legacy：与原默认配置一致，回滚日志（DELETE）、synchronous=FULL、sqlite3 默认 5 秒锁等待、各线程直接提交
+- tuned：当前默认配置（WAL、synchronous=NORMAL、busy_timeout、单写线程提交）
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LEGACY_ENV = {
+    "SQLITE_JOURNAL_MODE": "DELETE",
+    "SQLITE_SYNCHRONOUS": "FULL",
+    "SQLITE_BUSY_TIMEOUT_MS": "5000",  # 与 sqlite3 模块默认的 timeout=5 秒一致
+}
+
+
+def _percentile(values, p):
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _run_mode(mode: str, writers: int, writes: int, readers: int):
+    """在当前进程中执行一种配置的压力测试，结果以 JSON 输出到标准输出"""
+    os.chdir(tempfile.mkdtemp(prefix=f"bench_db_{mode}_"))
+
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+    from database import init_db, get_db_session
+    from models import Topic, Title, Article, HTMLOutput
+    from services.article_service import save_article_to_db
+    from benchmarks.bench_list_queries import _seed
+    import app as app_module
+
+    init_db()
+    db = get_db_session()
+    try:
+        _seed(db, (Topic, Title, Article, HTMLOutput), 500, 2)
+        title_ids = [tid for (tid,) in db.query(Title.id).all()]
+    finally:
+        db.close()
+
+    def legacy_save(title_id, article_text):
+        """旧版保存方式：调用方线程直接提交"""
+        session = get_db_session()
+        try:
+            article = Article(title_id=title_id, article_text=article_text, prompt_text="p", selected=False)
+            session.add(article)
+            session.commit()
+            return article.id
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    save = legacy_save if mode == "legacy" else (lambda tid, text: save_article_to_db(tid, text, "p"))
+    article_text = "并发写入测试内容。" * 400
+
+    write_errors = []
+    read_errors = []
+    read_latencies = []
+    stop = threading.Event()
+
+    def writer(index):
+        for i in range(writes):
+            try:
+                save(title_ids[(index * writes + i) % len(title_ids)], article_text)
+            except Exception as e:
+                write_errors.append(str(e).splitlines()[0])
+
+    def reader():
+        client = app_module.app.test_client()
+        while not stop.is_set():
+            for url in ("/api/articles?fields=id,title_text,preview&limit=50", "/api/topics?limit=50"):
+                start = time.perf_counter()
+                response = client.get(url)
+                read_latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    read_errors.append(response.get_json().get('error', ''))
+
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in reader_threads:
+        t.start()
+    start = time.perf_counter()
+    for t in writer_threads:
+        t.start()
+    for t in writer_threads:
+        t.join()
+    write_elapsed = time.perf_counter() - start
+    stop.set()
+    for t in reader_threads:
+        t.join()
+
+    print(json.dumps({
+        'writes': writers * writes,
+        'write_errors': len(write_errors),
+        'write_error_sample': write_errors[:1],
+        'write_elapsed': write_elapsed,
+        'reads': len(read_latencies),
+        'read_errors': len(read_errors),
+        'read_p50': _percentile(read_latencies, 0.5),
+        'read_p95': _percentile(read_latencies, 0.95),
+        'read_max': max(read_latencies) if read_latencies else 0.0,
+    }, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 并发读写压力测试")
+    parser.add_argument("--writers", type=int, default=8, help="并发保存线程数")
+    parser.add_argument("--writes", type=int, default=50, help="每个线程保存的短文数")
+    parser.add_argument("--readers", type=int, default=4, help="并发读取列表接口的线程数")
+    parser.add_argument("--mode", choices=["legacy", "tuned"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args.mode, args.writers, args.writes, args.readers)
+        return
+
+    for mode in ("legacy", "tuned"):
+        env = dict(os.environ, **(LEGACY_ENV if mode == "legacy" else {}))
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_db_concurrency", "--mode", mode,
+             "--writers", str(args.writers), "--writes", str(args.writes), "--readers", str(args.readers)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:6s} 保存 {r['writes']} 次 失败={r['write_errors']:4d} 耗时={r['write_elapsed']:6.2f}s | "
+              f"列表请求 {r['reads']:5d} 次 失败={r['read_errors']:4d} "
+              f"p50={r['read_p50'] * 1000:7.1f}ms p95={r['read_p95'] * 1000:7.1f}ms max={r['read_max'] * 1000:7.1f}ms")
+        if r['write_error_sample']:
+            print(f"       保存错误示例: {r['write_error_sample'][0]}")
+
+
+if __name__ == "__main__":
+    main()
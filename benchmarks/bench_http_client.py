@@ -0,0 +1,81 @@
+"""
+HTTP 客户端基准测试：原始的逐次 requests.post vs 共享连接池
+
+用法: python -m benchmarks.bench_http_client [--calls 200] [--concurrency 8] [--reject-header-auth]
+
+在本地启动 Gemini 桩服务，分别用旧实现（每次新建连接，401 时再走一次 ?key= 重试）
+和 utils.api.get_gemini_response（连接池 + 记住鉴权方式）发起相同数量的请求，
+输出耗时、服务端接受的 TCP 连接数和请求数。
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_gemini import StubGeminiServer
+
+
+def legacy_call(base_url: str, model: str, api_key: str, prompt: str) -> str:
+    """旧实现：每次裸调用 requests.post，401 时用 URL 参数重试"""
+    import requests
+    url = f"{base_url}/v1beta/models/{model}:generateContent"
+    headers = {"Content-Type": "application/json"}
+    payload = {"contents": [{"parts": [{"text": prompt}]}],
+               "generationConfig": {"temperature": 0.7, "maxOutputTokens": 4096}}
+    response = requests.post(url, headers={**headers, "X-Goog-Api-Key": api_key}, json=payload, timeout=60)
+    if response.status_code == 401:
+        response = requests.post(url, headers=headers, json=payload, params={"key": api_key}, timeout=60)
+    response.raise_for_status()
+    return response.json()['candidates'][0]['content']['parts'][0]['text']
+
+
+def run(name: str, func, server: StubGeminiServer, calls: int, concurrency: int):
+    """执行一轮测试并打印结果"""
+    server.reset_counters()
+    start = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(calls):
+            func(f"prompt {i}")
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(func, [f"prompt {i}" for i in range(calls)]))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} 并发={concurrency:<3} 耗时={elapsed * 1000:8.1f}ms  "
+          f"平均={elapsed * 1000 / calls:6.2f}ms/次  连接数={server.connections:<5} 请求数={server.requests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 客户端基准测试")
+    parser.add_argument("--calls", type=int, default=200, help="每轮请求次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发线程数")
+    parser.add_argument("--reject-header-auth", action="store_true", help="桩服务拒绝 header 鉴权（模拟只支持 ?key= 的中转）")
+    args = parser.parse_args()
+
+    server = StubGeminiServer(reject_header_auth=args.reject_header_auth).start()
+    os.environ["GEMINI_BASE_URL"] = server.base_url
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"  # 每次都实际请求桩服务
+
+    # 必须在设置环境变量之后导入
+    from config import MODEL_NAME
+    from utils.api import get_gemini_response
+    from utils.logger import logger
+    logger.setLevel(logging.WARNING)
+
+    api_key = os.environ["GEMINI_API_KEY"]
+    print(f"桩服务: {server.base_url}  请求数/轮: {args.calls}  拒绝header鉴权: {args.reject_header_auth}")
+    try:
+        for concurrency in (1, args.concurrency):
+            run("旧实现 requests.post", lambda p: legacy_call(server.base_url, MODEL_NAME, api_key, p),
+                server, args.calls, concurrency)
+            run("连接池 get_gemini_response", get_gemini_response, server, args.calls, concurrency)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
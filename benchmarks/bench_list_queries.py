@@ -0,0 +1,112 @@
+"""
+列表查询 SQL 条数回归检查
+
+用法: python -m benchmarks.bench_list_queries [--topics 1000] [--titles-per-topic 3]
+
+在临时目录中创建 SQLite 数据库并写入大量主题/标题/短文/HTML，
+统计 /api/topics、/api/articles、/api/html 以及 CLI 的 list_topics/view_articles/view_html_outputs
+各执行了多少条 SQL。分别在少量数据和大量数据上运行，条数不一致（随行数增长）时以非零状态退出。
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 最多允许的 SQL 条数（与数据量无关）
+MAX_STATEMENTS = 3
+
+
+def _seed(db, models, topics: int, titles_per_topic: int):
+    """写入测试数据：每个标题一篇短文、每篇短文一个HTML；每 10 个主题留一个没有标题的主题"""
+    Topic, Title, Article, HTMLOutput = models
+    topic_rows = [Topic(topic_text=f"主题{i}", status="draft") for i in range(topics)]
+    db.add_all(topic_rows)
+    db.flush()
+    title_rows = [
+        Title(topic_id=t.id, title_text=f"{t.topic_text}-标题{j}", prompt_text="p")
+        for i, t in enumerate(topic_rows) if i % 10 != 0
+        for j in range(titles_per_topic)
+    ]
+    db.add_all(title_rows)
+    db.flush()
+    article_rows = [Article(title_id=t.id, article_text="短文内容" * 20, prompt_text="p") for t in title_rows]
+    db.add_all(article_rows)
+    db.flush()
+    db.add_all([HTMLOutput(article_id=a.id, html_content="<p>html</p>" * 20, prompt_text="p") for a in article_rows])
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表查询 SQL 条数回归检查")
+    parser.add_argument("--topics", type=int, default=1000, help="大数据量时的主题数")
+    parser.add_argument("--titles-per-topic", type=int, default=3, help="每个主题的标题数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_list_queries_")
+    os.chdir(workdir)
+
+    from sqlalchemy import event
+    from utils.logger import logger
+    logger.setLevel(logging.WARNING)
+    from database import engine, get_db_session
+    from models import Topic, Title, Article, HTMLOutput
+    import app as app_module
+    import cli
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, sql, *a: statements.append(sql))
+
+    client = app_module.app.test_client()
+    checks = [
+        ("GET /api/topics", lambda: client.get("/api/topics")),
+        ("GET /api/articles", lambda: client.get("/api/articles")),
+        ("GET /api/html", lambda: client.get("/api/html")),
+        ("cli.list_topics", cli.list_topics),
+        ("cli.view_articles", cli.view_articles),
+        ("cli.view_html_outputs", cli.view_html_outputs),
+    ]
+
+    def measure():
+        counts = {}
+        for name, func in checks:
+            statements.clear()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+            counts[name] = (len(statements), time.perf_counter() - start)
+        return counts
+
+    failed = False
+    baseline = None
+    for topics in (10, args.topics):
+        db = get_db_session()
+        try:
+            _seed(db, (Topic, Title, Article, HTMLOutput), topics - (10 if baseline else 0), args.titles_per_topic)
+            total_titles = db.query(Title).count()
+        finally:
+            db.close()
+
+        counts = measure()
+        print(f"主题数={topics} 标题/短文/HTML 数={total_titles}")
+        for name, (count, elapsed) in counts.items():
+            print(f"  {name:24s} SQL={count:3d}  耗时={elapsed * 1000:8.1f}ms")
+            if count > MAX_STATEMENTS:
+                print(f"  ❌ {name} 执行了 {count} 条 SQL，超过上限 {MAX_STATEMENTS}")
+                failed = True
+            if baseline and count != baseline[name][0]:
+                print(f"  ❌ {name} 的 SQL 条数随数据量变化: {baseline[name][0]} -> {count}")
+                failed = True
+        baseline = counts
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+日志写入基准测试
+
+用法: python -m benchmarks.bench_logging [--records 2000] [--threads 4] [--payload-kb 200]
+
+--threads 个线程共写 --records 条日志，每条消息包含 --payload-kb KB 的 HTML（与原 call_coze_api 记录完整请求体相同），
+对比两种配置下调用方线程的平均/最大耗时和日志文件大小：
+- sync：原配置，FileHandler 在调用方线程中同步写盘，消息不截断
+- queue：utils/logger.py 的配置，调用方只把截断后的记录放入队列，由后台线程写盘
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _run(name: str, handler: logging.Handler, records: int, threads: int, payload: str):
+    bench_logger = logging.getLogger(f"bench_logging.{name}")
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.addHandler(handler)
+    per_thread = records // threads
+
+    def work(i):
+        latencies = []
+        for n in range(per_thread):
+            start = time.perf_counter()
+            bench_logger.info(f"完整请求体: {payload} #{i}-{n}")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = [latency for result in executor.map(work, range(threads)) for latency in result]
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--payload-kb", type=int, default=200)
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix="bench_logging_")
+    os.environ["LOG_DIR"] = log_dir
+    from utils.logger import _QueueHandler, TEXT_FORMAT, DATE_FORMAT
+
+    payload = "<p>" + "正文内容" * (args.payload_kb * 1024 // 12) + "</p>"
+    formatter = logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+
+    sync_file = os.path.join(log_dir, "sync.log")
+    sync_handler = logging.FileHandler(sync_file, encoding="utf-8")
+    sync_handler.setFormatter(formatter)
+    sync_elapsed, sync_latencies = _run("sync", sync_handler, args.records, args.threads, payload)
+    sync_handler.close()
+
+    queue_file = os.path.join(log_dir, "queue.log")
+    file_handler = logging.handlers.RotatingFileHandler(queue_file, maxBytes=50 * 1024 * 1024, backupCount=1,
+                                                        encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    log_queue = queue.Queue(maxsize=10000)
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    queue_elapsed, queue_latencies = _run("queue", _QueueHandler(log_queue), args.records, args.threads, payload)
+    listener.stop()
+    file_handler.close()
+
+    print(f"{args.records} 条日志，{args.threads} 线程，每条约 {args.payload_kb} KB")
+    for name, elapsed, latencies, path in (("sync", sync_elapsed, sync_latencies, sync_file),
+                                           ("queue", queue_elapsed, queue_latencies, queue_file)):
+        latencies.sort()
+        print(f"  {name:6s} 总耗时 {elapsed:.2f}s, 调用方平均 {sum(latencies) / len(latencies) * 1e3:.3f}ms, "
+              f"P99 {latencies[int(len(latencies) * 0.99)] * 1e3:.3f}ms, 最大 {latencies[-1] * 1e3:.3f}ms, "
+              f"日志文件 {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+指标开销基准测试 / 回归检查
+
+用法: python -m benchmarks.bench_metrics [--observations 200000] [--threads 8] [--calls 50]
+
+1. 热路径开销：--threads 个线程同时调用 Histogram.observe / Counter.inc 共 --observations 次，输出每次记录的平均耗时
+2. 端到端：本地桩服务充当 Gemini 和 Coze，调用 --calls 次 get_gemini_response（标题/短文/HTML 三类）和一次 call_coze_api，
+   再通过 Flask 测试客户端请求 /metrics，检查各直方图的次数和 token 计数与实际调用一致。
+检查不通过时退出码非 0。
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STAGES = ("title", "article", "html")
+
+
+def _overhead(observations: int, threads: int) -> float:
+    """每次 observe + inc 的平均耗时（微秒）"""
+    from utils.metrics import Counter, Histogram
+
+    histogram = Histogram("bench_seconds", "bench", ("stage", "model"))
+    counter = Counter("bench_total", "bench", ("stage", "model", "outcome"))
+    per_thread = observations // threads
+
+    def work(i):
+        stage = STAGES[i % len(STAGES)]
+        for n in range(per_thread):
+            histogram.observe(n * 1e-4, stage, "bench-model")
+            counter.inc(stage, "bench-model", "success")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(work, range(threads)))
+    elapsed = time.perf_counter() - start
+    assert sum(histogram.count(stage, "bench-model") for stage in STAGES) == per_thread * threads
+    return elapsed / (per_thread * threads) * 1e6
+
+
+def _sample(text: str, name: str) -> float:
+    """从 Prometheus 文本中取出指定样本的值（所有匹配行求和）"""
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith(name + "{") or line.startswith(name + " "):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--observations", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    from benchmarks.stub_gemini import StubGeminiServer
+
+    server = StubGeminiServer(stream_chunks=3).start()
+    data_dir = tempfile.mkdtemp(prefix="bench_metrics_")
+    os.environ.update({
+        "GEMINI_BASE_URL": server.base_url,
+        "COZE_API_URL": f"{server.base_url}/v1/workflow/stream_run",
+        "COZE_API_TOKEN": "bench-coze-token",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        "METRICS_ENABLED": "true",
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+    logging.getLogger("werkzeug").setLevel(logging.CRITICAL)
+
+    per_call_us = _overhead(args.observations, args.threads)
+    print(f"热路径开销: {per_call_us:.2f} us / 次（observe + inc，{args.threads} 线程）")
+
+    from utils.api import get_gemini_response
+    from services.coze_service import call_coze_api
+    from app import app
+
+    start = time.perf_counter()
+    for i in range(args.calls):
+        get_gemini_response(f"prompt {i}", stage=STAGES[i % len(STAGES)])
+    call_coze_api("标题", "<p>内容</p>")
+    print(f"上游调用: {args.calls} 次 Gemini + 1 次 Coze，耗时 {time.perf_counter() - start:.2f}s")
+
+    client = app.test_client()
+    client.get("/api/cache/stats").close()  # 响应关闭时记录 HTTP 指标
+    body = client.get("/metrics").get_data(as_text=True)
+    server.stop()
+
+    checks = {
+        "gemini_request_duration_seconds_count": args.calls,
+        "gemini_requests_total": args.calls,
+        "coze_request_duration_seconds_count": 1,
+        "coze_requests_total": 1,
+    }
+    failures = []
+    for name, expected in checks.items():
+        actual = _sample(body, name)
+        print(f"  {name} = {actual:g}（期望 {expected}）")
+        if actual != expected:
+            failures.append(name)
+    for name in ("gemini_prompt_tokens_total", "gemini_output_tokens_total"):
+        actual = _sample(body, name)
+        print(f"  {name} = {actual:g}")
+        if actual <= 0:
+            failures.append(name)
+    if 'http_requests_total{method="GET",route="/api/cache/stats",status="200"} 1' not in body:
+        failures.append("http_requests_total")
+
+    if failures:
+        print(f"检查失败: {', '.join(failures)}")
+        sys.exit(1)
+    print("检查通过")
+
+
+if __name__ == "__main__":
+    main()
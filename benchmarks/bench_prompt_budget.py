@@ -0,0 +1,131 @@
+"""
+提示词 token 预算 / 截断续写 回归检查
+
+用法: python -m benchmarks.bench_prompt_budget [--output-chars 6000] [--max-tokens 2500] [--article-chars 60000]
+
+本地桩服务按请求的 maxOutputTokens 截断输出（1 个字符计 1 个 token），对比：
+1. 截断续写：期望输出 --output-chars 字符、maxOutputTokens 为 --max-tokens 时，
+   不续写（GEMINI_MAX_CONTINUATIONS=0，原行为）与自动续写分别返回的长度（非流式、流式和协程版本）
+2. 长文HTML：--article-chars 字符的短文，原做法（整篇一次请求、maxOutputTokens=4096）的提示词/输出 token 与预算，
+   以及 generate_html 分段后的请求数、每个请求的提示词 + maxOutputTokens 是否都在 PROMPT_TOKEN_BUDGET 内、拼接的段数
+3. 提示词超出预算时 output_token_budget 抛出 PromptTooLargeError，不发出请求
+检查不通过时退出码非 0。
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _article(chars: int) -> str:
+    """约 chars 个字符的多段短文"""
+    paragraph = "清晨的地铁里，每个人都低头看着手机，像是在等待一封迟迟不来的回信。" * 4
+    return "\n".join([paragraph] * max(1, chars // len(paragraph)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-chars", type=int, default=6000)
+    parser.add_argument("--max-tokens", type=int, default=2500)
+    parser.add_argument("--article-chars", type=int, default=60000)
+    args = parser.parse_args()
+
+    from benchmarks.stub_gemini import StubGeminiServer
+
+    expected_text = "".join(f"第{i}句续写测试内容。" for i in range(args.output_chars))[:args.output_chars]
+    server = StubGeminiServer(response_text=expected_text, stream_chunks=4, honor_max_tokens=True).start()
+    data_dir = tempfile.mkdtemp(prefix="bench_prompt_budget_")
+    os.environ.update({
+        "GEMINI_BASE_URL": server.base_url,
+        "RESPONSE_CACHE_ENABLED": "false",
+        "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        "GEMINI_MAX_CONTINUATIONS": "2",
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+
+    from database import init_db
+    init_db()
+
+    import utils.api as api
+    from config import PROMPT_TOKEN_BUDGET, HTML_MAX_TOKENS
+    from services.html_service import build_html_prompt, generate_html, async_generate_html, plan_html_requests
+    from utils.async_runtime import run_async
+    from utils.http_client import async_http_available
+    from utils.prompt_budget import PromptTooLargeError, count_tokens, output_token_budget
+
+    failures = []
+
+    # 1. 截断续写
+    print(f"截断续写（期望输出 {len(expected_text)} 字符，maxOutputTokens={args.max_tokens}）")
+    for continuations in (0, 2):
+        api.GEMINI_MAX_CONTINUATIONS = continuations
+        server.reset_counters()
+        content = api.get_gemini_response("续写测试", max_tokens=args.max_tokens, use_cache=False, stage="article")
+        streamed = "".join(api.stream_gemini_response("续写测试", max_tokens=args.max_tokens, use_cache=False,
+                                                      stage="article"))
+        results = [content, streamed]
+        if async_http_available():
+            results.append(run_async(api.async_get_gemini_response("续写测试", max_tokens=args.max_tokens,
+                                                                   use_cache=False, stage="article")))
+        label = "不续写" if continuations == 0 else f"续写（最多 {continuations} 次）"
+        print(f"  {label:12s} 非流式/流式/协程 {' / '.join(str(len(r)) for r in results)} 字符, "
+              f"上游请求 {server.requests} 次")
+        if continuations and any(r != expected_text for r in results):
+            failures.append("续写后内容不完整")
+
+    # 2. 长文HTML分段
+    server.response_text = "<section><p>段落</p></section>"
+    article = _article(args.article_chars)
+    whole_prompt, _ = build_html_prompt(article)
+    whole_tokens = count_tokens(whole_prompt)
+    print(f"长文HTML（短文 {len(article)} 字符，估算 {count_tokens(article)} token，预算 {PROMPT_TOKEN_BUDGET} token/次）")
+    print(f"  原做法: 1 次请求，提示词 {whole_tokens} token + maxOutputTokens {HTML_MAX_TOKENS}"
+          f" = {whole_tokens + HTML_MAX_TOKENS} token")
+
+    html_requests, _, _ = plan_html_requests(article)
+    server.reset_counters()
+    html_content, saved_prompt, _ = generate_html(article, use_cache=False)
+    sent = list(server.generation_requests)
+    worst = max(prompt_tokens + limit for prompt_tokens, limit, _ in sent)
+    sections = html_content.count("<section>")
+    print(f"  分段后: {len(sent)} 次请求，单次最多 {worst} token（提示词 + maxOutputTokens），拼接 {sections} 段")
+    if len(sent) != len(html_requests) or len(sent) < 2:
+        failures.append(f"分段请求数 {len(sent)}")
+    if worst > PROMPT_TOKEN_BUDGET:
+        failures.append(f"单次请求 {worst} token 超出预算")
+    if sections != len(html_requests):
+        failures.append(f"拼接段数 {sections}")
+    if saved_prompt != whole_prompt:
+        failures.append("保存的提示词不是整篇短文的提示词")
+    if async_http_available():
+        async_content, _, _ = run_async(async_generate_html(article, use_cache=False))
+        print(f"  协程版本拼接 {async_content.count('<section>')} 段")
+        if async_content != html_content:
+            failures.append("协程版本结果与同步版本不一致")
+
+    # 3. 超出预算的提示词不发出请求
+    server.reset_counters()
+    try:
+        output_token_budget("超长提示词" * PROMPT_TOKEN_BUDGET, 8192)
+        failures.append("超长提示词未被拒绝")
+    except PromptTooLargeError as e:
+        print(f"超长提示词: {e}")
+    if server.requests:
+        failures.append("超长提示词仍发出了请求")
+    server.stop()
+
+    if failures:
+        print(f"检查失败: {'; '.join(failures)}")
+        sys.exit(1)
+    print("检查通过")
+
+
+if __name__ == "__main__":
+    main()
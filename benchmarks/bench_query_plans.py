@@ -0,0 +1,85 @@
+"""
+索引迁移前后的查询计划与耗时对比
+
+用法: python -m benchmarks.bench_query_plans [--topics 2000] [--titles-per-topic 3] [--repeat 200]
+
+在临时目录中建库并写入测试数据，删除复合索引模拟旧版 data/articles.db，
+输出典型查询的 EXPLAIN QUERY PLAN 和平均耗时；然后执行 run_migrations，再输出一次。
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUERIES = [
+    ("按主题查标题", "SELECT id, title_text FROM titles WHERE topic_id = :id ORDER BY created_at DESC", {'id': 500}),
+    ("按标题查短文", "SELECT id FROM articles WHERE title_id = :id ORDER BY created_at DESC", {'id': 500}),
+    ("按短文查HTML", "SELECT id FROM html_outputs WHERE article_id = :id ORDER BY created_at DESC", {'id': 500}),
+    ("短文列表首页", "SELECT id, title_id FROM articles ORDER BY created_at DESC, id DESC LIMIT 50", {}),
+    ("分类默认模板", "SELECT id FROM prompt_templates WHERE category = :category AND is_default = 1", {'category': 'html'}),
+]
+
+
+def _report(engine, repeat: int):
+    """输出每个查询的执行计划和平均耗时"""
+    from sqlalchemy import text
+    with engine.connect() as conn:
+        for name, sql, params in QUERIES:
+            plan = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)]
+            start = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(text(sql), params).fetchall()
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"  {name:8s} {elapsed * 1000:8.3f}ms  计划: {' / '.join(plan)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="索引迁移前后的查询计划对比")
+    parser.add_argument("--topics", type=int, default=2000, help="主题数")
+    parser.add_argument("--titles-per-topic", type=int, default=3, help="每个主题的标题数")
+    parser.add_argument("--repeat", type=int, default=200, help="每个查询重复执行次数")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_query_plans_"))
+
+    from sqlalchemy import text
+    from utils.logger import logger
+    logger.setLevel(logging.WARNING)
+    from database import Base, engine, get_db_session
+    from models import Topic, Title, Article, HTMLOutput, PromptTemplate
+    from migrations import LIST_INDEXES, run_migrations
+    from benchmarks.bench_list_queries import _seed
+
+    Base.metadata.create_all(bind=engine)
+    db = get_db_session()
+    try:
+        _seed(db, (Topic, Title, Article, HTMLOutput), args.topics, args.titles_per_topic)
+        db.add_all([
+            PromptTemplate(category=category, name=f"{category}-{i}", content="c", is_default=(i == 0))
+            for category in ("title", "article", "html") for i in range(200)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    # 模拟旧版数据库：没有复合索引，也没有迁移记录
+    with engine.begin() as conn:
+        for index_name, _, _ in LIST_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+    print(f"主题数={args.topics} 标题/短文/HTML 数={args.topics * args.titles_per_topic}")
+    print("迁移前:")
+    _report(engine, args.repeat)
+
+    executed = run_migrations(engine)
+    print(f"迁移后（执行版本 {executed}）:")
+    _report(engine, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Gemini 限流与自适应并发基准测试
+
+用法: python -m benchmarks.bench_rate_limiter [--calls 200] [--threads 16] [--server-concurrency 4] [--latency 0.1]
+
+本地桩服务同时最多处理 --server-concurrency 个请求，超出返回 429（模拟上游配额）。
+--threads 个线程同时调用 get_gemini_response，对比三种配置（各自在独立子进程中运行）：
+- off：关闭限流（GEMINI_RATE_LIMIT_ENABLED=false），与原实现一致
+- aimd：默认配置，只有 AIMD 自适应并发
+- aimd+rpm：再加上 RPM 上限（--rpm）
+输出成功/失败次数、耗时、桩服务观察到的最大并发，以及限流器最终的并发上限和排队统计。
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = {
+    "off": {"GEMINI_RATE_LIMIT_ENABLED": "false"},
+    "aimd": {},
+    "aimd+rpm": None,  # 由 --rpm 决定
+}
+
+
+def _run_mode(calls: int, threads: int, server_concurrency: int, latency: float):
+    """在当前进程中执行一种配置，结果以 JSON 输出到标准输出"""
+    from benchmarks.stub_gemini import StubGeminiServer
+
+    server = StubGeminiServer(latency=latency, max_concurrency=server_concurrency).start()
+    os.environ["GEMINI_BASE_URL"] = server.base_url
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("GEMINI_RETRY_MAX_ATTEMPTS", "1")  # 只比较限流本身，不重试
+
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+    from utils.api import get_gemini_response
+    from utils.rate_limiter import get_gemini_limiter
+
+    failures = []
+
+    def call(i):
+        try:
+            get_gemini_response(f"prompt {i}")
+        except Exception as e:
+            failures.append(str(e).splitlines()[0][:80])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    limiter = get_gemini_limiter()
+    print(json.dumps({
+        'calls': calls,
+        'failures': len(failures),
+        'failure_sample': failures[:1],
+        'elapsed': elapsed,
+        'server_requests': server.requests,
+        'server_rejected': server.rejected,
+        'server_peak': server.peak_active,
+        'limiter': limiter.stats() if limiter else None,
+    }, ensure_ascii=False))
+    server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini 限流与自适应并发基准测试")
+    parser.add_argument("--calls", type=int, default=200, help="调用次数")
+    parser.add_argument("--threads", type=int, default=16, help="同时发起调用的线程数")
+    parser.add_argument("--server-concurrency", type=int, default=4, help="桩服务并发上限（超出返回 429）")
+    parser.add_argument("--latency", type=float, default=0.1, help="桩服务每个请求的处理时间（秒）")
+    parser.add_argument("--rpm", type=int, default=180, help="aimd+rpm 模式的每分钟请求数上限（令牌桶容量同为一分钟的量）")
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args.calls, args.threads, args.server_concurrency, args.latency)
+        return
+
+    print(f"调用 {args.calls} 次，{args.threads} 个线程；桩服务并发上限 {args.server_concurrency}，处理时间 {args.latency}s")
+    for mode, env in MODES.items():
+        env = env if env is not None else {"GEMINI_RPM_LIMIT": str(args.rpm)}
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_rate_limiter", "--mode", mode, "--calls", str(args.calls),
+             "--threads", str(args.threads), "--server-concurrency", str(args.server_concurrency),
+             "--latency", str(args.latency)],
+            cwd=ROOT, env=dict(os.environ, **env), capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        line = (f"{mode:9s} 失败={r['failures']:4d}/{r['calls']} 耗时={r['elapsed']:6.2f}s "
+                f"上游请求={r['server_requests']:4d} 429={r['server_rejected']:4d} 上游最大并发={r['server_peak']}")
+        if r['limiter']:
+            s = r['limiter']
+            line += (f" | 最终并发上限={s['concurrency_limit']} 排队请求={s['throttled']} "
+                     f"排队总时长={s['wait_seconds']:.1f}s 过载={s['overloads']}")
+        print(line)
+        if r['failure_sample']:
+            print(f"          失败示例: {r['failure_sample'][0]}")
+
+
+if __name__ == "__main__":
+    main()
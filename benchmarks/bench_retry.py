@@ -0,0 +1,118 @@
+"""
+Gemini 重试与对冲请求基准测试
+
+用法: python -m benchmarks.bench_retry [--calls 300] [--threads 8] [--fail-rate 0.1] [--slow-rate 0.05]
+
+本地桩服务按 --fail-rate 随机返回 503，按 --slow-rate 随机慢响应（--slow-latency 秒，模拟长尾），
+--threads 个线程同时调用 get_gemini_response，对比三种配置（各自在独立子进程中运行）：
+- no-retry：只请求一次（GEMINI_RETRY_MAX_ATTEMPTS=1），与原实现一致
+- retry：默认重试策略（指数退避 + 抖动）
+- retry+hedge：再开启对冲请求（GEMINI_HEDGE_ENABLED=true）
+输出失败次数、调用耗时的 P50/P95/P99、上游请求数和重试/对冲统计。
+默认关闭限流（503 会让 AIMD 降低并发，排队时间会掩盖重试和对冲本身的效果），可设置 GEMINI_RATE_LIMIT_ENABLED=true 对比。
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = {
+    "no-retry": {"GEMINI_RETRY_MAX_ATTEMPTS": "1", "GEMINI_HEDGE_ENABLED": "false"},
+    "retry": {"GEMINI_HEDGE_ENABLED": "false"},
+    "retry+hedge": {"GEMINI_HEDGE_ENABLED": "true"},
+}
+
+
+def _percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+
+def _run_mode(args):
+    """在当前进程中执行一种配置，结果以 JSON 输出到标准输出"""
+    from benchmarks.stub_gemini import StubGeminiServer
+
+    server = StubGeminiServer(latency=args.latency, fail_rate=args.fail_rate, slow_rate=args.slow_rate,
+                              slow_latency=args.slow_latency, seed=args.seed).start()
+    os.environ["GEMINI_BASE_URL"] = server.base_url
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("GEMINI_RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("GEMINI_RETRY_BASE_DELAY", "0.2")
+
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+    from utils.api import get_gemini_response
+    from utils.retry import get_retry_stats
+
+    failures = []
+    latencies = []
+
+    def call(i):
+        started = time.perf_counter()
+        try:
+            get_gemini_response(f"prompt {i}", stage="article")
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            failures.append(str(e).splitlines()[0][:80])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(call, range(args.calls)))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'calls': args.calls,
+        'failures': len(failures),
+        'failure_sample': failures[:1],
+        'elapsed': elapsed,
+        'p50': _percentile(latencies, 0.5),
+        'p95': _percentile(latencies, 0.95),
+        'p99': _percentile(latencies, 0.99),
+        'server_requests': server.requests,
+        'retry': get_retry_stats().get('article', {}),
+    }, ensure_ascii=False))
+    server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini 重试与对冲请求基准测试")
+    parser.add_argument("--calls", type=int, default=300, help="调用次数")
+    parser.add_argument("--threads", type=int, default=8, help="同时发起调用的线程数")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务正常请求的处理时间（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="桩服务随机返回 503 的比例")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="桩服务随机慢响应的比例（低于对冲分位数 1-P95 时对冲才有效）")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="慢响应的处理时间（秒）")
+    parser.add_argument("--seed", type=int, default=1, help="桩服务随机数种子")
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args)
+        return
+
+    print(f"调用 {args.calls} 次，{args.threads} 个线程；桩服务处理时间 {args.latency}s，"
+          f"{args.fail_rate:.0%} 返回 503，{args.slow_rate:.0%} 慢响应（{args.slow_latency}s）")
+    for mode, env in MODES.items():
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_retry", "--mode", mode] + sys.argv[1:],
+            cwd=ROOT, env=dict(os.environ, **env), capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        s = r['retry']
+        print(f"{mode:11s} 失败={r['failures']:4d}/{r['calls']} 耗时={r['elapsed']:6.2f}s "
+              f"P50={r['p50'] * 1000:6.0f}ms P95={r['p95'] * 1000:6.0f}ms P99={r['p99'] * 1000:6.0f}ms "
+              f"上游请求={r['server_requests']:4d} 重试={s.get('retries', 0)} "
+              f"对冲={s.get('hedges', 0)}（胜出 {s.get('hedge_wins', 0)}）")
+        if r['failure_sample']:
+            print(f"            失败示例: {r['failure_sample'][0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+流式生成基准测试：首字节时间（TTFB）对比
+
+用法: python -m benchmarks.bench_streaming [--chunks 40] [--interval 0.05]
+
+桩服务把响应拆成若干片段、每段间隔固定时间发送，模拟模型逐 token 生成。
+分别测量 get_gemini_response（等待完整响应）和 stream_gemini_response（首个片段到达）的耗时。
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_gemini import StubGeminiServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式生成首字节时间基准测试")
+    parser.add_argument("--chunks", type=int, default=40, help="响应拆分的片段数")
+    parser.add_argument("--interval", type=float, default=0.05, help="片段间隔（秒）")
+    args = parser.parse_args()
+
+    text = "这是一段用于测试流式输出的短文内容。" * args.chunks
+    server = StubGeminiServer(response_text=text, stream_chunks=args.chunks, chunk_interval=args.interval,
+                              latency=args.chunks * args.interval).start()
+    os.environ["GEMINI_BASE_URL"] = server.base_url
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"  # 每次都实际请求桩服务
+
+    from utils.api import get_gemini_response, stream_gemini_response
+    from utils.logger import logger
+    logger.setLevel(logging.WARNING)
+
+    try:
+        start = time.perf_counter()
+        get_gemini_response("prompt")
+        blocking_total = time.perf_counter() - start
+
+        start = time.perf_counter()
+        first_chunk = None
+        for _ in stream_gemini_response("prompt"):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+        stream_total = time.perf_counter() - start
+
+        print(f"片段数={args.chunks} 间隔={args.interval}s")
+        print(f"非流式 get_gemini_response    首字节={blocking_total * 1000:8.1f}ms  完成={blocking_total * 1000:8.1f}ms")
+        print(f"流式   stream_gemini_response 首字节={first_chunk * 1000:8.1f}ms  完成={stream_total * 1000:8.1f}ms")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+大文本列压缩的空间与延迟对比
+
+用法: python -m benchmarks.bench_text_compression [--articles 2000] [--repeat 20]
+
+用合成语料（长度接近 8192 token 的中文短文、带内联样式的 HTML）分别在 TEXT_COMPRESSION=none/zlib/zstd
+下建库写入（zstd 需安装 zstandard，未安装时跳过），每种配置在独立子进程中运行，输出：
+数据库文件大小、写入耗时、短文列表（预览字段）、读取整篇短文、HTML 详情接口的平均延迟。
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PHRASES = [
+    "在信息爆炸的时代", "我们需要重新审视", "内容创作的本质", "读者真正关心的是", "一个好的标题",
+    "能够在三秒内抓住注意力", "数据表明", "超过一半的用户", "会在阅读前两段后离开", "因此开篇尤为重要",
+    "与此同时", "平台算法也在不断变化", "优质内容依然是核心竞争力", "从选题到成稿", "每一个环节都值得打磨",
+    "我们整理了以下几点经验", "第一", "第二", "第三", "最后", "希望对你有所帮助", "欢迎在评论区留言",
+]
+STYLES = [
+    "font-size:16px;line-height:1.75;color:#333;margin:0 0 16px;",
+    "font-size:18px;font-weight:bold;color:#1a73e8;border-left:4px solid #1a73e8;padding-left:10px;margin:24px 0 12px;",
+    "font-size:15px;color:#666;background:#f7f7f7;padding:12px 16px;border-radius:6px;",
+]
+
+
+def make_corpus(count: int, seed: int = 42):
+    """生成合成语料：[(短文, HTML)]"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        # 固定短语与随机常用汉字混合，压缩率接近真实中文文本（纯短语拼接会过于乐观）
+        paragraphs = [
+            "，".join(rng.choice(PHRASES) if rng.random() < 0.5 else "".join(chr(0x4E00 + rng.randint(0, 2500)) for _ in range(rng.randint(4, 10)))
+                     for _ in range(rng.randint(8, 16))) + "。"
+            for _ in range(rng.randint(40, 60))
+        ]
+        article = "\n\n".join(paragraphs)
+        html = "".join(
+            f'<section style="{STYLES[i % len(STYLES)]}"><p style="{rng.choice(STYLES)}">{p}</p></section>'
+            for i, p in enumerate(paragraphs)
+        )
+        corpus.append((article, html))
+    return corpus
+
+
+def _average_ms(func, repeat: int) -> float:
+    """执行 repeat 次，返回平均毫秒数"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def _run_mode(articles: int, repeat: int):
+    """在当前进程中按 TEXT_COMPRESSION 建库并测量，结果以 JSON 输出到标准输出"""
+    os.chdir(tempfile.mkdtemp(prefix="bench_text_compression_"))
+
+    from sqlalchemy import text
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+    from config import DB_PATH
+    from database import init_db, get_db_session, engine
+    from models import Topic, Title, Article, HTMLOutput
+    import app as app_module
+
+    init_db()
+    corpus = make_corpus(articles)
+    start = time.perf_counter()
+    db = get_db_session()
+    try:
+        topic = Topic(topic_text="压缩测试", status="draft")
+        db.add(topic)
+        db.flush()
+        titles = [Title(topic_id=topic.id, title_text=f"标题{i}", prompt_text="") for i in range(articles)]
+        db.add_all(titles)
+        db.flush()
+        article_rows = [Article(title_id=t.id, article_text=a, prompt_text="") for t, (a, _) in zip(titles, corpus)]
+        db.add_all(article_rows)
+        db.flush()
+        html_rows = [HTMLOutput(article_id=a.id, html_content=h, prompt_text="") for a, (_, h) in zip(article_rows, corpus)]
+        db.add_all(html_rows)
+        db.commit()
+        article_ids = [a.id for a in article_rows]
+        html_ids = [h.id for h in html_rows]
+    finally:
+        db.close()
+    write_elapsed = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("VACUUM"))
+    db_size = os.path.getsize(DB_PATH)
+
+    client = app_module.app.test_client()
+    rng = random.Random(0)
+    list_ms = _average_ms(lambda: client.get("/api/articles?fields=id,title_text,preview&limit=50"), repeat)
+
+    def read_article():
+        """加载一篇短文并读取全文（访问 article_text 时才查询并解压）"""
+        session = get_db_session()
+        try:
+            return len(session.get(Article, rng.choice(article_ids)).article_text)
+        finally:
+            session.close()
+
+    article_ms = _average_ms(read_article, repeat)
+    html_ms = _average_ms(lambda: client.get(f"/api/html/{rng.choice(html_ids)}"), repeat)
+
+    print(json.dumps({
+        'raw_bytes': sum(len(a.encode("utf-8")) + len(h.encode("utf-8")) for a, h in corpus),
+        'db_size': db_size,
+        'write_elapsed': write_elapsed,
+        'list_ms': list_ms,
+        'article_ms': article_ms,
+        'html_ms': html_ms,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大文本列压缩的空间与延迟对比")
+    parser.add_argument("--articles", type=int, default=2000, help="短文/HTML 条数")
+    parser.add_argument("--repeat", type=int, default=20, help="每个接口请求次数")
+    parser.add_argument("--mode", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _run_mode(args.articles, args.repeat)
+        return
+
+    from utils.compression import zstandard
+    codecs = ["none", "zlib"] + (["zstd"] if zstandard is not None else [])
+    if zstandard is None:
+        print("未安装 zstandard，跳过 zstd")
+    print(f"短文/HTML 各 {args.articles} 条")
+    baseline = None
+    for codec in codecs:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_text_compression", "--mode",
+             "--articles", str(args.articles), "--repeat", str(args.repeat)],
+            cwd=ROOT, env=dict(os.environ, TEXT_COMPRESSION=codec), capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        baseline = baseline or r['db_size']
+        print(f"{codec:5s} 数据库 {r['db_size'] / 1024 / 1024:7.1f}MB（原文 {r['raw_bytes'] / 1024 / 1024:.1f}MB，"
+              f"相对 none {r['db_size'] / baseline:5.0%}） 写入 {r['write_elapsed']:6.2f}s | "
+              f"列表预览 {r['list_ms']:6.1f}ms 读取短文 {r['article_ms']:6.2f}ms HTML详情 {r['html_ms']:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+请求追踪开销基准测试 / 回归检查
+
+用法: python -m benchmarks.bench_tracing [--spans 100000] [--calls 50]
+
+1. 热路径开销：嵌套记录 --spans 个 span（with span(...)），输出每个 span 的平均耗时
+2. 端到端：本地桩服务充当 Gemini，通过 Flask 测试客户端
+   - 带 traceparent 请求 /api/topics/stream，检查响应头 X-Trace-Id 沿用了其中的追踪ID，
+     且该追踪中 stream_gemini_response、save_titles_to_db 都挂在请求的 span 下（SSE 在请求结束后才发送）
+   - 请求 /api/topics 创建标题任务，检查 /debug/traces?job_id= 能同时找到请求和任务两个追踪，
+     任务追踪中 generate_titles → get_gemini_response → gemini_http_request 父子关系正确
+   - 对比 TRACING 开启前后 --calls 次 get_gemini_response 的平均耗时
+检查不通过时退出码非 0。
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+def _overhead(spans: int) -> float:
+    """每个 span 的平均耗时（微秒）"""
+    from utils.tracing import span
+
+    start = time.perf_counter()
+    with span("bench_root"):
+        for i in range(spans):
+            with span("bench_child", index=i):
+                pass
+    return (time.perf_counter() - start) / spans * 1e6
+
+
+def _check_chain(spans, child: str, parent: str, failures: list):
+    """检查名为 child 的 span 的父 span 名为 parent"""
+    by_id = {s['span_id']: s for s in spans}
+    found = [s for s in spans if s['name'] == child]
+    if not found:
+        failures.append(f"缺少 span {child}")
+        return
+    for s in found:
+        actual = by_id.get(s['parent_id'], {}).get('name')
+        if actual != parent:
+            failures.append(f"{child} 的父 span 为 {actual}，期望 {parent}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=100000)
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    from benchmarks.stub_gemini import StubGeminiServer
+
+    server = StubGeminiServer(stream_chunks=3).start()
+    data_dir = tempfile.mkdtemp(prefix="bench_tracing_")
+    os.environ.update({
+        "GEMINI_BASE_URL": server.base_url,
+        "RESPONSE_CACHE_ENABLED": "false",
+        "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        "TRACING_ENABLED": "true",
+        "TRACE_EXPORTER": "none",
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "bench-api-key-0000000000")
+
+    from utils.logger import logger
+    logger.setLevel(logging.CRITICAL)
+    logging.getLogger("werkzeug").setLevel(logging.CRITICAL)
+
+    print(f"热路径开销: {_overhead(args.spans):.2f} us / span")
+
+    import config
+    import utils.tracing as tracing
+    from utils.api import get_gemini_response
+    from app import app
+
+    failures = []
+    client = app.test_client()
+
+    # SSE：追踪ID沿用 traceparent，请求结束后发送的流仍记在请求的 span 下
+    response = client.post("/api/topics/stream", json={"topic_text": "追踪测试"},
+                           headers={"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"})
+    response.get_data()
+    response.close()
+    if response.headers.get("X-Trace-Id") != TRACE_ID:
+        failures.append(f"X-Trace-Id 为 {response.headers.get('X-Trace-Id')}")
+    spans = client.get(f"/debug/traces/{TRACE_ID}?format=json").get_json().get("data") or []
+    print(f"  SSE 请求追踪: {len(spans)} 个 span: {', '.join(s['name'] for s in spans)}")
+    _check_chain(spans, "stream_gemini_response", "POST /api/topics/stream", failures)
+    _check_chain(spans, "save_titles_to_db", "POST /api/topics/stream", failures)
+    if client.get(f"/debug/traces/{TRACE_ID}").status_code != 200:
+        failures.append("瀑布图页面")
+
+    # 后台任务：请求和任务各一个追踪，按 job_id 都能找到
+    response = client.post("/api/topics", json={"topic_text": "任务追踪测试"})
+    job_id = response.get_json()["data"]["job_id"]
+    response.close()
+    client.get(f"/api/jobs/{job_id}?wait=10").close()
+    time.sleep(0.1)  # 任务 span 在通知等待方之后才结束
+    traces = client.get(f"/debug/traces?job_id={job_id}").get_json()["data"]
+    names = sorted(t["name"] for t in traces)
+    print(f"  job_id={job_id} 的追踪: {names}")
+    if names != ["POST /api/topics", "job.title"]:
+        failures.append(f"job_id 过滤结果 {names}")
+    job_trace = next((t for t in traces if t["name"] == "job.title"), None)
+    if job_trace:
+        spans = client.get(f"/debug/traces/{job_trace['trace_id']}?format=json").get_json()["data"]
+        _check_chain(spans, "generate_titles", "job.title", failures)
+        _check_chain(spans, "get_gemini_response", "generate_titles", failures)
+        _check_chain(spans, "gemini_http_request", "get_gemini_response", failures)
+        _check_chain(spans, "save_titles_to_db", "job.title", failures)
+
+    # 追踪开启/关闭时的上游调用耗时
+    timings = {}
+    for enabled in (False, True):
+        tracing.TRACING_ENABLED = config.TRACING_ENABLED = enabled
+        start = time.perf_counter()
+        for i in range(args.calls):
+            get_gemini_response(f"prompt {enabled} {i}", stage="title")
+        timings[enabled] = (time.perf_counter() - start) / args.calls * 1e3
+    print(f"  get_gemini_response 平均耗时: 关闭 {timings[False]:.2f}ms, 开启 {timings[True]:.2f}ms")
+    server.stop()
+
+    if failures:
+        print(f"检查失败: {'; '.join(failures)}")
+        sys.exit(1)
+    print("检查通过")
+
+
+if __name__ == "__main__":
+    main()
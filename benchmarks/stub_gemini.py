@@ -0,0 +1,230 @@
+"""
+本地 Gemini 桩服务（基准测试用）
+
+模拟 /v1beta/models/<model>:generateContent 和 :streamGenerateContent?alt=sse 接口，返回固定文本。
+可配置为拒绝 X-Goog-Api-Key 请求头鉴权（返回 401，模拟只支持 ?key= 的中转服务），
+并统计服务端接受的 TCP 连接数，用于观察连接复用效果。
+可设置服务端并发上限（max_concurrency），超出时返回 429，模拟上游配额。
+可按比例随机返回 503（fail_rate）或慢响应（slow_rate / slow_latency），模拟上游抖动和长尾延迟。
+hang 设为 True 时请求一直挂起不返回（直到 hang 恢复为 False），模拟上游宕机；fail_rate / hang 可在运行中修改。
+honor_max_tokens 设为 True 时按请求的 maxOutputTokens 截断输出（1 个字符计 1 个 token，finishReason=MAX_TOKENS），
+续写请求（contents 中带有模型回复）从已输出的位置接着返回，并记录每个请求的提示词估算 token 数和 maxOutputTokens。
+/v1/workflow/stream_run 模拟 Coze 工作流：以 SSE 逐个返回 stream_chunks 个 Message 事件（间隔 chunk_interval）和 Done 事件。
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    """桩服务：记录连接数和请求数"""
+    daemon_threads = True
+    request_queue_size = 512  # 几百个并发连接同时建立时不因 listen 队列溢出而重传 SYN
+
+    def __init__(self, port: int = 0, reject_header_auth: bool = False, latency: float = 0.0,
+                 response_text: str = "桩服务返回的文本", stream_chunks: int = 8, chunk_interval: float = 0.0,
+                 max_concurrency: int = 0, fail_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 0.0,
+                 honor_max_tokens: bool = False, seed: Optional[int] = None):
+        super().__init__(("127.0.0.1", port), StubGeminiHandler)
+        self.reject_header_auth = reject_header_auth
+        self.latency = latency
+        self.response_text = response_text
+        self.stream_chunks = stream_chunks  # 流式响应拆分的片段数
+        self.chunk_interval = chunk_interval  # 流式片段之间的间隔（秒）
+        self.max_concurrency = max_concurrency  # 同时处理的请求数上限，超出返回 429；0 表示不限制
+        self.fail_rate = fail_rate  # 随机返回 503 的比例
+        self.slow_rate = slow_rate  # 随机慢响应的比例，慢响应的处理时间为 slow_latency
+        self.slow_latency = slow_latency
+        self.hang = False  # 为 True 时请求挂起不返回
+        self.honor_max_tokens = honor_max_tokens
+        self.generation_requests = []  # honor_max_tokens 时记录 (提示词估算 token 数, maxOutputTokens, 是否续写)
+        self._random = random.Random(seed)
+        self.connections = 0
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+        self.slow = 0
+        self.active = 0
+        self.peak_active = 0
+        self._counter_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def process_request(self, request, client_address):
+        with self._counter_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def count_request(self):
+        with self._counter_lock:
+            self.requests += 1
+
+    def reset_counters(self):
+        with self._counter_lock:
+            self.connections = 0
+            self.requests = 0
+            self.rejected = 0
+            self.failed = 0
+            self.slow = 0
+            self.peak_active = 0
+            self.generation_requests = []
+
+    def enter(self) -> bool:
+        """开始处理一个请求，超过并发上限时返回 False"""
+        with self._counter_lock:
+            if self.max_concurrency and self.active >= self.max_concurrency:
+                self.rejected += 1
+                return False
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            return True
+
+    def pick_fault(self) -> Optional[str]:
+        """按配置的比例随机决定本次请求是否失败（"fail"）或慢响应（"slow"）"""
+        with self._counter_lock:
+            roll = self._random.random()
+            if roll < self.fail_rate:
+                self.failed += 1
+                return "fail"
+            if roll < self.fail_rate + self.slow_rate:
+                self.slow += 1
+                return "slow"
+            return None
+
+    def leave(self):
+        with self._counter_lock:
+            self.active -= 1
+
+    def start(self) -> "StubGeminiServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    """处理 generateContent 请求"""
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+    disable_nagle_algorithm = True  # 响应头和响应体分开写出，避免 Nagle + 延迟ACK 造成 40ms 停顿
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _generate(self, body: bytes):
+        """本次请求返回的文本和 finishReason"""
+        text = self.server.response_text
+        if not self.server.honor_max_tokens or "/workflow/" in self.path:
+            return text, "STOP"
+        request = json.loads(body)
+        contents = request.get("contents", [])
+        produced = "".join(part.get("text", "") for content in contents if content.get("role") == "model"
+                           for part in content.get("parts", []))
+        prompt_tokens = sum(len(part.get("text", "").encode("utf-8")) // 3 for content in contents
+                            for part in content.get("parts", []))
+        limit = request.get("generationConfig", {}).get("maxOutputTokens") or len(text)
+        with self.server._counter_lock:
+            self.server.generation_requests.append((prompt_tokens, limit, bool(produced)))
+        remaining = text[len(produced):] if text.startswith(produced) else text
+        if len(remaining) > limit:
+            return remaining[:limit], "MAX_TOKENS"
+        return remaining, "STOP"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        self.server.count_request()
+
+        if self.server.reject_header_auth and "key=" not in self.path:
+            self._send_json(401, {"error": {"code": 401, "message": "API key not valid"}})
+            return
+
+        if not self.server.enter():
+            self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}})
+            return
+        try:
+            while self.server.hang:
+                time.sleep(0.05)
+            fault = self.server.pick_fault()
+            if fault == "fail":
+                self._send_json(503, {"error": {"code": 503, "message": "The model is overloaded", "status": "UNAVAILABLE"}})
+                return
+            text, finish_reason = self._generate(body)
+            if ":streamGenerateContent" in self.path:
+                self._send_stream(text, finish_reason)
+                return
+            if "/workflow/stream_run" in self.path:
+                self._send_coze_stream()
+                return
+
+            latency = self.server.slow_latency if fault == "slow" else self.server.latency
+            if latency:
+                time.sleep(latency)
+
+            self._send_json(200, {
+                "candidates": [{
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": finish_reason
+                }],
+                "usageMetadata": {"promptTokenCount": length // 3, "candidatesTokenCount": len(text),
+                                  "totalTokenCount": length // 3 + len(text)}
+            })
+        finally:
+            self.server.leave()
+
+    def _send_stream(self, text: str, finish_reason: str):
+        """以 SSE + chunked 编码逐段返回文本，最后一个片段带 finishReason"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        count = max(1, min(self.server.stream_chunks, len(text)))
+        size = -(-len(text) // count)
+        for i in range(0, len(text), size):
+            if self.server.chunk_interval:
+                time.sleep(self.server.chunk_interval)
+            candidate = {"content": {"parts": [{"text": text[i:i + size]}], "role": "model"}}
+            if i + size >= len(text):
+                candidate["finishReason"] = finish_reason
+            event = {"candidates": [candidate]}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _send_coze_stream(self):
+        """模拟 Coze stream_run：Message 事件 + Done 事件"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        count = max(1, self.server.stream_chunks)
+        for i in range(count):
+            if self.server.chunk_interval:
+                time.sleep(self.server.chunk_interval)
+            data = {"content": f"节点{i}完成", "node_title": f"节点{i}", "node_seq_id": str(i),
+                    "node_is_finish": True}
+            self._write_chunk(f"id: {i}\nevent: Message\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        done = {"debug_url": "https://www.coze.cn/work_flow?execute_id=0"}
+        self._write_chunk(f"id: {count}\nevent: Done\ndata: {json.dumps(done)}\n\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
@@ -2,10 +2,13 @@
 CLI交互式界面
 """
 import sys
+import argparse
+from sqlalchemy import func
+from sqlalchemy.orm import undefer
 from database import init_db, get_db_session
 from models import Topic, Title, Article, HTMLOutput
 from services.title_service import generate_titles, save_titles_to_db
-from services.article_service import generate_article, save_article_to_db
+from services.article_service import generate_articles_batch
 from services.html_service import generate_html, save_html_to_db
 from services.prompt_service import init_prompt_templates
 
@@ -78,15 +81,15 @@ def list_topics():
     print_separator()
     db = get_db_session()
     try:
-        topics = db.query(Topic).order_by(Topic.created_at.desc()).all()
+        # 外连接分组统计标题数，没有标题的主题计数为 0
+        topics = db.query(Topic, func.count(Title.id)).outerjoin(Title, Title.topic_id == Topic.id).group_by(Topic.id).order_by(Topic.created_at.desc()).all()
         
         if not topics:
             print("暂无主题")
             return
         
         print(f"共有 {len(topics)} 个主题：\n")
-        for topic in topics:
-            titles_count = len(topic.titles)
+        for topic, titles_count in topics:
             print(f"  [{topic.id}] {topic.topic_text} (状态: {topic.status}, 标题数: {titles_count}, 创建时间: {topic.created_at.strftime('%Y-%m-%d %H:%M:%S')})")
         
     except Exception as e:
@@ -125,6 +128,23 @@ def view_titles_by_topic():
         db.close()
 
 
+def batch_generate_articles(title_ids, concurrency=None):
+    """并发生成短文并打印每个标题的结果"""
+    print(f"\n正在为 {len(title_ids)} 个标题生成短文...")
+    results = generate_articles_batch(title_ids, concurrency=concurrency)
+    
+    for item in results:
+        if item['success']:
+            print(f"✅ 标题ID {item['title_id']}: 短文已生成并保存（短文ID: {item['article_id']}）")
+            print(f"预览（前100字符）: {item['article_text'][:100]}...")
+        else:
+            print(f"❌ 标题ID {item['title_id']}: {item['error']}")
+    
+    succeeded = sum(1 for item in results if item['success'])
+    print(f"\n完成：成功 {succeeded} 篇，失败 {len(results) - succeeded} 篇")
+    return results
+
+
 def generate_articles_from_titles():
     """选择标题生成短文"""
     print_separator()
@@ -134,41 +154,20 @@ def generate_articles_from_titles():
         print("❌ 标题ID不能为空")
         return
     
-    title_ids = [tid.strip() for tid in title_ids_input.split(",")]
+    title_ids = []
+    for title_id_str in (tid.strip() for tid in title_ids_input.split(",")):
+        if not title_id_str.isdigit():
+            print(f"❌ 跳过无效的标题ID: {title_id_str}")
+            continue
+        title_ids.append(int(title_id_str))
+    
+    if not title_ids:
+        return
     
-    db = get_db_session()
     try:
-        for title_id_str in title_ids:
-            if not title_id_str.isdigit():
-                print(f"❌ 跳过无效的标题ID: {title_id_str}")
-                continue
-            
-            title_id = int(title_id_str)
-            title = db.query(Title).filter(Title.id == title_id).first()
-            
-            if not title:
-                print(f"❌ 未找到标题ID: {title_id}")
-                continue
-            
-            print(f"\n正在为标题【{title.title_text}】生成短文...")
-            
-            try:
-                # 生成短文
-                article_text, prompt_text = generate_article(title.title_text)
-                
-                # 保存到数据库
-                article_id = save_article_to_db(title_id, article_text, prompt_text)
-                
-                print(f"✅ 短文已生成并保存（短文ID: {article_id}）")
-                print(f"预览（前100字符）: {article_text[:100]}...")
-                
-            except Exception as e:
-                print(f"❌ 生成短文失败: {e}")
-        
+        batch_generate_articles(title_ids)
     except Exception as e:
         print(f"❌ 执行出错: {e}")
-    finally:
-        db.close()
 
 
 def view_articles():
@@ -176,16 +175,16 @@ def view_articles():
     print_separator()
     db = get_db_session()
     try:
-        articles = db.query(Article).order_by(Article.created_at.desc()).all()
+        articles = db.query(Article, Title.title_text).options(undefer(Article.article_text)).join(Title, Article.title_id == Title.id).order_by(Article.created_at.desc()).all()
         
         if not articles:
             print("暂无短文")
             return
         
         print(f"共有 {len(articles)} 篇短文：\n")
-        for article in articles:
+        for article, title_text in articles:
             selected_mark = "✓" if article.selected else " "
-            print(f"  [{selected_mark}] ID: {article.id} | 标题: {article.title.title_text}")
+            print(f"  [{selected_mark}] ID: {article.id} | 标题: {title_text}")
             print(f"      预览: {article.article_text[:80]}...")
             print(f"      创建时间: {article.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
         
@@ -240,16 +239,16 @@ def view_html_outputs():
     print_separator()
     db = get_db_session()
     try:
-        html_outputs = db.query(HTMLOutput).order_by(HTMLOutput.created_at.desc()).all()
+        html_outputs = db.query(HTMLOutput, Title.title_text).options(undefer(HTMLOutput.html_content)).join(Article, HTMLOutput.article_id == Article.id).join(Title, Article.title_id == Title.id).order_by(HTMLOutput.created_at.desc()).all()
         
         if not html_outputs:
             print("暂无HTML输出")
             return
         
         print(f"共有 {len(html_outputs)} 个HTML输出：\n")
-        for html_output in html_outputs:
+        for html_output, title_text in html_outputs:
             print(f"  ID: {html_output.id} | 短文ID: {html_output.article_id}")
-            print(f"      短文标题: {html_output.article.title.title_text}")
+            print(f"      短文标题: {title_text}")
             print(f"      HTML预览: {html_output.html_content[:100]}...")
             print(f"      创建时间: {html_output.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
         
@@ -284,11 +283,33 @@ def import_prompt_templates():
         print(f"❌ 导入失败: {e}")
 
 
+def run_command(argv):
+    """非交互模式：python cli.py batch-articles 1,2,3 [--concurrency N]"""
+    parser = argparse.ArgumentParser(prog="cli.py", description="文章生成系统 - CLI")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    batch_parser = subparsers.add_parser("batch-articles", help="批量为标题生成短文")
+    batch_parser.add_argument("title_ids", help="标题ID，多个用逗号分隔")
+    batch_parser.add_argument("--concurrency", type=int, default=None, help="并发数（不超过 ARTICLE_BATCH_CONCURRENCY）")
+    args = parser.parse_args(argv)
+    
+    if args.command == "batch-articles":
+        try:
+            title_ids = [int(tid) for tid in args.title_ids.split(",") if tid.strip()]
+        except ValueError:
+            parser.error("标题ID必须是整数")
+        results = batch_generate_articles(title_ids, concurrency=args.concurrency)
+        sys.exit(0 if all(item['success'] for item in results) else 1)
+
+
 def main():
     """主函数"""
     # 初始化数据库
     init_db()
     
+    if len(sys.argv) > 1:
+        run_command(sys.argv[1:])
+        return
+    
     while True:
         print_menu()
         choice = input("请选择操作 (1-9): ").strip()
@@ -1,51 +1,159 @@
 """
 数据库初始化和会话管理
 """
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
 from sqlalchemy.ext.declarative import declarative_base
+from concurrent.futures import Future
+from typing import Callable, Optional, TypeVar
 import os
+import queue
+import threading
 
-# 数据库路径
-DB_DIR = "data"
-DB_PATH = os.path.join(DB_DIR, "articles.db")
+from config import (DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+                    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE)
+
+T = TypeVar("T")
+
+
+def create_db_engine(url: str):
+    """
+    根据连接URL创建数据库引擎
+
+    SQLite 使用本地文件并设置 WAL 等参数；MySQL/PostgreSQL 使用可配置的连接池，多个实例可共享同一个数据库。
+
+    :param url: SQLAlchemy 连接URL
+    :return: 数据库引擎
+    """
+    db_url = make_url(url)
+    if db_url.get_backend_name() != "sqlite":
+        return create_engine(
+            db_url,
+            echo=False,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING
+        )
+
+    # 确保数据库文件所在目录存在
+    if db_url.database and db_url.database != ":memory:":
+        os.makedirs(os.path.dirname(db_url.database) or ".", exist_ok=True)
+    sqlite_engine = create_engine(db_url, echo=False, pool_pre_ping=DB_POOL_PRE_PING)
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        每个新连接设置 SQLite 参数
+
+        WAL 模式下读不阻塞写、写不阻塞读；busy_timeout 让写锁冲突时等待而不是立即报 database is locked。
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        finally:
+            cursor.close()
+
+    return sqlite_engine
 
-# 确保 data 目录存在
-os.makedirs(DB_DIR, exist_ok=True)
 
 # 创建数据库引擎
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False)
+engine = create_db_engine(DATABASE_URL)
+
+# SQLite 同一时刻只允许一个写事务，需要把写操作排队；其他数据库直接在调用方线程提交
+SERIALIZE_WRITES = engine.dialect.name == "sqlite"
+
 
-# 创建会话工厂
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+# 创建会话工厂（SessionLocal 按线程复用同一个会话）
+_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = scoped_session(_session_factory)
 
 # 创建基类
 Base = declarative_base()
 
 
-def migrate_configs_table():
-    """迁移 configs 表，添加 name 列（如果不存在）"""
-    try:
-        inspector = inspect(engine)
-        if 'configs' in inspector.get_table_names():
-            columns = [col['name'] for col in inspector.get_columns('configs')]
-            if 'name' not in columns:
-                # 添加 name 列
-                with engine.begin() as conn:
-                    conn.execute(text("ALTER TABLE configs ADD COLUMN name VARCHAR(100)"))
-                print("✅ configs 表已添加 name 列")
-    except Exception as e:
-        # 如果表不存在或其他错误，忽略（init_db 会创建表）
-        print(f"⚠️ 迁移 configs 表时出错（可忽略，如果表不存在）: {e}")
+# 单写线程（仅 SQLite）：写操作排队由同一个线程依次提交，避免多个生成任务同时保存结果时互相抢锁
+_write_queue: "queue.Queue[tuple]" = queue.Queue()
+_writer_thread: Optional[threading.Thread] = None
+_writer_session: Optional[Session] = None
+_writer_lock = threading.Lock()
+
+
+def _writer_loop():
+    """单写线程主循环：依次执行写操作并提交"""
+    global _writer_session
+    while True:
+        func, future = _write_queue.get()
+        if not future.set_running_or_notify_cancel():
+            continue
+        _writer_session = db = _session_factory()
+        try:
+            result = func(db)
+            db.commit()
+            future.set_result(result)
+        except BaseException as e:
+            db.rollback()
+            future.set_exception(e)
+        finally:
+            db.close()
+            _writer_session = None
+
+
+def run_write(func: Callable[[Session], T]) -> T:
+    """
+    在单写线程中执行写操作
+
+    func 接收一个会话，在其中添加/修改数据，返回值需在会话关闭后仍可使用（如ID，而不是ORM对象）。
+    func 返回后自动提交；抛出异常时回滚，并在调用方线程重新抛出。
+    非 SQLite 数据库支持并发写入，直接在调用方线程执行。
+
+    :param func: 写操作
+    :return: func 的返回值
+    """
+    global _writer_thread
+    if not SERIALIZE_WRITES:
+        # 使用独立会话，不影响调用方线程正在使用的 SessionLocal 会话
+        db = _session_factory()
+        try:
+            result = func(db)
+            db.commit()
+            return result
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    if threading.current_thread() is _writer_thread:
+        # 已在写线程中（写操作内部嵌套调用），并入当前写事务，避免自己等待自己
+        result = func(_writer_session)
+        _writer_session.flush()
+        return result
+
+    if _writer_thread is None:
+        with _writer_lock:
+            if _writer_thread is None:
+                _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+                _writer_thread.start()
+
+    future: Future = Future()
+    _write_queue.put((func, future))
+    return future.result()
 
 
 def init_db():
-    """初始化数据库，创建所有表"""
-    from models import Topic, Title, Article, HTMLOutput, Config
-    # 迁移 configs 表（如果已存在且缺少 name 列）
-    migrate_configs_table()
-    # 创建所有表（包括新表和已有表的更新）
+    """初始化数据库：创建所有表，并对已有数据库执行未完成的结构迁移"""
+    from models import Topic, Title, Article, HTMLOutput, Config, GenerationJob, PipelineRun, PipelineItem
+    from migrations import run_migrations
+    # 创建所有表（新数据库直接得到最新结构，包括索引）
     Base.metadata.create_all(bind=engine)
+    # 已有数据库补齐新增的列和索引（已执行的版本记录在 schema_migrations 表中）
+    run_migrations(engine)
 
 
 def get_db():
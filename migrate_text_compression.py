@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+大文本列压缩迁移工具：把已有的短文内容、HTML内容转换为指定的压缩方式
+用法:
+  python migrate_text_compression.py --codec zlib [--batch 200] [--vacuum]   # 压缩已有数据
+  python migrate_text_compression.py --codec none                           # 关闭压缩前先还原为明文
+
+按 id 分批改写，每批单独提交，中断后重新执行会从头跳过已经是目标格式的行。
+MySQL/PostgreSQL 上压缩前先把列类型转换为 LONGBLOB/BYTEA，还原后再转换回文本类型。
+执行完成后把环境变量 TEXT_COMPRESSION 设置为同样的值再启动应用。
+"""
+import argparse
+import os
+import sys
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+
+from config import TEXT_COMPRESSION, TEXT_COMPRESSION_LEVEL, TEXT_COMPRESSION_MIN_BYTES
+from database import engine, init_db
+from utils.compression import CODECS, compress_text, decompress_text, uses_binary_storage
+from utils.logger import logger
+
+# (表名, 列名)：models.py 中使用 CompressedText 的列
+COMPRESSED_COLUMNS = [
+    ('articles', 'article_text'),
+    ('html_outputs', 'html_content'),
+]
+
+
+def _is_binary_column(table: str, column: str) -> bool:
+    """列当前是否为二进制类型"""
+    for col in inspect(engine).get_columns(table):
+        if col['name'] == column:
+            try:
+                return col['type'].python_type is bytes
+            except NotImplementedError:
+                return False
+    raise ValueError(f"列不存在: {table}.{column}")
+
+
+def _convert_column_type(table: str, column: str, to_binary: bool):
+    """MySQL/PostgreSQL：在文本类型和二进制类型之间转换列（SQLite 不需要转换）"""
+    dialect = engine.dialect.name
+    if dialect == "mysql":
+        column_type = "LONGBLOB" if to_binary else "LONGTEXT CHARACTER SET utf8mb4"
+        sql = f"ALTER TABLE {table} MODIFY {column} {column_type} NOT NULL"
+    elif dialect == "postgresql":
+        if to_binary:
+            sql = f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BYTEA USING convert_to({column}, 'UTF8')"
+        else:
+            sql = f"ALTER TABLE {table} ALTER COLUMN {column} TYPE TEXT USING convert_from({column}, 'UTF8')"
+    else:
+        raise ValueError(f"不支持转换列类型的数据库: {dialect}")
+    logger.info(f"转换列类型: {sql}")
+    with engine.begin() as conn:
+        conn.execute(text(sql))
+
+
+def _stored_size(value) -> int:
+    """数据库中的值占用的字节数"""
+    if value is None:
+        return 0
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+
+def _rewrite_column(table: str, column: str, codec: str, binary: bool, batch: int):
+    """
+    按 id 分批把一列改写为目标格式
+
+    :return: (总行数, 改写行数, 改写前字节数, 改写后字节数)
+    """
+    total = changed = before = after = 0
+    last_id = 0
+    select_sql = text(f"SELECT id, {column} FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch")
+    update_sql = text(f"UPDATE {table} SET {column} = :value WHERE id = :row_id")
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select_sql, {'last_id': last_id, 'batch': batch}).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, value in rows:
+                if value is not None and not isinstance(value, str):
+                    value = bytes(value)
+                new_value = compress_text(decompress_text(value), codec, TEXT_COMPRESSION_LEVEL, TEXT_COMPRESSION_MIN_BYTES)
+                if binary and isinstance(new_value, str):
+                    new_value = new_value.encode("utf-8")
+                before += _stored_size(value)
+                after += _stored_size(new_value)
+                if new_value != value:
+                    updates.append({'value': new_value, 'row_id': row_id})
+            if updates:
+                conn.execute(update_sql, updates)
+        total += len(rows)
+        changed += len(updates)
+        last_id = rows[-1][0]
+        print(f"  {table}.{column}: 已处理 {total} 行，改写 {changed} 行", end="\r")
+    print()
+    return total, changed, before, after
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="大文本列压缩迁移工具")
+    parser.add_argument("--codec", choices=CODECS, default=TEXT_COMPRESSION,
+                        help="目标压缩方式（默认取 TEXT_COMPRESSION），none 表示还原为明文")
+    parser.add_argument("--batch", type=int, default=200, help="每批改写的行数")
+    parser.add_argument("--vacuum", action="store_true", help="完成后执行 VACUUM 回收空间（仅 SQLite）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"大文本列压缩迁移：目标格式 {args.codec}（数据库: {engine.dialect.name}）")
+    print("=" * 60)
+
+    try:
+        init_db()
+        start = time.perf_counter()
+        target_binary = uses_binary_storage(engine.dialect.name, args.codec)
+        for table, column in COMPRESSED_COLUMNS:
+            binary = _is_binary_column(table, column)
+            if target_binary and not binary:
+                _convert_column_type(table, column, to_binary=True)
+                binary = True
+            total, changed, before, after = _rewrite_column(table, column, args.codec, binary, args.batch)
+            if binary and not target_binary and engine.dialect.name != "sqlite":
+                _convert_column_type(table, column, to_binary=False)
+            ratio = after / before if before else 1.0
+            print(f"✅ {table}.{column}: {total} 行，改写 {changed} 行，"
+                  f"{before / 1024 / 1024:.2f}MB -> {after / 1024 / 1024:.2f}MB（{ratio:.0%}）")
+
+        if args.vacuum and engine.dialect.name == "sqlite":
+            print("正在执行 VACUUM...")
+            with engine.connect() as conn:
+                conn.execute(text("VACUUM"))
+        print(f"✅ 完成，耗时 {time.perf_counter() - start:.1f}s；请将 TEXT_COMPRESSION 设置为 {args.codec} 后启动应用")
+    except Exception as e:
+        print(f"\n❌ 迁移失败: {e}")
+        logger.error(f"大文本列压缩迁移失败: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+数据库结构迁移
+
+新数据库由 Base.metadata.create_all 直接建出最新结构；已有的数据库通过这里的迁移补齐。
+迁移只使用 SQLAlchemy 的结构检查和可移植的 DDL，SQLite、MySQL、PostgreSQL 均可执行。
+每个迁移有递增的版本号，执行成功后记录到 schema_migrations 表，已执行的版本不会重复执行。
+迁移需要幂等：先检查列/索引是否存在，新库上执行时不做任何修改；
+某个迁移失败时中止后续迁移，下次启动会重新执行该版本。
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, bindparam, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from utils.logger import logger
+
+
+def _add_configs_name_column(conn: Connection):
+    """configs 表添加 name 列（多套配置按名称区分）"""
+    inspector = inspect(conn)
+    if 'configs' not in inspector.get_table_names():
+        return
+    columns = [col['name'] for col in inspector.get_columns('configs')]
+    if 'name' not in columns:
+        conn.execute(text("ALTER TABLE configs ADD COLUMN name VARCHAR(100)"))
+
+
+# (索引名, 表名, 列)：与 models.py 中 __table_args__ 声明的索引保持一致
+LIST_INDEXES = [
+    ('ix_topics_created_at', 'topics', ['created_at']),
+    ('ix_titles_topic_id_created_at', 'titles', ['topic_id', 'created_at']),
+    ('ix_titles_created_at', 'titles', ['created_at']),
+    ('ix_articles_title_id_created_at', 'articles', ['title_id', 'created_at']),
+    ('ix_articles_created_at', 'articles', ['created_at']),
+    ('ix_html_outputs_article_id_created_at', 'html_outputs', ['article_id', 'created_at']),
+    ('ix_html_outputs_created_at', 'html_outputs', ['created_at']),
+    ('ix_prompt_templates_category_is_default', 'prompt_templates', ['category', 'is_default']),
+]
+
+
+def _create_list_indexes(conn: Connection):
+    """为外键 + created_at、模板分类 + 默认标记创建复合索引"""
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    metadata = MetaData()
+    for index_name, table, columns in LIST_INDEXES:
+        if table not in tables:
+            continue
+        if index_name in {index['name'] for index in inspector.get_indexes(table)}:
+            continue
+        reflected = Table(table, metadata, autoload_with=conn)
+        Index(index_name, *[reflected.c[column] for column in columns]).create(conn)
+    # 更新统计信息，让查询优化器立即使用新索引（MySQL 会自动维护）
+    if conn.dialect.name in ("sqlite", "postgresql"):
+        conn.execute(text("ANALYZE"))
+
+
+def _add_job_worker_id_column(conn: Connection):
+    """generation_jobs 表添加 worker_id 列（记录执行任务的进程）"""
+    inspector = inspect(conn)
+    if 'generation_jobs' not in inspector.get_table_names():
+        return
+    columns = [col['name'] for col in inspector.get_columns('generation_jobs')]
+    if 'worker_id' not in columns:
+        conn.execute(text("ALTER TABLE generation_jobs ADD COLUMN worker_id VARCHAR(100)"))
+
+
+PROMPT_TABLES = ('titles', 'articles', 'html_outputs')
+PROMPT_DEDUP_BATCH = 500
+
+
+def _dedup_prompts(conn: Connection):
+    """
+    提示词去重存储：新建 prompt_blobs 表，标题/短文/HTML 表添加 prompt_hash 列，
+    把已有记录的 prompt_text 按内容哈希迁移到 prompt_blobs（相同提示词只存一份），并清空原列
+    """
+    from models import PromptBlob
+    from services.prompt_blob_service import compute_prompt_hash, compress_prompt
+
+    PromptBlob.__table__.create(conn, checkfirst=True)
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    metadata = MetaData()
+    blobs = Table('prompt_blobs', metadata, autoload_with=conn)
+    stored = set()
+    for table in PROMPT_TABLES:
+        if table not in tables:
+            continue
+        if 'prompt_hash' not in [col['name'] for col in inspector.get_columns(table)]:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN prompt_hash VARCHAR(64)"))
+        reflected = Table(table, metadata, autoload_with=conn)
+        index_name = f"ix_{table}_prompt_hash"
+        if index_name not in {index['name'] for index in inspect(conn).get_indexes(table)}:
+            Index(index_name, reflected.c.prompt_hash).create(conn)
+
+        # 按 id 分批处理，避免一次把所有提示词读入内存
+        last_id = 0
+        migrated = 0
+        while True:
+            rows = conn.execute(
+                select(reflected.c.id, reflected.c.prompt_text)
+                .where(reflected.c.prompt_hash.is_(None), reflected.c.id > last_id)
+                .order_by(reflected.c.id).limit(PROMPT_DEDUP_BATCH)
+            ).all()
+            if not rows:
+                break
+            hashes = {row.id: compute_prompt_hash(row.prompt_text or "") for row in rows}
+            texts = {hashes[row.id]: row.prompt_text or "" for row in rows}
+            new_hashes = set(texts) - stored
+            if new_hashes:
+                existing = conn.execute(select(blobs.c.hash).where(blobs.c.hash.in_(new_hashes))).scalars().all()
+                stored.update(existing)
+                missing = new_hashes - stored
+                if missing:
+                    conn.execute(blobs.insert(), [
+                        {'hash': h, 'content': compress_prompt(texts[h]), 'size': len(texts[h]), 'created_at': datetime.now()}
+                        for h in missing
+                    ])
+                    stored.update(missing)
+            conn.execute(
+                reflected.update().where(reflected.c.id == bindparam('row_id')).values(prompt_hash=bindparam('hash'), prompt_text=""),
+                [{'row_id': row_id, 'hash': h} for row_id, h in hashes.items()]
+            )
+            last_id = rows[-1].id
+            migrated += len(rows)
+        if migrated:
+            logger.info(f"{table}: {migrated} 条记录的提示词已迁移到 prompt_blobs")
+    if stored:
+        logger.info(f"prompt_blobs 共 {len(stored)} 个不同的提示词")
+
+
+def _create_publish_job_index(conn: Connection):
+    """publish_records.job_id 索引（按任务汇总多公众号发布结果）"""
+    inspector = inspect(conn)
+    if 'publish_records' not in inspector.get_table_names():
+        return
+    if 'ix_publish_records_job_id' in {index['name'] for index in inspector.get_indexes('publish_records')}:
+        return
+    reflected = Table('publish_records', MetaData(), autoload_with=conn)
+    Index('ix_publish_records_job_id', reflected.c.job_id).create(conn)
+
+
+ARTICLE_PREVIEW_BATCH = 500
+
+
+def _add_article_preview_column(conn: Connection):
+    """articles 表添加 preview 列，并为已有短文填充预览（压缩存储的短文在这里解压一次，之后列表不再读取全文）"""
+    from models import ARTICLE_PREVIEW_LENGTH
+    from utils.compression import decompress_text
+
+    inspector = inspect(conn)
+    if 'articles' not in inspector.get_table_names():
+        return
+    if 'preview' not in [col['name'] for col in inspector.get_columns('articles')]:
+        conn.execute(text(f"ALTER TABLE articles ADD COLUMN preview VARCHAR({ARTICLE_PREVIEW_LENGTH})"))
+    articles = Table('articles', MetaData(), autoload_with=conn)
+
+    # 按 id 分批处理，避免一次把所有短文读入内存
+    last_id = 0
+    filled = 0
+    while True:
+        rows = conn.execute(
+            select(articles.c.id, articles.c.article_text)
+            .where(articles.c.preview.is_(None), articles.c.id > last_id)
+            .order_by(articles.c.id).limit(ARTICLE_PREVIEW_BATCH)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            articles.update().where(articles.c.id == bindparam('row_id')).values(preview=bindparam('preview')),
+            [{'row_id': row.id, 'preview': (decompress_text(row.article_text) or "")[:ARTICLE_PREVIEW_LENGTH]} for row in rows]
+        )
+        last_id = rows[-1].id
+        filled += len(rows)
+    if filled:
+        logger.info(f"articles: {filled} 条短文已填充预览")
+
+
+# (版本号, 描述, 迁移函数)，只能追加，不能修改已发布的版本
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "configs 表添加 name 列", _add_configs_name_column),
+    (2, "列表查询复合索引", _create_list_indexes),
+    (3, "generation_jobs 表添加 worker_id 列", _add_job_worker_id_column),
+    (4, "提示词去重存储到 prompt_blobs", _dedup_prompts),
+    (5, "publish_records 表 job_id 索引", _create_publish_job_index),
+    (6, "articles 表添加 preview 列", _add_article_preview_column),
+]
+
+_migrations_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _migrations_metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _ensure_migrations_table(engine: Engine):
+    """创建迁移记录表"""
+    schema_migrations.create(bind=engine, checkfirst=True)
+
+
+def get_applied_versions(engine: Engine) -> List[int]:
+    """获取已执行的迁移版本号"""
+    _ensure_migrations_table(engine)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(schema_migrations.select().order_by(schema_migrations.c.version))]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """
+    按版本号顺序执行尚未执行的迁移
+
+    :param engine: 数据库引擎
+    :return: 本次执行的迁移版本号列表
+    """
+    applied = set(get_applied_versions(engine))
+    executed = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"执行数据库迁移 {version}: {description}")
+        try:
+            with engine.begin() as conn:
+                migrate(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, description=description, applied_at=datetime.now()
+                ))
+        except Exception as e:
+            # 多个进程同时启动时（如 debug 模式的 reloader），其他进程可能已经执行了同一版本
+            if version in get_applied_versions(engine):
+                logger.info(f"数据库迁移 {version} 已由其他进程执行，跳过")
+                continue
+            logger.error(f"数据库迁移 {version} 失败，中止后续迁移: {e}", exc_info=True)
+            raise
+        executed.append(version)
+    if executed:
+        logger.info(f"数据库迁移完成: {executed}")
+    return executed
@@ -1,15 +1,27 @@
 """
 数据模型定义
 """
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, UniqueConstraint, Index, LargeBinary
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import relationship, deferred, validates
 from datetime import datetime
 from database import Base
+from utils.compression import CompressedText
+
+# MySQL 的 TEXT 最多 64KB，生成内容和提示词可能超出，在 MySQL 上使用 LONGTEXT；其他数据库仍为 TEXT
+LongText = Text().with_variant(mysql.LONGTEXT(), "mysql")
+LongBinary = LargeBinary().with_variant(mysql.LONGBLOB(), "mysql")
+
+# 短文列表预览的长度（字符）
+ARTICLE_PREVIEW_LENGTH = 100
 
 
 class Topic(Base):
     """主题表"""
     __tablename__ = "topics"
+    __table_args__ = (
+        Index('ix_topics_created_at', 'created_at'),  # 列表按创建时间倒序
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     topic_text = Column(String(500), nullable=False)
@@ -23,11 +35,16 @@ class Topic(Base):
 class Title(Base):
     """标题表"""
     __tablename__ = "titles"
+    __table_args__ = (
+        Index('ix_titles_topic_id_created_at', 'topic_id', 'created_at'),  # 按主题查询标题并按时间排序
+        Index('ix_titles_created_at', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     topic_id = Column(Integer, ForeignKey("topics.id"), nullable=False)
     title_text = Column(String(200), nullable=False)
-    prompt_text = Column(Text, nullable=False)  # 生成标题时使用的完整提示词
+    prompt_text = Column(LongText, nullable=False, default="")  # 旧数据的完整提示词；新数据为空，提示词存放在 prompt_blobs 中
+    prompt_hash = Column(String(64), ForeignKey("prompt_blobs.hash"), nullable=True, index=True)  # 生成标题时使用的完整提示词（prompt_blobs 的哈希）
     prompt_template_id = Column(Integer, ForeignKey("prompt_templates.id"), nullable=True)  # 使用的提示词模板ID
     created_at = Column(DateTime, default=datetime.now)
     selected = Column(Boolean, default=False)
@@ -41,11 +58,17 @@ class Title(Base):
 class Article(Base):
     """短文表"""
     __tablename__ = "articles"
+    __table_args__ = (
+        Index('ix_articles_title_id_created_at', 'title_id', 'created_at'),  # 按标题查询短文并按时间排序
+        Index('ix_articles_created_at', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title_id = Column(Integer, ForeignKey("titles.id"), nullable=False)
-    article_text = Column(Text, nullable=False)
-    prompt_text = Column(Text, nullable=False)  # 生成短文时使用的完整提示词
+    article_text = deferred(Column(CompressedText, nullable=False))  # 访问时才加载并解压（TEXT_COMPRESSION 开启时压缩存储）
+    preview = Column(String(ARTICLE_PREVIEW_LENGTH), nullable=True)  # 短文前 ARTICLE_PREVIEW_LENGTH 个字符（明文），列表预览不读取全文
+    prompt_text = Column(LongText, nullable=False, default="")  # 旧数据的完整提示词；新数据为空，提示词存放在 prompt_blobs 中
+    prompt_hash = Column(String(64), ForeignKey("prompt_blobs.hash"), nullable=True, index=True)  # 生成短文时使用的完整提示词（prompt_blobs 的哈希）
     prompt_template_id = Column(Integer, ForeignKey("prompt_templates.id"), nullable=True)  # 使用的提示词模板ID
     created_at = Column(DateTime, default=datetime.now)
     selected = Column(Boolean, default=False)
@@ -55,15 +78,26 @@ class Article(Base):
     html_outputs = relationship("HTMLOutput", back_populates="article", cascade="all, delete-orphan")
     prompt_template = relationship("PromptTemplate", foreign_keys=[prompt_template_id])
 
+    @validates('article_text')
+    def _sync_preview(self, key, value):
+        """写入短文时同步更新预览"""
+        self.preview = value[:ARTICLE_PREVIEW_LENGTH] if value is not None else None
+        return value
+
 
 class HTMLOutput(Base):
     """HTML输出表"""
     __tablename__ = "html_outputs"
+    __table_args__ = (
+        Index('ix_html_outputs_article_id_created_at', 'article_id', 'created_at'),  # 按短文查询HTML并按时间排序
+        Index('ix_html_outputs_created_at', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     article_id = Column(Integer, ForeignKey("articles.id"), nullable=False)
-    html_content = Column(Text, nullable=False)
-    prompt_text = Column(Text, nullable=False)  # 生成HTML时使用的完整提示词
+    html_content = deferred(Column(CompressedText, nullable=False))  # 访问时才加载并解压（TEXT_COMPRESSION 开启时压缩存储）
+    prompt_text = Column(LongText, nullable=False, default="")  # 旧数据的完整提示词；新数据为空，提示词存放在 prompt_blobs 中
+    prompt_hash = Column(String(64), ForeignKey("prompt_blobs.hash"), nullable=True, index=True)  # 生成HTML时使用的完整提示词（prompt_blobs 的哈希）
     prompt_template_id = Column(Integer, ForeignKey("prompt_templates.id"), nullable=True)  # 使用的提示词模板ID
     created_at = Column(DateTime, default=datetime.now)
 
@@ -72,15 +106,28 @@ class HTMLOutput(Base):
     prompt_template = relationship("PromptTemplate", foreign_keys=[prompt_template_id])
 
 
+class PromptBlob(Base):
+    """提示词内容表（按内容哈希去重，同一个提示词只存一份压缩后的文本）"""
+    __tablename__ = "prompt_blobs"
+
+    hash = Column(String(64), primary_key=True)  # 提示词文本的 SHA-256
+    content = Column(LongBinary, nullable=False)  # zlib 压缩后的 UTF-8 文本
+    size = Column(Integer, nullable=False)  # 原文长度（字符数）
+    created_at = Column(DateTime, default=datetime.now)
+
+
 class PromptTemplate(Base):
     """提示词模板表"""
     __tablename__ = "prompt_templates"
+    __table_args__ = (
+        Index('ix_prompt_templates_category_is_default', 'category', 'is_default'),  # 查找分类下的默认模板
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     category = Column(String(50), nullable=False, index=True)  # title/article/html
     name = Column(String(200), nullable=False)  # 模板名称
     description = Column(Text, nullable=True)  # 模板描述
-    content = Column(Text, nullable=False)  # 模板内容
+    content = Column(LongText, nullable=False)  # 模板内容
     is_default = Column(Boolean, default=False)  # 是否为默认模板
     file_path = Column(String(500), nullable=True)  # 文件路径（如果从文件加载）
     created_at = Column(DateTime, default=datetime.now)
@@ -102,3 +149,78 @@ class Config(Base):
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+
+
+class GenerationJob(Base):
+    """生成任务表（异步任务队列，进程重启后可从数据库恢复）"""
+    __tablename__ = "generation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(20), nullable=False, index=True)  # title/article/html/article_batch/pipeline/coze_publish/coze_publish_fanout
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending/running/completed/failed
+    params = Column(Text, nullable=False)  # 任务参数（JSON）
+    result = Column(LongText, nullable=True)  # 任务结果（JSON）
+    error = Column(Text, nullable=True)  # 失败原因
+    attempts = Column(Integer, default=0)  # 已执行次数
+    worker_id = Column(String(100), nullable=True)  # 执行该任务的进程（主机名:进程号），多实例共享数据库时用于判断任务是否中断
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class PipelineRun(Base):
+    """流水线运行表（主题 → 标题 → 短文 → HTML → Coze 发布，每个阶段完成后记录检查点）"""
+    __tablename__ = "pipeline_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    topic_text = Column(String(500), nullable=False)
+    topic_id = Column(Integer, ForeignKey("topics.id"), nullable=True)  # 主题创建后记录
+    status = Column(String(20), nullable=False, default="pending")  # pending/running/completed/failed
+    stage = Column(String(20), nullable=False, default="topic")  # topic/titles/items/done：下一个待执行的阶段
+    params = Column(Text, nullable=False)  # 运行参数（JSON）
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # 关系
+    items = relationship("PipelineItem", back_populates="run", cascade="all, delete-orphan")
+
+
+class PipelineItem(Base):
+    """流水线条目表（每个选中的标题一条，记录短文/HTML/发布各阶段的检查点）"""
+    __tablename__ = "pipeline_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("pipeline_runs.id"), nullable=False, index=True)
+    title_id = Column(Integer, ForeignKey("titles.id"), nullable=False)
+    stage = Column(String(20), nullable=False, default="article")  # article/html/publish/done：下一个待执行的阶段
+    status = Column(String(20), nullable=False, default="pending")  # pending/running/completed/failed
+    article_id = Column(Integer, ForeignKey("articles.id"), nullable=True)
+    html_id = Column(Integer, ForeignKey("html_outputs.id"), nullable=True)
+    publish_result = Column(LongText, nullable=True)  # Coze 返回结果（JSON）
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # 关系
+    run = relationship("PipelineRun", back_populates="items")
+
+
+class PublishRecord(Base):
+    """Coze 发布记录表（后台发布，逐条记录工作流事件进度和最终结果）"""
+    __tablename__ = "publish_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+    title_id = Column(Integer, ForeignKey("titles.id"), nullable=False, index=True)
+    html_id = Column(Integer, ForeignKey("html_outputs.id"), nullable=True)  # 生成或复用 HTML 后记录
+    job_id = Column(Integer, ForeignKey("generation_jobs.id"), nullable=True, index=True)  # 执行发布的后台任务（多公众号发布时同一批记录共用）
+    wechat_config_name = Column(String(100), nullable=True)
+    params = Column(Text, nullable=False)  # 发布参数（JSON）
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending/running/completed/failed
+    event_count = Column(Integer, default=0)  # 已收到的工作流事件数
+    last_event = Column(Text, nullable=True)  # 最近一个工作流事件（JSON，截断）
+    result = Column(LongText, nullable=True)  # Coze 返回结果（JSON）
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
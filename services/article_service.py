@@ -1,51 +1,46 @@
 """
 短文生成服务
 """
-from typing import Tuple, Optional
-import os
-from utils.api import get_gemini_response
-from database import get_db_session
-from models import Article
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple, Optional, Iterator
+from config import ARTICLE_BATCH_CONCURRENCY, ASYNC_HTTP_ENABLED, ARTICLE_TEMPERATURE, ARTICLE_MAX_TOKENS
+from utils.api import get_gemini_response, stream_gemini_response, async_get_gemini_response
+from utils.async_runtime import run_async
+from utils.http_client import async_http_available
+from database import get_db_session, run_write
+from models import Article, Title
+from services.prompt_service import resolve_prompt_template
+from services.prompt_blob_service import store_prompt
 from utils.logger import logger
-def load_prompt_template(template_id: Optional[int] = None) -> str:
-    """读取提示词模板"""
-    from database import get_db_session
-    from models import PromptTemplate
+from utils.metrics import DB_SAVE_SECONDS
+from utils.prompt_budget import output_token_budget
+from utils.tracing import bind_span, traced
+
+
+def build_article_prompt(title: str, template_id: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """
+    组装短文生成的完整提示词
     
-    db = get_db_session()
-    try:
-        if template_id:
-            template = db.query(PromptTemplate).filter(PromptTemplate.id == template_id).first()
-            if template:
-                return template.content
-        
-        # 使用默认模板
-        template = db.query(PromptTemplate).filter(
-            PromptTemplate.category == "article",
-            PromptTemplate.is_default == True
-        ).first()
-        
-        if not template:
-            # 如果没有默认模板，返回第一个
-            template = db.query(PromptTemplate).filter(
-                PromptTemplate.category == "article"
-            ).first()
-        
-        if template:
-            return template.content
-    finally:
-        db.close()
+    :param title: 文章标题（主题）
+    :param template_id: 提示词模板ID（可选）
+    :return: (完整提示词, 模板ID)
+    """
+    # 1. 从模板注册表解析模板内容和模板ID（内存查找，不访问数据库）
+    template_content, used_template_id = resolve_prompt_template("article", template_id)
+    logger.debug(f"提示词模板解析完成: template_id={used_template_id}, 长度: {len(template_content)} 字符")
     
-    # 向后兼容：如果数据库中没有，尝试从文件加载
-    PROMPT_FILE_PATH = "qx-短文提示词"
-    if os.path.exists(PROMPT_FILE_PATH):
-        with open(PROMPT_FILE_PATH, "r", encoding="utf-8") as f:
-            return f.read()
+    # 2. 替换主题占位符
+    prompt = template_content.replace("[在此输入你的主题]", title)
     
-    raise FileNotFoundError("找不到提示词模板")
+    # 3. 添加明确指令：只返回最终的中文短文，不要包含思考过程
+    prompt += "\n\n**重要提示**：请直接输出最终的中文短文，不要包含任何思考过程、英文内容或中间步骤。只返回按照上述框架创作的中文短文正文。"
+    
+    return prompt, used_template_id
 
 
-def generate_article(title: str, template_id: Optional[int] = None) -> Tuple[str, str, Optional[int]]:
+@traced()
+def generate_article(title: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[str, str, Optional[int]]:
     """
     生成短文
     
@@ -53,43 +48,48 @@ def generate_article(title: str, template_id: Optional[int] = None) -> Tuple[str
     :param template_id: 提示词模板ID（可选）
     :return: (短文内容, 完整提示词, 模板ID)
     """
-    # 1. 读取模板
-    template_content = load_prompt_template(template_id)
-    
-    # 2. 获取模板ID
-    from database import get_db_session
-    from models import PromptTemplate
+    prompt, used_template_id = build_article_prompt(title, template_id)
     
-    db = get_db_session()
-    try:
-        if template_id:
-            used_template_id = template_id
-        else:
-            # 获取默认模板ID
-            default_template = db.query(PromptTemplate).filter(
-                PromptTemplate.category == "article",
-                PromptTemplate.is_default == True
-            ).first()
-            if not default_template:
-                default_template = db.query(PromptTemplate).filter(
-                    PromptTemplate.category == "article"
-                ).first()
-            used_template_id = default_template.id if default_template else None
-    finally:
-        db.close()
+    # 调用API生成短文（按提示词长度在 token 预算内选择 maxOutputTokens，提示词过长时不发出请求）
+    max_tokens = output_token_budget(prompt, ARTICLE_MAX_TOKENS)
+    article_text = get_gemini_response(prompt, temperature=ARTICLE_TEMPERATURE, max_tokens=max_tokens,
+                                       use_cache=use_cache, stage="article")
     
-    # 3. 替换主题占位符
-    prompt = template_content.replace("[在此输入你的主题]", title)
-    
-    # 4. 添加明确指令：只返回最终的中文短文，不要包含思考过程
-    prompt += "\n\n**重要提示**：请直接输出最终的中文短文，不要包含任何思考过程、英文内容或中间步骤。只返回按照上述框架创作的中文短文正文。"
-    
-    # 5. 调用API生成短文
-    article_text = get_gemini_response(prompt, temperature=0.7, max_tokens=8192)
+    return article_text, prompt, used_template_id
+
+
+@traced()
+async def async_generate_article(title: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[str, str, Optional[int]]:
+    """
+    generate_article 的协程版本（在事件循环中调用 Gemini，不占用线程）
     
+    :param title: 文章标题（主题）
+    :param template_id: 提示词模板ID（可选）
+    :return: (短文内容, 完整提示词, 模板ID)
+    """
+    prompt, used_template_id = build_article_prompt(title, template_id)
+    max_tokens = output_token_budget(prompt, ARTICLE_MAX_TOKENS)
+    article_text = await async_get_gemini_response(prompt, temperature=ARTICLE_TEMPERATURE, max_tokens=max_tokens,
+                                                   use_cache=use_cache, stage="article")
     return article_text, prompt, used_template_id
 
 
+def stream_article(title: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[Iterator[str], str, Optional[int]]:
+    """
+    流式生成短文
+    
+    :param title: 文章标题（主题）
+    :param template_id: 提示词模板ID（可选）
+    :return: (文本片段生成器, 完整提示词, 模板ID)
+    """
+    prompt, used_template_id = build_article_prompt(title, template_id)
+    max_tokens = output_token_budget(prompt, ARTICLE_MAX_TOKENS)
+    chunks = stream_gemini_response(prompt, temperature=ARTICLE_TEMPERATURE, max_tokens=max_tokens, use_cache=use_cache,
+                                    stage="article")
+    return chunks, prompt, used_template_id
+
+
+@traced(attrs=("title_id",))
 def save_article_to_db(title_id: int, article_text: str, prompt_text: str, template_id: Optional[int] = None) -> int:
     """
     保存短文和提示词到数据库
@@ -100,23 +100,130 @@ def save_article_to_db(title_id: int, article_text: str, prompt_text: str, templ
     :return: 保存的短文ID
     """
     logger.info(f"开始保存短文到数据库: title_id={title_id}, article_length={len(article_text)}")
-    db = get_db_session()
-    try:
+    
+    def write(db):
         article = Article(
             title_id=title_id,
             article_text=article_text,
-            prompt_text=prompt_text,
+            prompt_text="",
+            prompt_hash=store_prompt(db, prompt_text),
             prompt_template_id=template_id,
             selected=False
         )
         db.add(article)
-        db.commit()
-        logger.info(f"短文保存成功，ID: {article.id}")
+        db.flush()  # 获取ID
         return article.id
+    
+    try:
+        # 写操作交给单写线程提交，避免并发保存时抢锁
+        with DB_SAVE_SECONDS.time("articles"):
+            article_id = run_write(write)
+        logger.info(f"短文保存成功，ID: {article_id}")
+        return article_id
     except Exception as e:
-        db.rollback()
         logger.error(f"保存短文失败: {e}", exc_info=True)
         raise e
+
+
+
+def _load_title_texts(title_ids: List[int]) -> Dict[int, str]:
+    """一次查询取出全部标题文本"""
+    db = get_db_session()
+    try:
+        return dict(db.query(Title.id, Title.title_text).filter(Title.id.in_(title_ids)).all())
     finally:
         db.close()
 
+
+def _failed_result(title_id: int, error: str) -> Dict:
+    return {'title_id': title_id, 'success': False, 'article_id': None, 'article_text': None, 'error': error}
+
+
+def generate_articles_batch(title_ids: List[int], template_id: Optional[int] = None, use_cache: bool = True,
+                            concurrency: Optional[int] = None) -> List[Dict]:
+    """
+    批量为标题生成短文（并发数受限）
+    
+    每篇短文生成后立即单独保存（一篇一个事务），单个标题失败不影响其他标题。
+    ASYNC_HTTP_ENABLED 开启且安装了 httpx 时改为在共享事件循环中执行 async_generate_articles_batch。
+    
+    :param title_ids: 标题ID列表（重复的ID只生成一次）
+    :param template_id: 提示词模板ID（可选）
+    :param use_cache: 是否使用响应缓存
+    :param concurrency: 并发数，默认且最大为 ARTICLE_BATCH_CONCURRENCY
+    :return: 与 title_ids 顺序一致的结果列表，每项包含 title_id/success/article_id/article_text/error
+    """
+    if ASYNC_HTTP_ENABLED and async_http_available():
+        return run_async(async_generate_articles_batch(title_ids, template_id, use_cache, concurrency))
+    
+    title_ids = list(dict.fromkeys(title_ids))
+    workers = max(1, min(concurrency or ARTICLE_BATCH_CONCURRENCY, ARTICLE_BATCH_CONCURRENCY))
+    logger.info(f"开始批量生成短文: title_ids={title_ids}, template_id={template_id}, concurrency={workers}")
+    
+    title_texts = _load_title_texts(title_ids)
+    results: Dict[int, Dict] = {}
+    for title_id in title_ids:
+        if title_id not in title_texts:
+            results[title_id] = _failed_result(title_id, '标题不存在')
+    
+    def generate_one(title_id: int) -> Dict:
+        article_text, prompt, used_template_id = generate_article(title_texts[title_id], template_id, use_cache=use_cache)
+        article_id = save_article_to_db(title_id, article_text, prompt, used_template_id)
+        return {'title_id': title_id, 'success': True, 'article_id': article_id,
+                'article_text': article_text, 'error': None}
+    
+    pending_ids = [title_id for title_id in title_ids if title_id in title_texts]
+    if pending_ids:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pending_ids)), thread_name_prefix="article-batch") as executor:
+            futures = {executor.submit(bind_span(generate_one), title_id): title_id for title_id in pending_ids}
+            for future in as_completed(futures):
+                title_id = futures[future]
+                try:
+                    results[title_id] = future.result()
+                    logger.info(f"批量生成短文成功: title_id={title_id}, article_id={results[title_id]['article_id']}")
+                except Exception as e:
+                    logger.error(f"批量生成短文失败: title_id={title_id}, error={e}", exc_info=True)
+                    results[title_id] = _failed_result(title_id, str(e))
+    
+    succeeded = sum(1 for r in results.values() if r['success'])
+    logger.info(f"批量生成短文完成: 成功 {succeeded}/{len(title_ids)}")
+    return [results[title_id] for title_id in title_ids]
+
+
+async def async_generate_articles_batch(title_ids: List[int], template_id: Optional[int] = None, use_cache: bool = True,
+                                        concurrency: Optional[int] = None) -> List[Dict]:
+    """
+    generate_articles_batch 的协程版本：所有 Gemini 调用在同一个事件循环中并发，数据库读写交给线程执行
+    
+    :param title_ids: 标题ID列表（重复的ID只生成一次）
+    :param template_id: 提示词模板ID（可选）
+    :param use_cache: 是否使用响应缓存
+    :param concurrency: 并发数，默认且最大为 ARTICLE_BATCH_CONCURRENCY
+    :return: 与 title_ids 顺序一致的结果列表，每项包含 title_id/success/article_id/article_text/error
+    """
+    title_ids = list(dict.fromkeys(title_ids))
+    workers = max(1, min(concurrency or ARTICLE_BATCH_CONCURRENCY, ARTICLE_BATCH_CONCURRENCY))
+    logger.info(f"开始异步批量生成短文: title_ids={title_ids}, template_id={template_id}, concurrency={workers}")
+    
+    title_texts = await asyncio.to_thread(_load_title_texts, title_ids)
+    semaphore = asyncio.Semaphore(workers)
+    
+    async def generate_one(title_id: int) -> Dict:
+        if title_id not in title_texts:
+            return _failed_result(title_id, '标题不存在')
+        try:
+            async with semaphore:
+                article_text, prompt, used_template_id = await async_generate_article(
+                    title_texts[title_id], template_id, use_cache=use_cache)
+            article_id = await asyncio.to_thread(save_article_to_db, title_id, article_text, prompt, used_template_id)
+        except Exception as e:
+            logger.error(f"批量生成短文失败: title_id={title_id}, error={e}", exc_info=True)
+            return _failed_result(title_id, str(e))
+        logger.info(f"批量生成短文成功: title_id={title_id}, article_id={article_id}")
+        return {'title_id': title_id, 'success': True, 'article_id': article_id,
+                'article_text': article_text, 'error': None}
+    
+    results = await asyncio.gather(*(generate_one(title_id) for title_id in title_ids))
+    succeeded = sum(1 for r in results if r['success'])
+    logger.info(f"批量生成短文完成: 成功 {succeeded}/{len(title_ids)}")
+    return list(results)
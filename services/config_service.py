@@ -0,0 +1,52 @@
+"""
+系统配置服务
+"""
+from typing import Dict, List, Optional, Tuple
+from database import get_db_session
+from models import Config
+from utils.logger import logger
+
+
+WECHAT_CONFIG_KEYS = ('WECHAT_APP_ID', 'WECHAT_APP_SECRET')
+
+
+def get_wechat_credentials(config_name: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    获取微信配置（一次查询同时取出 AppID 和 AppSecret）
+
+    :param config_name: 配置名称，为空时返回 (None, None)
+    :return: (AppID, AppSecret)，缺失的项为 None
+    """
+    if not config_name:
+        return None, None
+    return get_wechat_credentials_bulk([config_name])[config_name]
+
+
+def get_wechat_credentials_bulk(config_names: List[str]) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    批量获取多个微信配置（一次查询取出所有配置的 AppID 和 AppSecret）
+
+    :param config_names: 配置名称列表
+    :return: 配置名称 -> (AppID, AppSecret)，缺失的项为 None
+    """
+    names = [name for name in dict.fromkeys(config_names) if name]
+    if not names:
+        return {}
+
+    db = get_db_session()
+    try:
+        rows = db.query(Config.name, Config.key, Config.value).filter(
+            Config.name.in_(names),
+            Config.key.in_(WECHAT_CONFIG_KEYS)
+        ).all()
+    finally:
+        db.close()
+
+    values: Dict[str, Dict[str, str]] = {name: {} for name in names}
+    for name, key, value in rows:
+        values[name][key] = value
+    for name in names:
+        for key in WECHAT_CONFIG_KEYS:
+            if key not in values[name]:
+                logger.warning(f"未找到微信配置: name='{name}', key='{key}'")
+    return {name: (values[name].get('WECHAT_APP_ID'), values[name].get('WECHAT_APP_SECRET')) for name in names}
@@ -1,14 +1,25 @@
 """
 Coze API调用服务
+
+call_coze_api 为同步调用（requests，共享连接池）；async_call_coze_api 为协程版本（httpx，需安装），
+两者共用请求构造、SSE 事件解析、错误检查和熔断器。
 """
 import requests
 import os
 import json
-from typing import Dict, Optional
-from utils.logger import logger
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple
+from config import COZE_CONNECT_TIMEOUT, COZE_READ_TIMEOUT
+from utils.circuit_breaker import CircuitCall, get_circuit_breaker
+from utils.http_client import get_http_session, get_async_http_client, httpx
+from utils.logger import logger, truncate
+from utils.metrics import COZE_REQUEST_SECONDS, COZE_REQUESTS
+from utils.tracing import trace_headers, traced
 
 # Coze API配置
-COZE_API_URL = "https://api.coze.cn/v1/workflow/stream_run"
+COZE_API_URL = os.getenv("COZE_API_URL", "https://api.coze.cn/v1/workflow/stream_run")
 # workflow_id 可以从环境变量获取，如果没有则使用默认值
 COZE_WORKFLOW_ID = os.getenv("COZE_WORKFLOW_ID", "7590055614313087003")
 
@@ -33,25 +44,239 @@ def _get_coze_authorization() -> str:
     return ""
 
 
-def call_coze_api(title: str, content: str, wechat_app_id: Optional[str] = None, wechat_app_secret: Optional[str] = None) -> Dict:
+def _circuit_guard() -> ContextManager[CircuitCall]:
+    """在 Coze 熔断器保护下执行一次请求；熔断时立即抛出 CircuitOpenError"""
+    breaker = get_circuit_breaker("coze")
+    if breaker is None:
+        return nullcontext(CircuitCall())
+    return breaker.guard()
+
+
+@contextmanager
+def _call_metrics() -> Iterator[None]:
+    """记录一次 Coze 调用的耗时和结果（success / error）"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        COZE_REQUEST_SECONDS.observe(time.perf_counter() - started)
+        COZE_REQUESTS.inc(outcome)
+
+
+def _parse_event_data(data_lines: List[str]) -> List[object]:
     """
-    调用Coze API接口
-    
-    :param title: 标题
-    :param content: 内容（HTML）
-    :param wechat_app_id: 微信AppID（可选）
-    :param wechat_app_secret: 微信AppSecret（可选）
-    :return: API响应结果字典
+    解析一个事件的 data 行：多行拼接后是 JSON 时作为一条数据；
+    否则（事件之间缺少空行分隔）与原解析方式一致，每个 data 行各作为一条数据
+    """
+    data_str = "\n".join(data_lines).strip()
+    if not data_str:
+        return []
+    try:
+        return [json.loads(data_str)]
+    except ValueError:
+        pass
+    items = []
+    for line in data_lines:
+        line = line.strip()
+        if line:
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(line)
+    return items
+
+
+class _SSEParser:
+    """增量解析 SSE 文本行：每输入一行返回该行结束的事件（空行结束一个事件）"""
+
+    def __init__(self):
+        self._fields: Dict[str, str] = {}
+        self._data_lines: List[str] = []
+
+    def feed(self, line: str) -> List[Dict]:
+        line = line.rstrip("\r")
+        if not line:
+            # 空行：一个事件结束
+            events = [{'id': self._fields.get('id'), 'event': self._fields.get('event'), 'data': data}
+                      for data in _parse_event_data(self._data_lines)]
+            self._fields, self._data_lines = {}, []
+            return events
+        name, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if name == "data":
+            self._data_lines.append(value)
+        elif name in ("id", "event"):
+            self._fields[name] = value
+        return []
+
+    def close(self) -> List[Dict]:
+        """输入结束：返回最后一个没有以空行结尾的事件"""
+        return self.feed("")
+
+
+def _iter_sse_events(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    按 SSE 格式把文本行解析为事件
+
+    :param lines: 响应文本行（可以是边接收边产生的生成器）
+    :return: 事件生成器，每个事件为 {'id', 'event', 'data'}，data 是 JSON 时解析为对象
+    """
+    parser = _SSEParser()
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+class _EventCollector:
+    """逐个处理工作流事件，结束后给出与原非流式解析一致的结果"""
+
+    def __init__(self, on_event: Optional[Callable[[Dict], None]]):
+        self.on_event = on_event
+        self._sse_data = []
+        self._error_data = None
+
+    def add(self, event: Dict):
+        data = event['data']
+        if logger.isEnabledFor(logging.INFO):
+            preview = json.dumps(data, ensure_ascii=False) if isinstance(data, (dict, list)) else str(data)
+            logger.info(f"  Coze 事件 #{len(self._sse_data)}: event={event['event']}, data={truncate(preview, 300)}")
+        if self.on_event:
+            self.on_event(event)
+        if event['event'] == "Error" and isinstance(data, dict):
+            self._error_data = data
+        self._sse_data.append(data)
+
+    def result(self) -> Optional[object]:
+        """
+        :return: 只有一个事件时为该事件的 data；多个事件时为 {'stream_data': [...]}；没有事件时为 None；
+                 有 Error 事件时为该事件的 data（包含 error_code / error_message，由调用方报错）
+        """
+        if self._error_data is not None:
+            return self._error_data
+        if not self._sse_data:
+            return None
+        logger.info(f"  解析SSE数据成功，共 {len(self._sse_data)} 条")
+        return self._sse_data[0] if len(self._sse_data) == 1 else {'stream_data': self._sse_data}
+
+
+def _collect_events(events: Iterator[Dict], on_event: Optional[Callable[[Dict], None]]) -> Optional[object]:
+    """逐个处理工作流事件，返回与原非流式解析一致的结果（见 _EventCollector.result）"""
+    collector = _EventCollector(on_event)
+    for event in events:
+        collector.add(event)
+    return collector.result()
+
+
+def _is_event_stream(status_code: int, headers) -> bool:
+    return status_code == 200 and "text/event-stream" in headers.get("Content-Type", "")
+
+
+def _read_response(response: requests.Response, on_event: Optional[Callable[[Dict], None]]) -> Tuple[Optional[object], str]:
+    """
+    读取并解析 Coze 响应（无论状态码如何）
+
+    text/event-stream 响应边接收边解析，每收到一个事件回调一次 on_event；
+    其他响应读取全文后依次尝试 JSON、SSE 文本、纯文本。
+
+    :return: (解析结果，纯文本时为 None；响应文本（流式响应只保留前 5000 个字符）)
+    """
+    if _is_event_stream(response.status_code, response.headers):
+        logger.info("检测到SSE流式响应，逐条读取事件")
+        raw_lines: List[str] = []
+        raw_size = 0
+
+        def lines() -> Iterator[str]:
+            nonlocal raw_size
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                if raw_size < 5000:
+                    raw_lines.append(line)
+                    raw_size += len(line) + 1
+                yield line
+
+        result = _collect_events(_iter_sse_events(lines()), on_event)
+        response_text = "\n".join(raw_lines)
+        if isinstance(result, dict) and 'stream_data' in result:
+            result['raw_response'] = response_text[:1000]
+        return result, response_text
+
+    return _parse_text_response(response.text, on_event)
+
+
+async def _async_read_response(response: "httpx.Response",
+                               on_event: Optional[Callable[[Dict], None]]) -> Tuple[Optional[object], str]:
+    """_read_response 的协程版本：text/event-stream 响应边接收边解析"""
+    if _is_event_stream(response.status_code, response.headers):
+        logger.info("检测到SSE流式响应，逐条读取事件")
+        raw_lines: List[str] = []
+        raw_size = 0
+        parser = _SSEParser()
+        collector = _EventCollector(on_event)
+        async for line in response.aiter_lines():
+            if raw_size < 5000:
+                raw_lines.append(line)
+                raw_size += len(line) + 1
+            for event in parser.feed(line):
+                collector.add(event)
+        for event in parser.close():
+            collector.add(event)
+        result = collector.result()
+        response_text = "\n".join(raw_lines)
+        if isinstance(result, dict) and 'stream_data' in result:
+            result['raw_response'] = response_text[:1000]
+        return result, response_text
+
+    await response.aread()
+    return _parse_text_response(response.text, on_event)
+
+
+def _parse_text_response(response_text: str,
+                         on_event: Optional[Callable[[Dict], None]]) -> Tuple[Optional[object], str]:
+    """依次按 JSON、SSE 文本、纯文本解析完整的响应文本"""
+    logger.info(f"  响应内容长度: {len(response_text)} 字符")
+    logger.info(f"  响应内容预览 (前500字符): {response_text[:500]}")
+
+    # 首先尝试解析为 JSON
+    try:
+        result = json.loads(response_text)
+        logger.info(f"  响应解析为JSON成功")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"  解析后的响应数据: {truncate(json.dumps(result, ensure_ascii=False))}")
+        return result, response_text
+    except ValueError:
+        # 如果不是 JSON，可能是流式响应（SSE格式）或纯文本
+        logger.debug(f"Coze API响应不是JSON格式，响应长度: {len(response_text)}")
+
+    # 检查是否是 SSE 格式（Server-Sent Events）
+    if response_text.startswith('data:') or '\ndata:' in response_text:
+        logger.info("检测到SSE格式响应，尝试解析流式数据")
+        result = _collect_events(_iter_sse_events(response_text.split('\n')), on_event)
+        if isinstance(result, dict) and 'stream_data' in result:
+            result['raw_response'] = response_text[:1000]
+        return result, response_text
+
+    # 纯文本响应，尝试提取有用信息
+    logger.info("响应为纯文本格式")
+    return None, response_text
+
+
+def _build_request(title: str, content: str, wechat_app_id: Optional[str] = None,
+                   wechat_app_secret: Optional[str] = None) -> Tuple[Dict, Dict]:
+    """
+    构造 Coze 工作流请求（同步和异步调用共用）并记录请求信息
+
+    :return: (请求头, 请求体)
     """
-    logger.info(f"开始调用Coze API: title='{title}', content_length={len(content)}, wechat_app_id={'已提供' if wechat_app_id else '未提供'}, wechat_app_secret={'已提供' if wechat_app_secret else '未提供'}")
-    
     authorization = _get_coze_authorization()
     if not authorization:
         raise ValueError("错误：环境变量 COZE_API_TOKEN 或 COZE_BEARER_TOKEN 未设置！")
     
     headers = {
         "Authorization": authorization,
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        **trace_headers()
     }
     
     # workflow_id 必须是字符串格式
@@ -81,161 +306,192 @@ def call_coze_api(title: str, content: str, wechat_app_id: Optional[str] = None,
     if not payload["parameters"]["content"]:
         raise ValueError("内容不能为空")
     
-    try:
-        # 记录请求信息（隐藏敏感信息）
-        safe_headers = headers.copy()
-        if 'Authorization' in safe_headers:
-            auth_value = safe_headers['Authorization']
-            # 只显示前20个字符和最后10个字符，中间用...代替
-            if len(auth_value) > 30:
-                safe_headers['Authorization'] = f"{auth_value[:20]}...{auth_value[-10:]}"
-            else:
-                safe_headers['Authorization'] = "***隐藏***"
-        
-        logger.info("=" * 80)
-        logger.info("Coze API 请求信息:")
-        logger.info(f"  请求地址: {COZE_API_URL}")
-        logger.info(f"  请求方法: POST")
-        logger.info(f"  请求头: {json.dumps(safe_headers, indent=2, ensure_ascii=False)}")
-        logger.info(f"  请求参数:")
-        logger.info(f"    workflow_id: {workflow_id} (类型: {type(workflow_id).__name__})")
-        logger.info(f"    parameters.title: {payload['parameters']['title'][:100]}{'...' if len(payload['parameters']['title']) > 100 else ''} (长度: {len(payload['parameters']['title'])})")
-        logger.info(f"    parameters.content: [HTML内容] (长度: {len(payload['parameters']['content'])})")
-        logger.info(f"  完整请求体: {json.dumps(payload, indent=2, ensure_ascii=False)}")
-        logger.info("=" * 80)
-        
-        # 设置较长的超时时间，因为 Coze API 可能需要较长时间处理
-        response = requests.post(COZE_API_URL, headers=headers, json=payload, timeout=600)
-        
-        # 记录响应信息
-        logger.info("=" * 80)
-        logger.info("Coze API 响应信息:")
-        logger.info(f"  响应状态码: {response.status_code}")
-        logger.info(f"  响应头: {dict(response.headers)}")
-        
-        # 尝试解析响应（无论状态码如何）
-        result = None
-        response_text = response.text
-        logger.info(f"  响应内容长度: {len(response_text)} 字符")
-        logger.info(f"  响应内容预览 (前500字符): {response_text[:500]}")
-        logger.info("=" * 80)
-        
-        # 首先尝试解析为 JSON
-        try:
-            result = response.json()
-            logger.info(f"  响应解析为JSON成功")
-            logger.info(f"  解析后的响应数据: {json.dumps(result, indent=2, ensure_ascii=False)}")
-        except ValueError:
-            # 如果不是 JSON，可能是流式响应（SSE格式）或纯文本
-            logger.debug(f"Coze API响应不是JSON格式，响应长度: {len(response_text)}")
-            
-            # 检查是否是 SSE 格式（Server-Sent Events）
-            if response_text.startswith('data:') or '\ndata:' in response_text:
-                logger.info("检测到SSE格式响应，尝试解析流式数据")
-                # 解析 SSE 格式
-                lines = response_text.strip().split('\n')
-                sse_data = []
-                for line in lines:
-                    if line.startswith('data:'):
-                        data_str = line[5:].strip()  # 移除 'data:' 前缀
-                        if data_str:
-                            try:
-                                sse_data.append(json.loads(data_str))
-                            except (ValueError, json.JSONDecodeError):
-                                sse_data.append(data_str)
-                
-                if sse_data:
-                    # 合并所有 SSE 数据
-                    if len(sse_data) == 1:
-                        result = sse_data[0]
+    # 记录请求信息（隐藏敏感信息）
+    safe_headers = headers.copy()
+    if 'Authorization' in safe_headers:
+        auth_value = safe_headers['Authorization']
+        # 只显示前20个字符和最后10个字符，中间用...代替
+        if len(auth_value) > 30:
+            safe_headers['Authorization'] = f"{auth_value[:20]}...{auth_value[-10:]}"
+        else:
+            safe_headers['Authorization'] = "***隐藏***"
+
+    # 只记录摘要；请求体（含整篇 HTML 和微信密钥）不写入日志
+    logger.info(f"Coze API 请求: POST {COZE_API_URL}, workflow_id={workflow_id}, "
+                f"title={truncate(payload['parameters']['title'], 100)} (长度: {len(payload['parameters']['title'])}), "
+                f"content=[HTML内容] (长度: {len(payload['parameters']['content'])})")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"  请求头: {json.dumps(safe_headers, ensure_ascii=False)}")
+    return headers, payload
+
+
+def _check_result(status_code: int, result: Optional[object], response_text: str) -> Dict:
+    """
+    检查 Coze 响应中的错误并整理返回结果（同步和异步调用共用）
+
+    :param status_code: HTTP 状态码
+    :param result: _read_response 解析出的结果
+    :param response_text: 响应文本
+    :return: API响应结果字典
+    """
+    if status_code != 200:
+        error_msg = "未知错误"
+        error_code = None
+
+        if result:
+            # 尝试从JSON响应中提取错误信息
+            if isinstance(result, dict):
+                # 优先检查 Coze API 的错误格式
+                if 'error_code' in result or 'error_message' in result:
+                    error_code = result.get('error_code', '未知')
+                    error_message = result.get('error_message', result.get('message', '未知错误'))
+                    logger.error(f"Coze API请求失败: status_code={status_code}, error_code={error_code}, error_message={error_message}")
+
+                    # 针对特定错误码提供更友好的提示
+                    if error_code == 4200:
+                        raise Exception(f"Workflow 不存在 (HTTP {status_code}, 错误码: {error_code})。请检查 COZE_WORKFLOW_ID 是否正确，当前值: {COZE_WORKFLOW_ID}。错误详情: {error_message}")
                     else:
-                        result = {'stream_data': sse_data, 'raw_response': response_text[:1000]}
-                    logger.info(f"  解析SSE数据成功，共 {len(sse_data)} 条")
-                    logger.info(f"  解析后的SSE数据: {json.dumps(result, indent=2, ensure_ascii=False) if isinstance(result, dict) else str(result)}")
+                        raise Exception(f"Coze API 请求失败 [HTTP {status_code}, 错误码: {error_code}]: {error_message}")
+
+                # 其他错误格式
+                error_msg = result.get('message', result.get('error', result.get('detail', str(result))))
+                # 如果是嵌套的错误信息
+                if 'error' in result and isinstance(result['error'], dict):
+                    error_msg = result['error'].get('message', error_msg)
             else:
-                # 纯文本响应，尝试提取有用信息
-                logger.info("响应为纯文本格式")
-                result = None
-        
-        if response.status_code != 200:
-            error_msg = "未知错误"
-            error_code = None
-            
-            if result:
-                # 尝试从JSON响应中提取错误信息
-                if isinstance(result, dict):
-                    # 优先检查 Coze API 的错误格式
-                    if 'error_code' in result or 'error_message' in result:
-                        error_code = result.get('error_code', '未知')
-                        error_message = result.get('error_message', result.get('message', '未知错误'))
-                        logger.error(f"Coze API请求失败: status_code={response.status_code}, error_code={error_code}, error_message={error_message}")
-                        
-                        # 针对特定错误码提供更友好的提示
-                        if error_code == 4200:
-                            raise Exception(f"Workflow 不存在 (HTTP {response.status_code}, 错误码: {error_code})。请检查 COZE_WORKFLOW_ID 是否正确，当前值: {COZE_WORKFLOW_ID}。错误详情: {error_message}")
-                        else:
-                            raise Exception(f"Coze API 请求失败 [HTTP {response.status_code}, 错误码: {error_code}]: {error_message}")
-                    
-                    # 其他错误格式
-                    error_msg = result.get('message', result.get('error', result.get('detail', str(result))))
-                    # 如果是嵌套的错误信息
-                    if 'error' in result and isinstance(result['error'], dict):
-                        error_msg = result['error'].get('message', error_msg)
-                else:
-                    error_msg = str(result)
+                error_msg = str(result)
+        else:
+            error_msg = response_text[:500]  # 限制错误信息长度
+
+        logger.error(f"Coze API请求失败: status_code={status_code}, error={error_msg}")
+        raise Exception(f"Coze API 请求失败 [HTTP {status_code}]: {error_msg}")
+
+    # 检查响应中是否包含错误信息（无论状态码如何）
+    if result and isinstance(result, dict):
+        # 检查 Coze API 的错误格式：error_code 和 error_message
+        if 'error_code' in result or 'error_message' in result:
+            error_code = result.get('error_code', '未知')
+            error_message = result.get('error_message', result.get('message', '未知错误'))
+            logger.error(f"Coze API返回错误: error_code={error_code}, error_message={error_message}")
+
+            # 针对特定错误码提供更友好的提示
+            if error_code == 4200:
+                raise Exception(f"Workflow 不存在 (错误码: {error_code})。请检查 COZE_WORKFLOW_ID 是否正确，当前值: {COZE_WORKFLOW_ID}。错误详情: {error_message}")
             else:
-                error_msg = response.text[:500]  # 限制错误信息长度
-            
-            logger.error(f"Coze API请求失败: status_code={response.status_code}, error={error_msg}")
-            raise Exception(f"Coze API 请求失败 [HTTP {response.status_code}]: {error_msg}")
-        
-        # 检查响应中是否包含错误信息（无论状态码如何）
-        if result and isinstance(result, dict):
-            # 检查 Coze API 的错误格式：error_code 和 error_message
-            if 'error_code' in result or 'error_message' in result:
-                error_code = result.get('error_code', '未知')
-                error_message = result.get('error_message', result.get('message', '未知错误'))
-                logger.error(f"Coze API返回错误: error_code={error_code}, error_message={error_message}")
-                
-                # 针对特定错误码提供更友好的提示
-                if error_code == 4200:
-                    raise Exception(f"Workflow 不存在 (错误码: {error_code})。请检查 COZE_WORKFLOW_ID 是否正确，当前值: {COZE_WORKFLOW_ID}。错误详情: {error_message}")
-                else:
-                    raise Exception(f"Coze API 错误 (错误码: {error_code}): {error_message}")
-            
-            # 检查是否有错误字段
-            if 'error' in result:
-                error_msg = result.get('error')
-                if isinstance(error_msg, dict):
-                    error_msg = error_msg.get('message', str(error_msg))
-                logger.error(f"Coze API返回错误信息: {error_msg}")
-                raise Exception(f"Coze API 错误: {error_msg}")
-            
-            # 检查 message 字段是否包含错误信息
-            if 'message' in result:
-                message = str(result.get('message', ''))
-                if 'error' in message.lower() or 'fail' in message.lower():
-                    logger.error(f"Coze API返回错误信息: {message}")
-                    raise Exception(f"Coze API 错误: {message}")
+                raise Exception(f"Coze API 错误 (错误码: {error_code}): {error_message}")
+
+        # 检查是否有错误字段
+        if 'error' in result:
+            error_msg = result.get('error')
+            if isinstance(error_msg, dict):
+                error_msg = error_msg.get('message', str(error_msg))
+            logger.error(f"Coze API返回错误信息: {error_msg}")
+            raise Exception(f"Coze API 错误: {error_msg}")
+
+        # 检查 message 字段是否包含错误信息
+        if 'message' in result:
+            message = str(result.get('message', ''))
+            if 'error' in message.lower() or 'fail' in message.lower():
+                logger.error(f"Coze API返回错误信息: {message}")
+                raise Exception(f"Coze API 错误: {message}")
+
+    # 格式化返回结果
+    if result:
+        logger.info(f"Coze API调用成功，返回数据: {type(result).__name__}")
+        return result
+    else:
+        # 返回文本响应，限制长度并格式化
+        text_response = response_text[:5000]  # 限制长度
+        logger.info(f"Coze API返回文本响应，长度: {len(text_response)}")
+        return {
+            'success': True,
+            'response_type': 'text',
+            'content': text_response,
+            'full_length': len(response_text)
+        }
+
+
+@traced()
+def call_coze_api(title: str, content: str, wechat_app_id: Optional[str] = None, wechat_app_secret: Optional[str] = None,
+                  on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    调用Coze API接口（stream_run 工作流，边接收边解析事件）
+    
+    :param title: 标题
+    :param content: 内容（HTML）
+    :param wechat_app_id: 微信AppID（可选）
+    :param wechat_app_secret: 微信AppSecret（可选）
+    :param on_event: 每收到一个工作流事件时的回调（可选），参数为 {'id', 'event', 'data'}
+    :return: API响应结果字典
+    """
+    logger.info(f"开始调用Coze API: title='{title}', content_length={len(content)}, wechat_app_id={'已提供' if wechat_app_id else '未提供'}, wechat_app_secret={'已提供' if wechat_app_secret else '未提供'}")
+    
+    headers, payload = _build_request(title, content, wechat_app_id, wechat_app_secret)
+    
+    with _call_metrics():
+        try:
+            # 以流式方式发送并逐行读取：读取超时作用于相邻两次收到数据之间，工作流运行期间持续收到事件就不会超时；
+            # 连接超时较短，上游宕机时尽快失败；通过共享连接池发送，多次发布（含多公众号并发发布）复用连接
+            with _circuit_guard() as circuit:
+                response = get_http_session().post(COZE_API_URL, headers=headers, json=payload, stream=True,
+                                                   timeout=(COZE_CONNECT_TIMEOUT, COZE_READ_TIMEOUT))
+                if response.status_code >= 500:
+                    circuit.mark_failure()
+                try:
+                    # 记录响应信息
+                    logger.info(f"Coze API 响应: status_code={response.status_code}")
+                    logger.debug(f"  响应头: {dict(response.headers)}")
+                    result, response_text = _read_response(response, on_event)
+                finally:
+                    response.close()
         
-        # 格式化返回结果
-        if result:
-            logger.info(f"Coze API调用成功，返回数据: {type(result).__name__}")
-            return result
-        else:
-            # 返回文本响应，限制长度并格式化
-            text_response = response_text[:5000]  # 限制长度
-            logger.info(f"Coze API返回文本响应，长度: {len(text_response)}")
-            return {
-                'success': True,
-                'response_type': 'text',
-                'content': text_response,
-                'full_length': len(response_text)
-            }
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Coze API网络连接异常: {e}", exc_info=True)
-        raise Exception(f"网络连接异常: {e}")
-    except Exception as e:
-        logger.error(f"Coze API调用失败: {e}", exc_info=True)
-        raise
+            return _check_result(response.status_code, result, response_text)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Coze API网络连接异常: {e}", exc_info=True)
+            raise Exception(f"网络连接异常: {e}")
+        except Exception as e:
+            logger.error(f"Coze API调用失败: {e}", exc_info=True)
+            raise
+
+
+@traced()
+async def async_call_coze_api(title: str, content: str, wechat_app_id: Optional[str] = None,
+                              wechat_app_secret: Optional[str] = None,
+                              on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    call_coze_api 的协程版本（httpx.AsyncClient），工作流运行期间不占用线程
+
+    参数、返回值、超时和熔断行为与 call_coze_api 一致；on_event 在事件循环中同步调用，不应执行耗时操作。
+
+    :param title: 标题
+    :param content: 内容（HTML）
+    :param wechat_app_id: 微信AppID（可选）
+    :param wechat_app_secret: 微信AppSecret（可选）
+    :param on_event: 每收到一个工作流事件时的回调（可选），参数为 {'id', 'event', 'data'}
+    :return: API响应结果字典
+    """
+    if httpx is None:
+        raise RuntimeError("异步调用需要安装 httpx：pip install httpx")
+    logger.info(f"开始异步调用Coze API: title='{title}', content_length={len(content)}, wechat_app_id={'已提供' if wechat_app_id else '未提供'}, wechat_app_secret={'已提供' if wechat_app_secret else '未提供'}")
+
+    headers, payload = _build_request(title, content, wechat_app_id, wechat_app_secret)
+    client = get_async_http_client()
+
+    with _call_metrics():
+        try:
+            with _circuit_guard() as circuit:
+                async with client.stream("POST", COZE_API_URL, headers=headers, json=payload,
+                                         timeout=httpx.Timeout(COZE_READ_TIMEOUT, connect=COZE_CONNECT_TIMEOUT)) as response:
+                    if response.status_code >= 500:
+                        circuit.mark_failure()
+                    logger.info(f"Coze API 响应: status_code={response.status_code}")
+                    logger.debug(f"  响应头: {dict(response.headers)}")
+                    result, response_text = await _async_read_response(response, on_event)
 
+            return _check_result(response.status_code, result, response_text)
+        except httpx.HTTPError as e:
+            logger.error(f"Coze API网络连接异常: {e}", exc_info=True)
+            raise Exception(f"网络连接异常: {e}")
+        except Exception as e:
+            logger.error(f"Coze API调用失败: {e}", exc_info=True)
+            raise
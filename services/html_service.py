@@ -1,94 +1,220 @@
 """
 HTML生成服务
+
+短文较长、预计输出超出单次调用的 token 预算时，按段落拆分后分段生成HTML片段（并发），按顺序拼接。
 """
-from typing import Tuple, Optional
-import os
-from utils.api import get_gemini_response
-from database import get_db_session
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+from config import (HTML_TEMPERATURE, HTML_MAX_TOKENS, HTML_OUTPUT_RATIO, HTML_OUTPUT_OVERHEAD_TOKENS,
+                    HTML_CHUNK_CONCURRENCY, PROMPT_TOKEN_BUDGET, PROMPT_MAX_OUTPUT_TOKENS)
+from utils.api import get_gemini_response, stream_gemini_response, async_get_gemini_response
+from database import run_write
 from models import HTMLOutput
+from services.prompt_service import resolve_prompt_template
+from services.prompt_blob_service import store_prompt
 from utils.logger import logger
+from utils.metrics import DB_SAVE_SECONDS
+from utils.prompt_budget import (PromptTooLargeError, available_output_tokens, count_tokens, output_token_budget,
+                                 split_text)
+from utils.tracing import bind_span, current_span, traced
+
+# 分段生成时附加在每段提示词后的说明
+HTML_CHUNK_NOTE = ("\n\n**分段说明**：原文较长，已拆分为 {total} 段分别排版，以上是第 {index} 段（{position}）。"
+                   "请只为这一段输出对应的 `<section>` 片段，沿用相同的样式，不要输出代码块标记或任何说明，"
+                   "各段的输出将按顺序直接拼接。")
 
+# 模型仍输出代码块标记时去掉（拼接后的HTML中间不能出现）
+_CODE_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?|\n?\s*```\s*$")
+# 流式输出时：段首的代码块标记（含语言名和其后的空白），以及段尾可能属于结束标记、需要暂缓输出的部分
+_LEADING_FENCE_RE = re.compile(r"```[a-zA-Z]*\s*")
+_TRAILING_HOLD_RE = re.compile(r"\s*`{0,3}\s*$")
 
-def load_prompt_template(template_id: Optional[int] = None) -> str:
-    """读取提示词模板"""
-    from database import get_db_session
-    from models import PromptTemplate
+
+def build_html_prompt(article_text: str, template_id: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """
+    组装HTML生成的完整提示词
     
-    db = get_db_session()
-    try:
-        if template_id:
-            template = db.query(PromptTemplate).filter(PromptTemplate.id == template_id).first()
-            if template:
-                return template.content
-        
-        # 使用默认模板
-        template = db.query(PromptTemplate).filter(
-            PromptTemplate.category == "html",
-            PromptTemplate.is_default == True
-        ).first()
-        
-        if not template:
-            # 如果没有默认模板，返回第一个
-            template = db.query(PromptTemplate).filter(
-                PromptTemplate.category == "html"
-            ).first()
-        
-        if template:
-            return template.content
-    finally:
-        db.close()
-    
-    # 向后兼容：如果数据库中没有，尝试从文件加载
-    PROMPT_FILE_PATH = "html生成提示词"
-    if os.path.exists(PROMPT_FILE_PATH):
-        with open(PROMPT_FILE_PATH, "r", encoding="utf-8") as f:
-            return f.read()
-    
-    raise FileNotFoundError("找不到提示词模板")
-
-
-def generate_html(article_text: str, template_id: Optional[int] = None) -> Tuple[str, str, Optional[int]]:
+    :param article_text: 短文内容
+    :param template_id: 提示词模板ID（可选）
+    :return: (完整提示词, 模板ID)
+    """
+    # 1. 从模板注册表解析模板内容和模板ID（内存查找，不访问数据库）
+    template_content, used_template_id = resolve_prompt_template("html", template_id)
+    logger.debug(f"提示词模板解析完成: template_id={used_template_id}, 长度: {len(template_content)} 字符")
+    
+    # 2. 替换占位符
+    final_prompt = template_content.replace("{{content}}", article_text)
+    
+    return final_prompt, used_template_id
+
+
+def _expected_html_tokens(content_tokens: int) -> int:
+    """按正文 token 数估算HTML输出的 token 数（不低于 HTML_MAX_TOKENS）"""
+    return max(HTML_MAX_TOKENS, int(content_tokens * HTML_OUTPUT_RATIO) + HTML_OUTPUT_OVERHEAD_TOKENS)
+
+
+def _chunk_position(index: int, total: int) -> str:
+    if index == 1:
+        return "开头部分，不需要结语"
+    if index == total:
+        return "结尾部分，不需要开篇引入"
+    return "中间部分，不需要开篇引入和结语"
+
+
+def plan_html_requests(article_text: str, template_id: Optional[int] = None) -> Tuple[List[Tuple[str, int]], str, Optional[int]]:
     """
-    生成HTML
+    按 token 预算规划HTML生成请求
+    
+    预计输出能放进单次调用时只有一个请求；否则按段落拆分短文，每段的提示词和输出都在预算内。
+    
+    :param article_text: 短文内容
+    :param template_id: 提示词模板ID（可选）
+    :return: ([(提示词, maxOutputTokens), ...], 完整提示词（整篇短文，用于保存）, 模板ID)
+    :raises PromptTooLargeError: 提示词模板本身超出预算
+    """
+    final_prompt, used_template_id = build_html_prompt(article_text, template_id)
+    content_tokens = count_tokens(article_text)
+    prompt_tokens = count_tokens(final_prompt)
+    expected = _expected_html_tokens(content_tokens)
+    if expected <= available_output_tokens(prompt_tokens):
+        return [(final_prompt, output_token_budget(final_prompt, expected))], final_prompt, used_template_id
+    
+    # 每段正文的上限：该段的输出不超过 maxOutputTokens 上限，提示词 + 输出不超过总预算
+    fixed_tokens = prompt_tokens - content_tokens + count_tokens(HTML_CHUNK_NOTE)
+    max_chunk_tokens = int(min((PROMPT_MAX_OUTPUT_TOKENS - HTML_OUTPUT_OVERHEAD_TOKENS) / HTML_OUTPUT_RATIO,
+                               (PROMPT_TOKEN_BUDGET - fixed_tokens - HTML_OUTPUT_OVERHEAD_TOKENS) / (HTML_OUTPUT_RATIO + 1)))
+    if max_chunk_tokens < 1:
+        raise PromptTooLargeError(f"HTML提示词模板过长：估算 {fixed_tokens} token，超出单次调用预算 {PROMPT_TOKEN_BUDGET} token")
+    
+    chunks = split_text(article_text, max_chunk_tokens)
+    html_requests = []
+    for index, chunk in enumerate(chunks, start=1):
+        chunk_prompt = build_html_prompt(chunk, template_id)[0] + HTML_CHUNK_NOTE.format(
+            total=len(chunks), index=index, position=_chunk_position(index, len(chunks)))
+        html_requests.append((chunk_prompt, output_token_budget(chunk_prompt, _expected_html_tokens(count_tokens(chunk)))))
+    logger.info(f"短文较长（估算 {content_tokens} token，预计HTML {expected} token），分 {len(chunks)} 段生成HTML")
+    current = current_span()
+    if current is not None:
+        current.set_attribute('chunks', len(chunks))
+    return html_requests, final_prompt, used_template_id
+
+
+def _stitch_sections(sections: List[str]) -> str:
+    """按顺序拼接各段HTML片段"""
+    return "\n".join(_CODE_FENCE_RE.sub("", section).strip() for section in sections)
+
+
+@traced()
+def generate_html(article_text: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[str, str, Optional[int]]:
+    """
+    生成HTML（短文过长时分段并发生成后拼接）
     
     :param article_text: 短文内容
     :param template_id: 提示词模板ID（可选）
     :return: (HTML内容, 完整提示词, 模板ID)
     """
-    # 1. 读取模板
-    template_content = load_prompt_template(template_id)
+    html_requests, final_prompt, used_template_id = plan_html_requests(article_text, template_id)
     
-    # 2. 获取模板ID
-    from database import get_db_session
-    from models import PromptTemplate
+    def generate_section(html_request: Tuple[str, int]) -> str:
+        prompt, max_tokens = html_request
+        return get_gemini_response(prompt, temperature=HTML_TEMPERATURE, max_tokens=max_tokens, use_cache=use_cache,
+                                   stage="html")
     
-    db = get_db_session()
-    try:
-        if template_id:
-            used_template_id = template_id
-        else:
-            # 获取默认模板ID
-            default_template = db.query(PromptTemplate).filter(
-                PromptTemplate.category == "html",
-                PromptTemplate.is_default == True
-            ).first()
-            if not default_template:
-                default_template = db.query(PromptTemplate).filter(
-                    PromptTemplate.category == "html"
-                ).first()
-            used_template_id = default_template.id if default_template else None
-    finally:
-        db.close()
-    
-    # 3. 替换占位符
-    final_prompt = template_content.replace("{{content}}", article_text)
+    # 调用 API
+    if len(html_requests) == 1:
+        return generate_section(html_requests[0]), final_prompt, used_template_id
     
-    # 4. 调用 API
-    html_content = get_gemini_response(final_prompt, temperature=0.7, max_tokens=4096)
+    workers = max(1, min(HTML_CHUNK_CONCURRENCY, len(html_requests)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="html-chunk") as executor:
+        sections = list(executor.map(bind_span(generate_section), html_requests))
     
-    return html_content, final_prompt, used_template_id
+    return _stitch_sections(sections), final_prompt, used_template_id
+
 
+@traced()
+async def async_generate_html(article_text: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[str, str, Optional[int]]:
+    """
+    generate_html 的协程版本（在事件循环中调用 Gemini，不占用线程）
+    
+    :param article_text: 短文内容
+    :param template_id: 提示词模板ID（可选）
+    :return: (HTML内容, 完整提示词, 模板ID)
+    """
+    html_requests, final_prompt, used_template_id = plan_html_requests(article_text, template_id)
+    semaphore = asyncio.Semaphore(max(1, HTML_CHUNK_CONCURRENCY))
+    
+    async def generate_section(html_request: Tuple[str, int]) -> str:
+        prompt, max_tokens = html_request
+        async with semaphore:
+            return await async_get_gemini_response(prompt, temperature=HTML_TEMPERATURE, max_tokens=max_tokens,
+                                                   use_cache=use_cache, stage="html")
+    
+    if len(html_requests) == 1:
+        return await generate_section(html_requests[0]), final_prompt, used_template_id
+    sections = await asyncio.gather(*(generate_section(html_request) for html_request in html_requests))
+    return _stitch_sections(list(sections)), final_prompt, used_template_id
+
+
+def _strip_section_stream(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    流式去掉一段输出首尾的代码块标记和空白，结果与 _stitch_sections 对该段的处理一致
+
+    段首在确认是否为代码块标记前先缓存；段尾的空白和反引号暂缓输出，确认不是结束标记后随下一块输出。
+    """
+    buffer = ""
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        if not started:
+            buffer = buffer.lstrip()
+            if not buffer:
+                continue
+            if buffer.startswith("```") or "```".startswith(buffer):
+                fence = _LEADING_FENCE_RE.match(buffer)
+                if fence is None or fence.end() == len(buffer):
+                    continue  # 代码块标记或其后的内容还没收完
+                buffer = buffer[fence.end():]
+            started = True
+        hold = _TRAILING_HOLD_RE.search(buffer).start()
+        if hold:
+            yield buffer[:hold]
+            buffer = buffer[hold:]
+    tail = _CODE_FENCE_RE.sub("", buffer).strip() if not started or buffer.strip() == "```" else buffer.rstrip()
+    if tail:
+        yield tail
 
+
+def _stream_sections(html_requests: List[Tuple[str, int]], use_cache: bool) -> Iterator[str]:
+    """依次流式生成各段HTML（去掉各段首尾的代码块标记），段与段之间插入换行，拼接结果与 _stitch_sections 一致"""
+    for index, (prompt, max_tokens) in enumerate(html_requests):
+        if index:
+            yield "\n"
+        yield from _strip_section_stream(stream_gemini_response(prompt, temperature=HTML_TEMPERATURE,
+                                                                max_tokens=max_tokens, use_cache=use_cache,
+                                                                stage="html"))
+
+
+def stream_html(article_text: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[Iterator[str], str, Optional[int]]:
+    """
+    流式生成HTML（短文过长时按顺序逐段流式生成）
+    
+    :param article_text: 短文内容
+    :param template_id: 提示词模板ID（可选）
+    :return: (文本片段生成器, 完整提示词, 模板ID)
+    """
+    html_requests, final_prompt, used_template_id = plan_html_requests(article_text, template_id)
+    if len(html_requests) == 1:
+        prompt, max_tokens = html_requests[0]
+        chunks = stream_gemini_response(prompt, temperature=HTML_TEMPERATURE, max_tokens=max_tokens,
+                                        use_cache=use_cache, stage="html")
+    else:
+        chunks = _stream_sections(html_requests, use_cache)
+    return chunks, final_prompt, used_template_id
+
+
+@traced(attrs=("article_id",))
 def save_html_to_db(article_id: int, html_content: str, prompt_text: str, template_id: Optional[int] = None) -> int:
     """
     保存HTML和提示词到数据库
@@ -99,22 +225,26 @@ def save_html_to_db(article_id: int, html_content: str, prompt_text: str, templa
     :return: 保存的HTML输出ID
     """
     logger.info(f"开始保存HTML到数据库: article_id={article_id}, html_length={len(html_content)}")
-    db = get_db_session()
-    try:
+    
+    def write(db):
         html_output = HTMLOutput(
             article_id=article_id,
             html_content=html_content,
-            prompt_text=prompt_text,
+            prompt_text="",
+            prompt_hash=store_prompt(db, prompt_text),
             prompt_template_id=template_id
         )
         db.add(html_output)
-        db.commit()
-        logger.info(f"HTML保存成功，ID: {html_output.id}")
+        db.flush()  # 获取ID
         return html_output.id
+    
+    try:
+        # 写操作交给单写线程提交，避免并发保存时抢锁
+        with DB_SAVE_SECONDS.time("html_outputs"):
+            html_id = run_write(write)
+        logger.info(f"HTML保存成功，ID: {html_id}")
+        return html_id
     except Exception as e:
-        db.rollback()
         logger.error(f"保存HTML失败: {e}", exc_info=True)
         raise e
-    finally:
-        db.close()
 
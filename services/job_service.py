@@ -0,0 +1,433 @@
+"""
+异步生成任务服务
+
+生成标题/短文/HTML 需要调用 Gemini（通常 60-180 秒），如果在请求线程里同步执行会长时间占用 Flask worker。
+这里把生成请求写入 generation_jobs 表，由后台线程池执行，接口立即返回任务ID，前端轮询或订阅任务状态。
+任务状态全部持久化在数据库中，进程重启后会把未完成的任务重新放回队列。
+"""
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from config import JOB_WORKERS, JOB_MAX_ATTEMPTS, JOB_STALE_SECONDS, JOB_RECOVERY_INTERVAL
+from database import get_db_session
+from models import GenerationJob, Title, Article
+from services.title_service import generate_titles, save_titles_to_db
+from services.article_service import generate_article, save_article_to_db, generate_articles_batch
+from services.html_service import generate_html, save_html_to_db
+from services.pipeline_service import run_pipeline
+from services.publish_service import run_publish, run_publish_fanout, PUBLISH_STATUS_FAILED
+from utils.logger import logger
+from utils.tracing import current_span, span
+
+
+JOB_STATUS_PENDING = "pending"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_COMPLETED = "completed"
+JOB_STATUS_FAILED = "failed"
+FINISHED_STATUSES = (JOB_STATUS_COMPLETED, JOB_STATUS_FAILED)
+
+# 当前进程标识，记录在任务上；多个实例共享数据库时据此判断 running 任务是否已中断
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# 任务完成通知：job_id -> Event，供同进程内的订阅者等待，避免频繁查询数据库
+_job_events: Dict[int, threading.Event] = {}
+_job_events_lock = threading.Lock()
+
+
+def _run_title_job(params: Dict) -> Dict:
+    """执行标题生成任务"""
+    topic_id = params['topic_id']
+    topic_text = params['topic_text']
+    titles, prompt_text, used_template_id = generate_titles(
+        topic_text, params.get('template_id'), use_cache=params.get('use_cache', False)
+    )
+    if not titles:
+        raise Exception("未能生成标题")
+    title_ids = save_titles_to_db(topic_id, titles, prompt_text, used_template_id)
+    return {
+        'topic_id': topic_id,
+        'topic_text': topic_text,
+        'titles': titles,
+        'title_ids': title_ids,
+        'template_id': used_template_id
+    }
+
+
+def _run_article_job(params: Dict) -> Dict:
+    """执行短文生成任务"""
+    title_id = params['title_id']
+    db = get_db_session()
+    try:
+        title = db.query(Title).filter(Title.id == title_id).first()
+        if not title:
+            raise Exception(f"标题不存在: title_id={title_id}")
+        title_text = title.title_text
+    finally:
+        db.close()
+
+    article_text, prompt_text, used_template_id = generate_article(
+        title_text, params.get('template_id'), use_cache=params.get('use_cache', False)
+    )
+    article_id = save_article_to_db(title_id, article_text, prompt_text, used_template_id)
+    return {
+        'article_id': article_id,
+        'article_text': article_text,
+        'template_id': used_template_id
+    }
+
+
+def _run_html_job(params: Dict) -> Dict:
+    """执行HTML生成任务"""
+    article_id = params['article_id']
+    db = get_db_session()
+    try:
+        article = db.query(Article).filter(Article.id == article_id).first()
+        if not article:
+            raise Exception(f"短文不存在: article_id={article_id}")
+        article_text = article.article_text
+    finally:
+        db.close()
+
+    html_content, prompt_text, used_template_id = generate_html(
+        article_text, params.get('template_id'), use_cache=params.get('use_cache', False)
+    )
+    html_id = save_html_to_db(article_id, html_content, prompt_text, used_template_id)
+    return {
+        'html_id': html_id,
+        'html_content': html_content,
+        'template_id': used_template_id
+    }
+
+
+def _run_article_batch_job(params: Dict) -> Dict:
+    """执行批量短文生成任务"""
+    items = generate_articles_batch(
+        params['title_ids'], params.get('template_id'),
+        use_cache=params.get('use_cache', False), concurrency=params.get('concurrency')
+    )
+    return {
+        'total': len(items),
+        'succeeded': sum(1 for item in items if item['success']),
+        'failed': sum(1 for item in items if not item['success']),
+        'items': items
+    }
+
+
+def _run_pipeline_job(params: Dict) -> Dict:
+    """执行流水线任务（重复执行时从检查点继续）"""
+    run = run_pipeline(params['run_id'])
+    if run['status'] == "failed":
+        raise Exception(f"流水线执行失败: {run['error']}")
+    return {'run_id': run['id'], 'status': run['status']}
+
+
+def _run_publish_job(params: Dict) -> Dict:
+    """执行 Coze 发布任务（进度和结果同时记录在 publish_records 中）"""
+    record = run_publish(params['publish_id'])
+    if record['status'] == PUBLISH_STATUS_FAILED:
+        raise Exception(record['error'])
+    return {
+        'publish_id': record['id'],
+        'title_id': record['title_id'],
+        'title_text': record['title_text'],
+        'html_id': record['html_id'],
+        'wechat_config_name': record['wechat_config_name'],
+        'event_count': record['event_count'],
+        'coze_result': record['result']
+    }
+
+
+def _run_publish_fanout_job(params: Dict) -> Dict:
+    """执行多公众号发布任务（结果为各公众号的汇总报告，单个公众号失败不影响任务状态）"""
+    return run_publish_fanout(params['publish_ids'], concurrency=params.get('concurrency'))
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict], Dict]] = {
+    "title": _run_title_job,
+    "article": _run_article_job,
+    "html": _run_html_job,
+    "article_batch": _run_article_batch_job,
+    "pipeline": _run_pipeline_job,
+    "coze_publish": _run_publish_job,
+    "coze_publish_fanout": _run_publish_fanout_job,
+}
+
+
+def _job_to_dict(job: GenerationJob) -> Dict:
+    """将任务对象转换为字典"""
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'params': json.loads(job.params) if job.params else {},
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def _notify_job_finished(job_id: int):
+    """唤醒等待该任务的订阅者"""
+    with _job_events_lock:
+        event = _job_events.pop(job_id, None)
+    if event:
+        event.set()
+
+
+def _claim_job(job_id: int) -> Optional[Dict]:
+    """
+    将任务从 pending 原子地切换为 running
+
+    :return: 任务字典；如果任务不存在或已被其他线程领取，返回 None
+    """
+    db = get_db_session()
+    try:
+        claimed = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status == JOB_STATUS_PENDING
+        ).update({
+            GenerationJob.status: JOB_STATUS_RUNNING,
+            GenerationJob.started_at: datetime.now(),
+            GenerationJob.attempts: GenerationJob.attempts + 1,
+            GenerationJob.worker_id: WORKER_ID
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return None
+        job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        return _job_to_dict(job)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _finish_job(job_id: int, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+    """记录任务执行结果"""
+    db = get_db_session()
+    try:
+        job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        if job:
+            job.status = status
+            job.result = json.dumps(result, ensure_ascii=False) if result is not None else None
+            job.error = error
+            job.finished_at = datetime.now()
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"更新任务状态失败: job_id={job_id}, error={e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def _run_job(job_id: int):
+    """后台线程执行单个任务"""
+    try:
+        job = _claim_job(job_id)
+    except Exception as e:
+        logger.error(f"领取任务失败: job_id={job_id}, error={e}", exc_info=True)
+        return
+    if not job:
+        logger.debug(f"任务已被领取或不存在，跳过: job_id={job_id}")
+        return
+
+    # 每次执行任务单独一个追踪（任务在线程池中执行，不继承创建任务的请求的追踪）
+    with span(f"job.{job['job_type']}", job_id=job_id, attempt=job['attempts']) as job_span:
+        logger.info(f"开始执行任务: job_id={job_id}, job_type={job['job_type']}, attempts={job['attempts']}")
+        try:
+            handler = JOB_HANDLERS[job['job_type']]
+            result = handler(job['params'])
+            _finish_job(job_id, JOB_STATUS_COMPLETED, result=result)
+            logger.info(f"任务执行成功: job_id={job_id}")
+        except Exception as e:
+            logger.error(f"任务执行失败: job_id={job_id}, error={e}", exc_info=True)
+            _finish_job(job_id, JOB_STATUS_FAILED, error=str(e))
+            if job_span:
+                job_span.set_error(e)
+        finally:
+            _notify_job_finished(job_id)
+
+
+def _submit(job_id: int):
+    """提交任务到线程池"""
+    with _job_events_lock:
+        _job_events.setdefault(job_id, threading.Event())
+    _get_executor().submit(_run_job, job_id)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """获取线程池（首次创建时恢复未完成的任务，并定期检查其他实例遗留的任务）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="gen-job")
+                logger.info(f"后台任务线程池已启动，线程数: {JOB_WORKERS}, worker_id={WORKER_ID}")
+                _recover_jobs()
+                if JOB_RECOVERY_INTERVAL > 0:
+                    threading.Thread(target=_recovery_loop, name="gen-job-recovery", daemon=True).start()
+    return _executor
+
+
+def _recovery_loop():
+    """定期恢复中断的任务（其他实例崩溃后遗留的任务由存活的实例接管）"""
+    while True:
+        time.sleep(JOB_RECOVERY_INTERVAL)
+        _recover_jobs()
+
+
+def _is_interrupted(job: GenerationJob) -> bool:
+    """
+    判断 running 状态的任务是否已中断
+
+    同一主机上的任务检查执行进程是否还存在；其他主机上的任务无法检查进程，运行超过 JOB_STALE_SECONDS 视为中断。
+    """
+    if not job.worker_id:
+        # 旧版本创建的任务没有记录进程，只可能是单实例部署
+        return True
+    if job.worker_id == WORKER_ID:
+        return False
+    host, _, pid = job.worker_id.rpartition(":")
+    if host != socket.gethostname():
+        return bool(job.started_at) and job.started_at < datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)
+    try:
+        os.kill(int(pid), 0)
+    except (ProcessLookupError, ValueError):
+        return True
+    except OSError:
+        # 进程存在但无权限发送信号
+        return False
+    return False
+
+
+def _recover_jobs():
+    """
+    恢复中断的任务
+
+    中断的 running 任务（执行进程已退出）重新放回 pending；
+    已执行次数达到 JOB_MAX_ATTEMPTS 的任务直接标记为失败，避免反复崩溃。
+    pending 任务中不在本进程队列里的（其他实例创建后未执行的）一并放入本进程队列，由 _claim_job 保证只执行一次。
+    """
+    db = get_db_session()
+    try:
+        running = db.query(GenerationJob).filter(GenerationJob.status == JOB_STATUS_RUNNING).all()
+        for job in running:
+            if not _is_interrupted(job):
+                continue
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                job.status = JOB_STATUS_FAILED
+                job.error = f"任务中断次数过多（{job.attempts} 次），不再重试"
+                job.finished_at = datetime.now()
+            else:
+                logger.warning(f"任务执行中断，重新放回队列: job_id={job.id}, worker_id={job.worker_id}")
+                job.status = JOB_STATUS_PENDING
+        db.commit()
+
+        pending_ids = [job_id for (job_id,) in db.query(GenerationJob.id).filter(
+            GenerationJob.status == JOB_STATUS_PENDING
+        ).order_by(GenerationJob.id.asc()).all()]
+    except Exception as e:
+        db.rollback()
+        logger.error(f"恢复未完成任务失败: {e}", exc_info=True)
+        return
+    finally:
+        db.close()
+
+    with _job_events_lock:
+        # 已在本进程队列中的任务不重复提交
+        pending_ids = [job_id for job_id in pending_ids if job_id not in _job_events]
+        for job_id in pending_ids:
+            _job_events[job_id] = threading.Event()
+    if pending_ids:
+        logger.info(f"恢复 {len(pending_ids)} 个未完成任务: {pending_ids}")
+    for job_id in pending_ids:
+        _executor.submit(_run_job, job_id)
+
+
+def start_job_workers():
+    """启动后台任务线程池，并恢复数据库中未完成的任务"""
+    _get_executor()
+
+
+def enqueue_job(job_type: str, params: Dict) -> int:
+    """
+    创建生成任务并放入后台队列
+
+    :param job_type: 任务类型（title/article/html/article_batch/pipeline/coze_publish/coze_publish_fanout）
+    :param params: 任务参数（需可JSON序列化）
+    :return: 任务ID
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"未知的任务类型: {job_type}")
+
+    db = get_db_session()
+    try:
+        job = GenerationJob(
+            job_type=job_type,
+            status=JOB_STATUS_PENDING,
+            params=json.dumps(params, ensure_ascii=False),
+            attempts=0
+        )
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    except Exception as e:
+        db.rollback()
+        logger.error(f"创建任务失败: job_type={job_type}, error={e}", exc_info=True)
+        raise e
+    finally:
+        db.close()
+
+    logger.info(f"任务已入队: job_id={job_id}, job_type={job_type}, params={params}")
+    request_span = current_span()
+    if request_span is not None:
+        # 在创建任务的请求的追踪中注明任务ID，据此找到任务自己的追踪（/debug/traces?job_id=）
+        request_span.set_attribute('job_id', job_id)
+    _submit(job_id)
+    return job_id
+
+
+def get_job(job_id: int) -> Optional[Dict]:
+    """根据ID获取任务（返回字典）"""
+    db = get_db_session()
+    try:
+        job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+        return _job_to_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def wait_for_job(job_id: int, timeout: float = 15.0) -> Optional[Dict]:
+    """
+    等待任务结束或超时，返回任务当前状态
+
+    同进程提交的任务通过 Event 通知；其他进程提交的任务退化为定时查询数据库。
+
+    :param job_id: 任务ID
+    :param timeout: 最长等待秒数
+    :return: 任务字典，任务不存在时返回 None
+    """
+    with _job_events_lock:
+        event = _job_events.get(job_id)
+    if event:
+        event.wait(timeout)
+        return get_job(job_id)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if not job or job['status'] in FINISHED_STATUSES or time.monotonic() >= deadline:
+            return job
+        time.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
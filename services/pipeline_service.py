@@ -0,0 +1,396 @@
+"""
+流水线服务：主题 → 标题 → 短文 → HTML → Coze 发布
+
+一次运行先为主题生成标题，再对选中的每个标题并行执行 短文 → HTML → 发布。
+每个阶段完成后立即把检查点（topic_id、article_id、html_id、发布结果）写入数据库，
+进程崩溃后重新执行同一运行时会从最后完成的阶段继续，不会重复调用已经付费的 Gemini 请求。
+流水线本身作为 generation_jobs 中的 pipeline 任务执行，由任务队列负责重启后的恢复。
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from config import PIPELINE_CONCURRENCY
+from database import get_db_session
+from models import Topic, Title, Article, HTMLOutput, PipelineRun, PipelineItem
+from services.title_service import generate_titles, save_titles_to_db
+from services.article_service import generate_article, save_article_to_db
+from services.html_service import generate_html, save_html_to_db
+from services.coze_service import call_coze_api
+from services.config_service import get_wechat_credentials
+from utils.logger import logger
+from utils.tracing import bind_span
+
+
+RUN_STAGE_TOPIC = "topic"
+RUN_STAGE_TITLES = "titles"
+RUN_STAGE_ITEMS = "items"
+RUN_STAGE_DONE = "done"
+
+ITEM_STAGE_ARTICLE = "article"
+ITEM_STAGE_HTML = "html"
+ITEM_STAGE_PUBLISH = "publish"
+ITEM_STAGE_DONE = "done"
+
+# 在发布阶段中断的条目不自动重新发布（Coze 工作流可能已经发出文章），需确认后通过 resume 显式重试
+ITEM_PUBLISH_INTERRUPTED_ERROR = "发布阶段执行中断，文章可能已经发出；请在公众号后台确认后通过 POST /api/pipelines/<run_id>/resume 重试"
+
+
+def create_pipeline_run(topic_text: str, title_count: Optional[int] = None,
+                        title_template_id: Optional[int] = None, article_template_id: Optional[int] = None,
+                        html_template_id: Optional[int] = None, wechat_config_name: Optional[str] = None,
+                        publish: bool = True) -> int:
+    """
+    创建流水线运行记录（不执行，执行由 pipeline 任务负责）
+
+    :param topic_text: 主题
+    :param title_count: 选取前几个生成的标题继续生成短文，为空时全部选取
+    :param publish: 是否调用 Coze 发布
+    :return: 运行ID
+    """
+    params = {
+        'title_count': title_count,
+        'title_template_id': title_template_id,
+        'article_template_id': article_template_id,
+        'html_template_id': html_template_id,
+        'wechat_config_name': wechat_config_name,
+        'publish': publish
+    }
+    db = get_db_session()
+    try:
+        run = PipelineRun(
+            topic_text=topic_text,
+            status="pending",
+            stage=RUN_STAGE_TOPIC,
+            params=json.dumps(params, ensure_ascii=False)
+        )
+        db.add(run)
+        db.commit()
+        logger.info(f"流水线运行已创建: run_id={run.id}, topic='{topic_text}', params={params}")
+        return run.id
+    except Exception as e:
+        db.rollback()
+        logger.error(f"创建流水线运行失败: {e}", exc_info=True)
+        raise e
+    finally:
+        db.close()
+
+
+def _update_run(run_id: int, **fields):
+    """更新运行记录（检查点）"""
+    db = get_db_session()
+    try:
+        db.query(PipelineRun).filter(PipelineRun.id == run_id).update(fields, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def resume_pipeline_run(run_id: int) -> bool:
+    """
+    将失败的运行原子地切换回 pending，准备重新执行
+
+    :return: 是否切换成功；运行不存在或状态不是 failed（执行中、等待执行或已完成）时返回 False，
+             并发的多次继续请求只有一次成功，同一运行不会被两个任务同时执行
+    """
+    db = get_db_session()
+    try:
+        claimed = db.query(PipelineRun).filter(
+            PipelineRun.id == run_id,
+            PipelineRun.status == "failed"
+        ).update({PipelineRun.status: "pending", PipelineRun.error: None}, synchronize_session=False)
+        db.commit()
+        return bool(claimed)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _claim_item(item_id: int) -> bool:
+    """将条目原子地切换为 running；已在执行或已完成的条目返回 False"""
+    db = get_db_session()
+    try:
+        claimed = db.query(PipelineItem).filter(
+            PipelineItem.id == item_id,
+            PipelineItem.status.in_(("pending", "failed"))
+        ).update({PipelineItem.status: "running", PipelineItem.error: None}, synchronize_session=False)
+        db.commit()
+        return bool(claimed)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _update_item(item_id: int, **fields):
+    """更新条目记录（检查点）"""
+    db = get_db_session()
+    try:
+        db.query(PipelineItem).filter(PipelineItem.id == item_id).update(fields, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _ensure_topic(run_id: int, topic_text: str) -> int:
+    """阶段1：创建主题"""
+    db = get_db_session()
+    try:
+        topic = Topic(topic_text=topic_text, status="draft")
+        db.add(topic)
+        db.flush()
+        db.query(PipelineRun).filter(PipelineRun.id == run_id).update(
+            {PipelineRun.topic_id: topic.id, PipelineRun.stage: RUN_STAGE_TITLES}, synchronize_session=False
+        )
+        db.commit()
+        return topic.id
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _ensure_titles(run_id: int, topic_id: int, topic_text: str, params: Dict):
+    """阶段2：生成标题并为选中的标题创建条目"""
+    db = get_db_session()
+    try:
+        # 标题已保存但条目未创建（上次在两步之间中断）时直接复用已有标题
+        title_ids = [tid for (tid,) in db.query(Title.id).filter(Title.topic_id == topic_id).order_by(Title.id.asc()).all()]
+    finally:
+        db.close()
+
+    if title_ids:
+        logger.info(f"复用已生成的标题: run_id={run_id}, title_ids={title_ids}")
+    else:
+        titles, prompt_text, used_template_id = generate_titles(topic_text, params.get('title_template_id'))
+        if not titles:
+            raise Exception("未能生成标题")
+        title_ids = save_titles_to_db(topic_id, titles, prompt_text, used_template_id)
+
+    title_count = params.get('title_count')
+    selected_ids = title_ids[:title_count] if title_count else title_ids
+
+    db = get_db_session()
+    try:
+        db.query(Title).filter(Title.id.in_(selected_ids)).update({Title.selected: True}, synchronize_session=False)
+        for title_id in selected_ids:
+            db.add(PipelineItem(run_id=run_id, title_id=title_id, stage=ITEM_STAGE_ARTICLE, status="pending"))
+        db.query(PipelineRun).filter(PipelineRun.id == run_id).update(
+            {PipelineRun.stage: RUN_STAGE_ITEMS}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logger.info(f"流水线已选中 {len(selected_ids)} 个标题: run_id={run_id}, title_ids={selected_ids}")
+
+
+def _load_item_context(item_id: int) -> Dict:
+    """读取条目及其关联的标题、短文、HTML"""
+    db = get_db_session()
+    try:
+        item = db.query(PipelineItem).filter(PipelineItem.id == item_id).first()
+        title = db.query(Title).filter(Title.id == item.title_id).first()
+        context = {
+            'item_id': item.id,
+            'title_id': item.title_id,
+            'title_text': title.title_text,
+            'stage': item.stage,
+            'article_id': item.article_id,
+            'html_id': item.html_id,
+            'article_text': None,
+            'html_content': None
+        }
+        # 检查点之前可能已有保存成功但未记录到条目上的结果（保存后、更新检查点前中断）
+        if context['article_id'] is None:
+            article = db.query(Article).filter(Article.title_id == item.title_id).order_by(Article.id.desc()).first()
+        else:
+            article = db.query(Article).filter(Article.id == context['article_id']).first()
+        if article:
+            context['article_id'] = article.id
+            context['article_text'] = article.article_text
+            if context['html_id'] is None:
+                html_output = db.query(HTMLOutput).filter(HTMLOutput.article_id == article.id).order_by(HTMLOutput.id.desc()).first()
+            else:
+                html_output = db.query(HTMLOutput).filter(HTMLOutput.id == context['html_id']).first()
+            if html_output:
+                context['html_id'] = html_output.id
+                context['html_content'] = html_output.html_content
+        return context
+    finally:
+        db.close()
+
+
+def _run_item(item_id: int, params: Dict, wechat_credentials: Tuple[Optional[str], Optional[str]]) -> Dict:
+    """阶段3：对单个标题执行 短文 → HTML → 发布"""
+    if not _claim_item(item_id):
+        logger.warning(f"流水线条目已在执行或已完成，跳过: item_id={item_id}")
+        return {'item_id': item_id, 'success': True, 'skipped': True, 'error': None}
+    context = _load_item_context(item_id)
+    try:
+        if context['article_text'] is None:
+            article_text, prompt_text, used_template_id = generate_article(context['title_text'], params.get('article_template_id'))
+            context['article_id'] = save_article_to_db(context['title_id'], article_text, prompt_text, used_template_id)
+            context['article_text'] = article_text
+        _update_item(item_id, article_id=context['article_id'], stage=ITEM_STAGE_HTML)
+
+        if context['html_content'] is None:
+            html_content, prompt_text, used_template_id = generate_html(context['article_text'], params.get('html_template_id'))
+            context['html_id'] = save_html_to_db(context['article_id'], html_content, prompt_text, used_template_id)
+            context['html_content'] = html_content
+        _update_item(item_id, html_id=context['html_id'], stage=ITEM_STAGE_PUBLISH)
+
+        if params.get('publish', True) and context['stage'] != ITEM_STAGE_DONE:
+            wechat_app_id, wechat_app_secret = wechat_credentials
+            coze_result = call_coze_api(
+                context['title_text'],
+                context['html_content'],
+                wechat_app_id=wechat_app_id,
+                wechat_app_secret=wechat_app_secret
+            )
+            _update_item(item_id, publish_result=json.dumps(coze_result, ensure_ascii=False), stage=ITEM_STAGE_DONE)
+
+        _update_item(item_id, stage=ITEM_STAGE_DONE, status="completed")
+        logger.info(f"流水线条目完成: item_id={item_id}, title_id={context['title_id']}")
+        return {'item_id': item_id, 'success': True, 'skipped': False, 'error': None}
+    except Exception as e:
+        logger.error(f"流水线条目失败: item_id={item_id}, title_id={context['title_id']}, error={e}", exc_info=True)
+        _update_item(item_id, status="failed", error=str(e))
+        return {'item_id': item_id, 'success': False, 'skipped': False, 'error': str(e)}
+
+
+def run_pipeline(run_id: int) -> Dict:
+    """
+    执行（或继续执行）一次流水线运行
+
+    已完成的阶段直接跳过；失败的条目在再次执行时从失败的阶段重试；正在执行的条目不会重复执行。
+    上次执行在发布阶段中断的条目标记为失败、本次不执行，避免同一篇文章被发布两次。
+
+    :param run_id: 运行ID
+    :return: 运行详情（同 get_pipeline_run）
+    """
+    db = get_db_session()
+    try:
+        run = db.query(PipelineRun).filter(PipelineRun.id == run_id).first()
+        if not run:
+            raise Exception(f"流水线运行不存在: run_id={run_id}")
+        topic_text = run.topic_text
+        topic_id = run.topic_id
+        stage = run.stage
+        params = json.loads(run.params)
+        interrupted_ids: List[int] = []
+        if run.status == "running":
+            # 上次执行的任务中断（任务队列只会重新执行中断的任务），遗留的 running 条目没有执行者：
+            # 发布阶段的条目可能已经发出，标记为失败；其他条目重新放回 pending
+            stale = db.query(PipelineItem.id, PipelineItem.stage).filter(
+                PipelineItem.run_id == run_id,
+                PipelineItem.status == "running"
+            ).all()
+            publishing = params.get('publish', True)
+            interrupted_ids = [iid for iid, item_stage in stale if publishing and item_stage == ITEM_STAGE_PUBLISH]
+            if interrupted_ids:
+                db.query(PipelineItem).filter(PipelineItem.id.in_(interrupted_ids)).update(
+                    {PipelineItem.status: "failed", PipelineItem.error: ITEM_PUBLISH_INTERRUPTED_ERROR},
+                    synchronize_session=False
+                )
+                logger.warning(f"流水线条目在发布阶段中断，不自动重新发布: run_id={run_id}, item_ids={interrupted_ids}")
+            db.query(PipelineItem).filter(
+                PipelineItem.run_id == run_id,
+                PipelineItem.status == "running"
+            ).update({PipelineItem.status: "pending"}, synchronize_session=False)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"开始执行流水线: run_id={run_id}, stage={stage}")
+    _update_run(run_id, status="running", error=None)
+    try:
+        if stage == RUN_STAGE_TOPIC:
+            topic_id = _ensure_topic(run_id, topic_text)
+            stage = RUN_STAGE_TITLES
+
+        if stage == RUN_STAGE_TITLES:
+            _ensure_titles(run_id, topic_id, topic_text, params)
+            stage = RUN_STAGE_ITEMS
+
+        db = get_db_session()
+        try:
+            item_ids = [iid for (iid,) in db.query(PipelineItem.id).filter(
+                PipelineItem.run_id == run_id,
+                PipelineItem.status.in_(("pending", "failed")),
+                PipelineItem.id.notin_(interrupted_ids)
+            ).order_by(PipelineItem.id.asc()).all()]
+        finally:
+            db.close()
+
+        results: List[Dict] = []
+        if item_ids:
+            wechat_credentials = get_wechat_credentials(params.get('wechat_config_name')) if params.get('publish', True) else (None, None)
+            workers = max(1, min(PIPELINE_CONCURRENCY, len(item_ids)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pipeline-{run_id}") as executor:
+                run_item = bind_span(_run_item)
+                futures = [executor.submit(run_item, item_id, params, wechat_credentials) for item_id in item_ids]
+                for future in as_completed(futures):
+                    results.append(future.result())
+
+        failed = len([r for r in results if not r['success']]) + len(interrupted_ids)
+        if failed:
+            _update_run(run_id, status="failed", error=f"{failed} 个标题处理失败")
+        elif any(r['skipped'] for r in results):
+            # 跳过的条目由正在执行它们的任务完成，运行状态也由该任务更新
+            logger.warning(f"流水线部分条目在其他任务中执行，不更新运行状态: run_id={run_id}")
+        else:
+            _update_run(run_id, status="completed", stage=RUN_STAGE_DONE)
+    except Exception as e:
+        logger.error(f"流水线执行失败: run_id={run_id}, error={e}", exc_info=True)
+        _update_run(run_id, status="failed", error=str(e))
+
+    return get_pipeline_run(run_id)
+
+
+def get_pipeline_run(run_id: int) -> Optional[Dict]:
+    """获取流水线运行详情（返回字典）"""
+    db = get_db_session()
+    try:
+        run = db.query(PipelineRun).filter(PipelineRun.id == run_id).first()
+        if not run:
+            return None
+        items = db.query(PipelineItem).filter(PipelineItem.run_id == run_id).order_by(PipelineItem.id.asc()).all()
+        return {
+            'id': run.id,
+            'topic_id': run.topic_id,
+            'topic_text': run.topic_text,
+            'status': run.status,
+            'stage': run.stage,
+            'params': json.loads(run.params),
+            'error': run.error,
+            'created_at': run.created_at.isoformat(),
+            'updated_at': run.updated_at.isoformat() if run.updated_at else None,
+            'items': [{
+                'id': item.id,
+                'title_id': item.title_id,
+                'stage': item.stage,
+                'status': item.status,
+                'article_id': item.article_id,
+                'html_id': item.html_id,
+                'publish_result': json.loads(item.publish_result) if item.publish_result else None,
+                'error': item.error
+            } for item in items]
+        }
+    finally:
+        db.close()
@@ -0,0 +1,97 @@
+"""
+提示词内容存储服务
+
+标题/短文/HTML 记录的完整提示词按 SHA-256 去重存放在 prompt_blobs 表中（zlib 压缩），
+记录只保存哈希。同一批生成的标题、用同一模板重新生成的内容共用一份提示词。
+"""
+import hashlib
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import PromptBlob
+
+
+def compute_prompt_hash(prompt_text: str) -> str:
+    """计算提示词的内容哈希"""
+    return hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+
+
+def compress_prompt(prompt_text: str) -> bytes:
+    """压缩提示词文本"""
+    return zlib.compress(prompt_text.encode("utf-8"))
+
+
+def decompress_prompt(content: bytes) -> str:
+    """解压提示词文本"""
+    return zlib.decompress(content).decode("utf-8")
+
+
+def store_prompt(db: Session, prompt_text: str) -> str:
+    """
+    在给定会话中保存提示词（已存在则复用，不提交）
+
+    :param db: 数据库会话
+    :param prompt_text: 完整提示词
+    :return: 提示词哈希
+    """
+    prompt_hash = compute_prompt_hash(prompt_text)
+    if db.get(PromptBlob, prompt_hash) is not None:
+        return prompt_hash
+
+    blob = PromptBlob(hash=prompt_hash, content=compress_prompt(prompt_text), size=len(prompt_text))
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite 的写操作经过单写线程，不会并发插入同一个提示词
+        db.add(blob)
+        db.flush()
+        return prompt_hash
+    try:
+        # 其他数据库可能有多个进程同时写入同一个提示词，冲突时只回滚这一条插入
+        with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        pass
+    return prompt_hash
+
+
+def load_prompts(db: Session, prompt_hashes: Iterable[Optional[str]]) -> Dict[str, str]:
+    """
+    批量读取提示词（一条查询）
+
+    :param db: 数据库会话
+    :param prompt_hashes: 提示词哈希（None 会被忽略）
+    :return: 哈希 -> 完整提示词
+    """
+    hashes = {h for h in prompt_hashes if h}
+    if not hashes:
+        return {}
+    rows = db.query(PromptBlob.hash, PromptBlob.content).filter(PromptBlob.hash.in_(hashes)).all()
+    return {h: decompress_prompt(content) for h, content in rows}
+
+
+def get_record_prompt(db: Session, record) -> str:
+    """
+    获取标题/短文/HTML 记录的完整提示词
+
+    :param db: 数据库会话
+    :param record: Title / Article / HTMLOutput 对象
+    :return: 完整提示词（迁移前的旧数据直接返回 prompt_text 列）
+    """
+    if not record.prompt_hash:
+        return record.prompt_text
+    return load_prompts(db, [record.prompt_hash]).get(record.prompt_hash, record.prompt_text)
+
+
+def fill_list_prompts(db: Session, items: List[Dict], field: str = 'prompt_text'):
+    """
+    列表接口：把查询出的提示词哈希替换为完整提示词（一条查询）
+
+    :param db: 数据库会话
+    :param items: build_page 返回的数据列表，field 字段为提示词哈希
+    :param field: 提示词字段名
+    """
+    prompts = load_prompts(db, [item.get(field) for item in items])
+    for item in items:
+        item[field] = prompts.get(item.get(field), "")
@@ -2,7 +2,10 @@
 提示词模板管理服务
 """
 import os
-from typing import List, Optional, Dict
+import threading
+import time
+from typing import List, Optional, Dict, Set, Tuple
+from config import TITLE_PROMPT_FILE, ARTICLE_PROMPT_FILE, HTML_PROMPT_FILE, PROMPT_CACHE_TTL
 from database import get_db_session
 from models import PromptTemplate
 from utils.logger import logger
@@ -14,6 +17,109 @@ CATEGORIES = {
     "article": "短文生成",
     "html": "HTML生成"
 }
+# 向后兼容：数据库中没有模板时使用的旧版提示词文件
+LEGACY_PROMPT_FILES = {
+    "title": TITLE_PROMPT_FILE,
+    "article": ARTICLE_PROMPT_FILE,
+    "html": HTML_PROMPT_FILE
+}
+
+# 模板注册表：id -> 模板字典，category -> 默认模板字典
+# 在本进程内修改模板时主动失效；PROMPT_CACHE_TTL 秒后也会重新加载，以感知其他进程的修改
+_templates_by_id: Dict[int, Dict] = {}
+_default_by_category: Dict[str, Dict] = {}
+# 本次加载后确认不存在的模板ID：注册表重新加载（失效或过期）前不再为它们重新加载
+_missing_template_ids: Set[int] = set()
+_cache_loaded_at: Optional[float] = None
+_cache_lock = threading.Lock()
+
+
+def _template_to_dict(template: PromptTemplate) -> Dict:
+    """将模板对象转换为字典"""
+    return {
+        'id': template.id,
+        'category': template.category,
+        'name': template.name,
+        'description': template.description,
+        'content': template.content,
+        'is_default': template.is_default
+    }
+
+
+def _ensure_template_cache():
+    """按需（首次访问、失效或过期后）用一次查询加载全部模板"""
+    global _templates_by_id, _default_by_category, _missing_template_ids, _cache_loaded_at
+    loaded_at = _cache_loaded_at
+    if loaded_at is not None and time.monotonic() - loaded_at < PROMPT_CACHE_TTL:
+        return
+
+    with _cache_lock:
+        if _cache_loaded_at is not None and time.monotonic() - _cache_loaded_at < PROMPT_CACHE_TTL:
+            return
+        db = get_db_session()
+        try:
+            templates = db.query(PromptTemplate).order_by(PromptTemplate.id.asc()).all()
+            by_id = {t.id: _template_to_dict(t) for t in templates}
+        finally:
+            db.close()
+
+        # 每个分类的默认模板；没有默认模板时使用该分类的第一个模板
+        defaults: Dict[str, Dict] = {}
+        for template in by_id.values():
+            current = defaults.get(template['category'])
+            if current is None or (template['is_default'] and not current['is_default']):
+                defaults[template['category']] = template
+
+        _templates_by_id = by_id
+        _default_by_category = defaults
+        _missing_template_ids = set()
+        _cache_loaded_at = time.monotonic()
+        logger.debug(f"提示词模板注册表已加载，共 {len(by_id)} 个模板")
+
+
+def invalidate_prompt_cache():
+    """使模板注册表失效（模板新增、删除或默认模板变更后调用）"""
+    global _cache_loaded_at
+    with _cache_lock:
+        _cache_loaded_at = None
+    logger.debug("提示词模板注册表已失效")
+
+
+def resolve_prompt_template(category: str, template_id: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """
+    解析生成时使用的模板内容和模板ID
+
+    指定的模板不存在时使用分类默认模板（不存在的模板ID在注册表过期前只触发一次重新加载）；数据库中没有模板时回退到旧版提示词文件（模板ID为 None）。
+
+    :param category: 模板分类（title/article/html）
+    :param template_id: 指定的模板ID（可选）
+    :return: (模板内容, 模板ID)
+    """
+    _ensure_template_cache()
+    if template_id:
+        template = _templates_by_id.get(template_id)
+        if template is None and template_id not in _missing_template_ids:
+            # 可能是其他进程刚创建的模板，重新加载一次；仍不存在时记住，直到注册表过期前不再重新加载
+            invalidate_prompt_cache()
+            _ensure_template_cache()
+            template = _templates_by_id.get(template_id)
+            if template is None:
+                _missing_template_ids.add(template_id)
+                logger.warning(f"指定的提示词模板不存在，使用默认模板: template_id={template_id}")
+        if template:
+            return template['content'], template['id']
+
+    template = _default_by_category.get(category)
+    if template:
+        return template['content'], template['id']
+
+    # 向后兼容：如果数据库中没有，尝试从文件加载
+    file_path = LEGACY_PROMPT_FILES.get(category)
+    if file_path and os.path.exists(file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read(), None
+
+    raise FileNotFoundError("找不到提示词模板")
 
 
 def load_prompt_from_file(category: str, name: str) -> Optional[str]:
@@ -84,6 +190,7 @@ def init_prompt_templates():
                         continue
         
         db.commit()
+        invalidate_prompt_cache()
         logger.info(f"提示词模板初始化完成，共加载 {total_loaded} 个模板")
     except Exception as e:
         db.rollback()
@@ -114,48 +221,52 @@ def get_prompt_templates(category: str) -> List[Dict]:
 
 def get_prompt_template_by_id(template_id: int) -> Optional[Dict]:
     """根据ID获取提示词模板（返回字典，避免数据库会话问题）"""
-    db = get_db_session()
-    try:
-        template = db.query(PromptTemplate).filter(PromptTemplate.id == template_id).first()
-        if template:
-            return {
-                'id': template.id,
-                'category': template.category,
-                'name': template.name,
-                'description': template.description,
-                'content': template.content,
-                'is_default': template.is_default
-            }
-        return None
-    finally:
-        db.close()
+    _ensure_template_cache()
+    template = _templates_by_id.get(template_id)
+    return dict(template) if template else None
 
 
 def get_default_prompt_template(category: str) -> Optional[Dict]:
     """获取指定分类的默认提示词模板（返回字典）"""
+    _ensure_template_cache()
+    template = _default_by_category.get(category)
+    return dict(template) if template else None
+
+
+def create_prompt_template(category: str, name: str, content: str,
+                           description: Optional[str] = None, is_default: bool = False) -> int:
+    """
+    创建提示词模板
+
+    :param is_default: 是否设为默认模板（会取消同分类下其他模板的默认状态）
+    :return: 新模板ID
+    """
     db = get_db_session()
     try:
-        template = db.query(PromptTemplate).filter(
-            PromptTemplate.category == category,
-            PromptTemplate.is_default == True
-        ).first()
-        
-        # 如果没有默认模板，返回第一个
-        if not template:
-            template = db.query(PromptTemplate).filter(
-                PromptTemplate.category == category
-            ).first()
-        
-        if template:
-            return {
-                'id': template.id,
-                'category': template.category,
-                'name': template.name,
-                'description': template.description,
-                'content': template.content,
-                'is_default': template.is_default
-            }
-        return None
+        # 如果设置为默认模板，需要先取消同分类下其他模板的默认状态
+        if is_default:
+            logger.info(f"设置为默认模板，取消同分类下其他模板的默认状态")
+            db.query(PromptTemplate).filter(
+                PromptTemplate.category == category,
+                PromptTemplate.is_default == True
+            ).update({PromptTemplate.is_default: False}, synchronize_session=False)
+
+        template = PromptTemplate(
+            category=category,
+            name=name,
+            description=description,
+            content=content,
+            is_default=is_default
+        )
+        db.add(template)
+        db.commit()
+        template_id = template.id
+        invalidate_prompt_cache()
+        return template_id
+    except Exception as e:
+        db.rollback()
+        logger.error(f"创建提示词模板失败: category={category}, name={name}, error={e}", exc_info=True)
+        raise e
     finally:
         db.close()
 
@@ -186,6 +297,7 @@ def delete_prompt_template(template_id: int) -> bool:
                 logger.info(f"删除默认模板后，将 {remaining_template.name} 设为默认模板")
         
         db.commit()
+        invalidate_prompt_cache()
         logger.info(f"成功删除提示词模板: {category}/{template_name} (ID: {template_id})")
         return True
     except Exception as e:
@@ -0,0 +1,435 @@
+"""
+Coze 发布服务
+
+调用 Coze 工作流（stream_run）发布文章可能需要几分钟，不在请求线程里执行：
+接口创建一条 publish_records 记录并提交 coze_publish 后台任务，立即返回发布ID。
+后台任务在需要时先生成短文和 HTML，再以流式方式调用 Coze，边接收工作流事件边更新记录中的进度（按事件数/时间间隔节流），
+结束后把结果（或错误）写入记录。
+同一篇文章发布到多个公众号时，每个公众号一条发布记录，由同一个 coze_publish_fanout 任务并发执行，
+HTML 只生成一次，微信配置一次查询取出。
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import COZE_PUBLISH_CONCURRENCY, PUBLISH_PROGRESS_EVENTS, PUBLISH_PROGRESS_INTERVAL
+from database import get_db_session, run_write
+from models import Title, Article, HTMLOutput, PublishRecord
+from services.article_service import generate_article, save_article_to_db
+from services.html_service import generate_html, save_html_to_db
+from services.coze_service import call_coze_api
+from services.config_service import get_wechat_credentials, get_wechat_credentials_bulk
+from utils.logger import logger
+from utils.tracing import bind_span, span, traced
+
+
+PUBLISH_STATUS_PENDING = "pending"
+PUBLISH_STATUS_RUNNING = "running"
+PUBLISH_STATUS_COMPLETED = "completed"
+PUBLISH_STATUS_FAILED = "failed"
+
+# 执行中断（进程崩溃、重启）的发布不自动重发：Coze 工作流可能已经把文章发到公众号，需要人工确认后显式重试
+PUBLISH_INTERRUPTED_ERROR = "发布执行中断，文章可能已经发出；请在公众号后台确认后通过 POST /api/publishes/<id>/retry 重新发布"
+
+# last_event 字段保存的事件 JSON 最大长度，超出时只保存事件类型和截断的 data
+LAST_EVENT_MAX_LENGTH = 2000
+
+
+def create_publish_record(title_id: int, html_template_id: Optional[int] = None,
+                          wechat_config_name: Optional[str] = None) -> int:
+    """
+    创建发布记录（不执行，执行由 coze_publish 任务负责）
+
+    :param title_id: 标题ID
+    :param html_template_id: 生成 HTML 时使用的提示词模板ID（已有 HTML 时不使用）
+    :param wechat_config_name: 微信配置名称（可选）
+    :return: 发布ID
+    """
+    db = get_db_session()
+    try:
+        record = PublishRecord(
+            title_id=title_id,
+            wechat_config_name=wechat_config_name,
+            params=json.dumps({'html_template_id': html_template_id}, ensure_ascii=False),
+            status=PUBLISH_STATUS_PENDING
+        )
+        db.add(record)
+        db.commit()
+        logger.info(f"发布记录已创建: publish_id={record.id}, title_id={title_id}, wechat_config_name={wechat_config_name}")
+        return record.id
+    except Exception as e:
+        db.rollback()
+        logger.error(f"创建发布记录失败: title_id={title_id}, error={e}", exc_info=True)
+        raise e
+    finally:
+        db.close()
+
+
+def _update_publish(publish_id: int, **fields):
+    """更新发布记录（交给单写线程提交，不与生成结果的保存抢锁）"""
+    def write(db):
+        db.query(PublishRecord).filter(PublishRecord.id == publish_id).update(fields, synchronize_session=False)
+
+    run_write(write)
+
+
+def _claim_publish(publish_id: int) -> bool:
+    """将发布从 pending 原子地切换为 running；已在执行、已结束或执行中断的发布返回 False"""
+    def write(db):
+        return db.query(PublishRecord).filter(
+            PublishRecord.id == publish_id,
+            PublishRecord.status == PUBLISH_STATUS_PENDING
+        ).update({
+            PublishRecord.status: PUBLISH_STATUS_RUNNING,
+            PublishRecord.error: None,
+            PublishRecord.event_count: 0,
+            PublishRecord.last_event: None
+        }, synchronize_session=False)
+
+    return bool(run_write(write))
+
+
+def _fail_interrupted(publish_ids: List[int]) -> List[int]:
+    """
+    把上次执行遗留的 running 发布标记为失败
+
+    同一发布只由一个任务执行（任务领取和 _claim_publish 都是原子的），任务开始时仍为 running 的发布
+    说明上次执行在调用 Coze 期间中断。
+    :return: 标记为失败的发布ID
+    """
+    def write(db):
+        interrupted = [publish_id for (publish_id,) in db.query(PublishRecord.id).filter(
+            PublishRecord.id.in_(publish_ids),
+            PublishRecord.status == PUBLISH_STATUS_RUNNING
+        ).all()]
+        if interrupted:
+            db.query(PublishRecord).filter(
+                PublishRecord.id.in_(interrupted),
+                PublishRecord.status == PUBLISH_STATUS_RUNNING
+            ).update({
+                PublishRecord.status: PUBLISH_STATUS_FAILED,
+                PublishRecord.error: PUBLISH_INTERRUPTED_ERROR,
+                PublishRecord.finished_at: datetime.now()
+            }, synchronize_session=False)
+        return interrupted
+
+    interrupted = run_write(write)
+    if interrupted:
+        logger.warning(f"发布执行中断，标记为失败，不自动重新发布: publish_ids={interrupted}")
+    return interrupted
+
+
+def retry_publish(publish_id: int) -> bool:
+    """
+    将失败的发布原子地切换回 pending，准备重新执行（由调用方提交新的 coze_publish 任务）
+
+    :return: 是否切换成功；发布不存在或状态不是 failed 时返回 False
+    """
+    def write(db):
+        return db.query(PublishRecord).filter(
+            PublishRecord.id == publish_id,
+            PublishRecord.status == PUBLISH_STATUS_FAILED
+        ).update({
+            PublishRecord.status: PUBLISH_STATUS_PENDING,
+            PublishRecord.error: None,
+            PublishRecord.result: None,
+            PublishRecord.finished_at: None
+        }, synchronize_session=False)
+
+    return bool(run_write(write))
+
+
+def set_publish_job(publish_id: int, job_id: int):
+    """记录执行发布的后台任务ID"""
+    _update_publish(publish_id, job_id=job_id)
+
+
+def _publish_to_dict(record: PublishRecord, title_text: Optional[str] = None) -> Dict:
+    """将发布记录转换为字典"""
+    return {
+        'id': record.id,
+        'title_id': record.title_id,
+        'title_text': title_text,
+        'html_id': record.html_id,
+        'job_id': record.job_id,
+        'wechat_config_name': record.wechat_config_name,
+        'params': json.loads(record.params) if record.params else {},
+        'status': record.status,
+        'event_count': record.event_count or 0,
+        'last_event': json.loads(record.last_event) if record.last_event else None,
+        'result': json.loads(record.result) if record.result else None,
+        'error': record.error,
+        'created_at': record.created_at.isoformat() if record.created_at else None,
+        'updated_at': record.updated_at.isoformat() if record.updated_at else None,
+        'finished_at': record.finished_at.isoformat() if record.finished_at else None
+    }
+
+
+def _load_records(criterion) -> List[Dict]:
+    """按条件查询发布记录（连同标题文本，一条 SQL），按ID排序"""
+    db = get_db_session()
+    try:
+        rows = db.query(PublishRecord, Title.title_text).join(Title, Title.id == PublishRecord.title_id).filter(
+            criterion
+        ).order_by(PublishRecord.id.asc()).all()
+        return [_publish_to_dict(*row) for row in rows]
+    finally:
+        db.close()
+
+
+def get_publish_record(publish_id: int) -> Optional[Dict]:
+    """根据ID获取发布记录（返回字典）"""
+    records = _load_records(PublishRecord.id == publish_id)
+    return records[0] if records else None
+
+
+@traced(attrs=("title_id",))
+def _ensure_html(title_id: int, html_template_id: Optional[int]) -> Dict:
+    """
+    获取标题对应的 HTML，没有短文或 HTML 时先生成
+
+    :return: {'title_text', 'html_id', 'html_content'}
+    """
+    with span("load_title_content", title_id=title_id):
+        db = get_db_session()
+        try:
+            title = db.query(Title).filter(Title.id == title_id).first()
+            if not title:
+                raise Exception(f"标题不存在: title_id={title_id}")
+            title_text = title.title_text
+            article = db.query(Article.id, Article.article_text).filter(Article.title_id == title_id).first()
+            html_output = None
+            if article:
+                html_output = db.query(HTMLOutput.id, HTMLOutput.html_content).filter(
+                    HTMLOutput.article_id == article.id
+                ).first()
+        finally:
+            db.close()
+
+    # 1. 检查是否已有短文，如果没有则生成
+    if article:
+        logger.info(f"使用已有短文: article_id={article.id}")
+        article_id, article_text = article.id, article.article_text
+    else:
+        logger.info(f"标题没有对应的短文，开始生成短文")
+        article_text, prompt_text, used_template_id = generate_article(title_text)
+        article_id = save_article_to_db(title_id, article_text, prompt_text, used_template_id)
+
+    # 2. 检查是否已有HTML，如果没有则生成
+    if html_output:
+        logger.info(f"使用已有HTML: html_id={html_output.id}")
+        return {'title_text': title_text, 'html_id': html_output.id, 'html_content': html_output.html_content}
+    logger.info(f"短文没有对应的HTML，开始生成HTML")
+    html_content, html_prompt_text, used_html_template_id = generate_html(article_text, html_template_id)
+    html_id = save_html_to_db(article_id, html_content, html_prompt_text, used_html_template_id)
+    return {'title_text': title_text, 'html_id': html_id, 'html_content': html_content}
+
+
+def _event_summary(event: Dict) -> str:
+    """工作流事件的 JSON，过长时截断 data（保持合法 JSON）"""
+    text = json.dumps(event, ensure_ascii=False)
+    if len(text) <= LAST_EVENT_MAX_LENGTH:
+        return text
+    data = event['data'] if isinstance(event['data'], str) else json.dumps(event['data'], ensure_ascii=False)
+    return json.dumps({**event, 'data': data[:LAST_EVENT_MAX_LENGTH // 2], 'truncated': True}, ensure_ascii=False)
+
+
+@traced(attrs=("publish_id",))
+def _execute_publish(publish_id: int, html: Dict, wechat_app_id: Optional[str], wechat_app_secret: Optional[str]):
+    """
+    流式调用 Coze 发布一次，结束后写入结果或错误
+
+    进度不是每个事件都写入：距上次写入满 PUBLISH_PROGRESS_EVENTS 个事件或超过 PUBLISH_PROGRESS_INTERVAL 秒时写一次，
+    结束时随结果一起写入最终的事件数和最近事件。
+    """
+    event_count = 0
+    last_event = None
+    written_count = 0
+    written_at = 0.0
+
+    def on_event(event: Dict):
+        nonlocal event_count, last_event, written_count, written_at
+        event_count += 1
+        last_event = event
+        now = time.monotonic()
+        if event_count - written_count >= PUBLISH_PROGRESS_EVENTS or now - written_at >= PUBLISH_PROGRESS_INTERVAL:
+            _update_publish(publish_id, event_count=event_count, last_event=_event_summary(event))
+            written_count, written_at = event_count, now
+
+    def progress() -> Dict:
+        """最终进度字段"""
+        return {'event_count': event_count, 'last_event': _event_summary(last_event) if last_event else None}
+
+    try:
+        logger.info(f"开始调用Coze API: publish_id={publish_id}, title='{html['title_text']}'")
+        coze_result = call_coze_api(
+            html['title_text'],
+            html['html_content'],
+            wechat_app_id=wechat_app_id,
+            wechat_app_secret=wechat_app_secret,
+            on_event=on_event
+        )
+        _update_publish(publish_id, status=PUBLISH_STATUS_COMPLETED, finished_at=datetime.now(),
+                        result=json.dumps(coze_result, ensure_ascii=False), **progress())
+        logger.info(f"Coze发布成功: publish_id={publish_id}, events={event_count}")
+    except Exception as e:
+        logger.error(f"Coze发布失败: publish_id={publish_id}, error={e}", exc_info=True)
+        _update_publish(publish_id, status=PUBLISH_STATUS_FAILED, error=str(e), finished_at=datetime.now(), **progress())
+
+
+def run_publish(publish_id: int) -> Dict:
+    """
+    执行发布：生成（或复用）HTML，流式调用 Coze 并逐条记录事件进度
+
+    只执行 pending 的发布：已完成或已失败的发布直接返回记录；上次执行中断（仍为 running）的发布标记为失败，
+    不会重复发布，需通过 retry_publish 显式重试。
+
+    :param publish_id: 发布ID
+    :return: 发布记录字典
+    """
+    record = get_publish_record(publish_id)
+    if not record:
+        raise Exception(f"发布记录不存在: publish_id={publish_id}")
+    _fail_interrupted([publish_id])
+    if not _claim_publish(publish_id):
+        record = get_publish_record(publish_id)
+        logger.info(f"发布不是待执行状态，不重复发布: publish_id={publish_id}, status={record['status']}")
+        return record
+
+    logger.info(f"开始执行发布: publish_id={publish_id}, title_id={record['title_id']}")
+    try:
+        html = _ensure_html(record['title_id'], record['params'].get('html_template_id'))
+        _update_publish(publish_id, html_id=html['html_id'])
+        # 获取微信配置（如果提供了配置名称）
+        wechat_app_id, wechat_app_secret = get_wechat_credentials(record['wechat_config_name'])
+    except Exception as e:
+        logger.error(f"Coze发布准备失败: publish_id={publish_id}, error={e}", exc_info=True)
+        _update_publish(publish_id, status=PUBLISH_STATUS_FAILED, error=str(e), finished_at=datetime.now())
+        return get_publish_record(publish_id)
+
+    _execute_publish(publish_id, html, wechat_app_id, wechat_app_secret)
+    return get_publish_record(publish_id)
+
+
+def create_publish_fanout(title_id: int, wechat_config_names: List[str],
+                          html_template_id: Optional[int] = None) -> List[int]:
+    """
+    为同一个标题创建多个公众号的发布记录（一个事务，重复的配置名称只发布一次）
+
+    :param title_id: 标题ID
+    :param wechat_config_names: 微信配置名称列表
+    :param html_template_id: 生成 HTML 时使用的提示词模板ID（已有 HTML 时不使用）
+    :return: 与去重后的配置名称顺序一致的发布ID列表
+    """
+    names = list(dict.fromkeys(wechat_config_names))
+    db = get_db_session()
+    try:
+        params = json.dumps({'html_template_id': html_template_id}, ensure_ascii=False)
+        records = [
+            PublishRecord(title_id=title_id, wechat_config_name=name, params=params, status=PUBLISH_STATUS_PENDING)
+            for name in names
+        ]
+        db.add_all(records)
+        db.commit()
+        publish_ids = [record.id for record in records]
+        logger.info(f"多公众号发布记录已创建: title_id={title_id}, publish_ids={publish_ids}, wechat_config_names={names}")
+        return publish_ids
+    except Exception as e:
+        db.rollback()
+        logger.error(f"创建多公众号发布记录失败: title_id={title_id}, error={e}", exc_info=True)
+        raise e
+    finally:
+        db.close()
+
+
+def set_publishes_job(publish_ids: List[int], job_id: int):
+    """记录执行这批发布的后台任务ID（同一任务的发布记录即为一次多公众号发布）"""
+    def write(db):
+        db.query(PublishRecord).filter(PublishRecord.id.in_(publish_ids)).update(
+            {PublishRecord.job_id: job_id}, synchronize_session=False
+        )
+
+    run_write(write)
+
+
+def _build_report(records: List[Dict]) -> Dict:
+    """汇总多公众号发布结果"""
+    return {
+        'title_id': records[0]['title_id'] if records else None,
+        'title_text': records[0]['title_text'] if records else None,
+        'total': len(records),
+        'succeeded': sum(1 for r in records if r['status'] == PUBLISH_STATUS_COMPLETED),
+        'failed': sum(1 for r in records if r['status'] == PUBLISH_STATUS_FAILED),
+        'pending': sum(1 for r in records if r['status'] in (PUBLISH_STATUS_PENDING, PUBLISH_STATUS_RUNNING)),
+        'items': [{
+            'publish_id': r['id'],
+            'wechat_config_name': r['wechat_config_name'],
+            'status': r['status'],
+            'html_id': r['html_id'],
+            'event_count': r['event_count'],
+            'error': r['error'],
+            'coze_result': r['result']
+        } for r in records]
+    }
+
+
+def get_publish_report(job_id: int) -> Optional[Dict]:
+    """
+    获取一次多公众号发布的汇总报告（执行中也可查询）
+
+    :param job_id: 发布任务ID
+    :return: 汇总报告，任务没有发布记录时返回 None
+    """
+    records = _load_records(PublishRecord.job_id == job_id)
+    return _build_report(records) if records else None
+
+
+def run_publish_fanout(publish_ids: List[int], concurrency: Optional[int] = None) -> Dict:
+    """
+    执行多公众号发布：HTML 只生成（或读取）一次，所有微信配置一次查询取出，再并发调用 Coze
+
+    单个公众号失败不影响其他公众号；重复执行时只执行 pending 的发布，
+    上次执行中断的发布标记为失败（不自动重发，同 run_publish）。
+
+    :param publish_ids: 同一标题的发布ID列表（create_publish_fanout 的返回值）
+    :param concurrency: 并发数，默认且最大为 COZE_PUBLISH_CONCURRENCY
+    :return: 汇总报告（total/succeeded/failed 及每个公众号的状态）
+    """
+    records = _load_records(PublishRecord.id.in_(publish_ids))
+    if not records:
+        raise Exception(f"发布记录不存在: publish_ids={publish_ids}")
+
+    _fail_interrupted([r['id'] for r in records])
+    pending = [r for r in records if r['status'] == PUBLISH_STATUS_PENDING and _claim_publish(r['id'])]
+    workers = max(1, min(concurrency or COZE_PUBLISH_CONCURRENCY, COZE_PUBLISH_CONCURRENCY, len(pending) or 1))
+    logger.info(f"开始多公众号发布: title_id={records[0]['title_id']}, publish_ids={publish_ids}, "
+                f"待发布={len(pending)}, concurrency={workers}")
+
+    if pending:
+        pending_ids = [r['id'] for r in pending]
+        try:
+            html = _ensure_html(records[0]['title_id'], records[0]['params'].get('html_template_id'))
+            credentials = get_wechat_credentials_bulk([r['wechat_config_name'] for r in pending])
+        except Exception as e:
+            logger.error(f"多公众号发布准备失败: publish_ids={pending_ids}, error={e}", exc_info=True)
+            for publish_id in pending_ids:
+                _update_publish(publish_id, status=PUBLISH_STATUS_FAILED, error=str(e), finished_at=datetime.now())
+            return _build_report(_load_records(PublishRecord.id.in_(publish_ids)))
+
+        def publish_one(record: Dict):
+            _update_publish(record['id'], html_id=html['html_id'])
+            wechat_app_id, wechat_app_secret = credentials.get(record['wechat_config_name'], (None, None))
+            if not wechat_app_id or not wechat_app_secret:
+                _update_publish(record['id'], status=PUBLISH_STATUS_FAILED, finished_at=datetime.now(),
+                                error=f"微信配置不存在或不完整: {record['wechat_config_name']}")
+                return
+            _execute_publish(record['id'], html, wechat_app_id, wechat_app_secret)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coze-publish") as executor:
+            list(executor.map(bind_span(publish_one), pending))
+
+    report = _build_report(_load_records(PublishRecord.id.in_(publish_ids)))
+    logger.info(f"多公众号发布完成: 成功 {report['succeeded']}/{report['total']}, 失败 {report['failed']}")
+    return report
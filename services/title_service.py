@@ -1,55 +1,43 @@
 """
 标题生成服务
 """
-from typing import List, Tuple, Optional
-import os
-from utils.api import get_gemini_response
+from typing import List, Tuple, Optional, Iterator
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from config import TITLE_TEMPERATURE, TITLE_MAX_TOKENS
+from utils.api import get_gemini_response, stream_gemini_response, async_get_gemini_response
 from utils.text_parser import parse_titles
-from database import get_db_session
+from database import run_write
 from models import Title
-from services.prompt_service import get_prompt_template_by_id, get_default_prompt_template
+from services.prompt_service import resolve_prompt_template
+from services.prompt_blob_service import store_prompt
 from utils.logger import logger
+from utils.metrics import DB_SAVE_SECONDS
+from utils.prompt_budget import output_token_budget
+from utils.tracing import traced
 
 
-def load_prompt_template(template_id: Optional[int] = None) -> str:
-    """读取提示词模板"""
-    from database import get_db_session
-    from models import PromptTemplate
+def build_title_prompt(topic: str, template_id: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """
+    组装标题生成的完整提示词
     
-    db = get_db_session()
-    try:
-        if template_id:
-            template = db.query(PromptTemplate).filter(PromptTemplate.id == template_id).first()
-            if template:
-                return template.content
-        
-        # 使用默认模板
-        template = db.query(PromptTemplate).filter(
-            PromptTemplate.category == "title",
-            PromptTemplate.is_default == True
-        ).first()
-        
-        if not template:
-            # 如果没有默认模板，返回第一个
-            template = db.query(PromptTemplate).filter(
-                PromptTemplate.category == "title"
-            ).first()
-        
-        if template:
-            return template.content
-    finally:
-        db.close()
-    
-    # 向后兼容：如果数据库中没有，尝试从文件加载
-    PROMPT_FILE_PATH = "标题生成提示词"
-    if os.path.exists(PROMPT_FILE_PATH):
-        with open(PROMPT_FILE_PATH, "r", encoding="utf-8") as f:
-            return f.read()
-    
-    raise FileNotFoundError("找不到提示词模板")
+    :param topic: 文章主题
+    :param template_id: 提示词模板ID（可选）
+    :return: (完整提示词, 模板ID)
+    """
+    # 1. 从模板注册表解析模板内容和模板ID（内存查找，不访问数据库）
+    template_content, used_template_id = resolve_prompt_template("title", template_id)
+    logger.debug(f"提示词模板解析完成: template_id={used_template_id}, 长度: {len(template_content)} 字符")
+    
+    # 2. 替换占位符
+    final_prompt = template_content.replace("{{topic}}", topic)
+    logger.debug(f"提示词准备完成，最终长度: {len(final_prompt)} 字符")
+    
+    return final_prompt, used_template_id
 
 
-def generate_titles(topic: str, template_id: Optional[int] = None) -> Tuple[List[str], str, Optional[int]]:
+@traced()
+def generate_titles(topic: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[List[str], str, Optional[int]]:
     """
     生成标题列表并自动解析
     
@@ -58,45 +46,16 @@ def generate_titles(topic: str, template_id: Optional[int] = None) -> Tuple[List
     :return: (标题列表, 完整提示词, 模板ID)
     """
     logger.info(f"开始生成标题: topic='{topic}', template_id={template_id}")
+    final_prompt, used_template_id = build_title_prompt(topic, template_id)
     
-    # 1. 读取模板
-    template_content = load_prompt_template(template_id)
-    logger.debug(f"提示词模板加载成功，长度: {len(template_content)} 字符")
-    
-    # 2. 获取模板ID
-    from database import get_db_session
-    from models import PromptTemplate
-    
-    db = get_db_session()
-    try:
-        if template_id:
-            used_template_id = template_id
-            logger.info(f"使用指定模板: template_id={template_id}")
-        else:
-            # 获取默认模板ID
-            default_template = db.query(PromptTemplate).filter(
-                PromptTemplate.category == "title",
-                PromptTemplate.is_default == True
-            ).first()
-            if not default_template:
-                default_template = db.query(PromptTemplate).filter(
-                    PromptTemplate.category == "title"
-                ).first()
-            used_template_id = default_template.id if default_template else None
-            logger.info(f"使用默认模板: template_id={used_template_id}")
-    finally:
-        db.close()
-    
-    # 3. 替换占位符
-    final_prompt = template_content.replace("{{topic}}", topic)
-    logger.debug(f"提示词准备完成，最终长度: {len(final_prompt)} 字符")
-    
-    # 4. 调用 API 生成标题
+    # 调用 API 生成标题
     logger.info("正在调用API生成标题...")
-    raw_output = get_gemini_response(final_prompt, temperature=0.8, max_tokens=2048)
+    raw_output = get_gemini_response(final_prompt, temperature=TITLE_TEMPERATURE,
+                                     max_tokens=output_token_budget(final_prompt, TITLE_MAX_TOKENS),
+                                     use_cache=use_cache, stage="title")
     logger.info(f"API返回原始内容长度: {len(raw_output)} 字符")
     
-    # 5. 解析标题列表
+    # 解析标题列表
     logger.info("正在解析标题列表...")
     titles = parse_titles(raw_output)
     logger.info(f"标题解析完成，共 {len(titles)} 个标题: {titles}")
@@ -104,6 +63,89 @@ def generate_titles(topic: str, template_id: Optional[int] = None) -> Tuple[List
     return titles, final_prompt, used_template_id
 
 
+@traced()
+async def async_generate_titles(topic: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[List[str], str, Optional[int]]:
+    """
+    generate_titles 的协程版本（在事件循环中调用 Gemini，不占用线程）
+    
+    :param topic: 文章主题
+    :param template_id: 提示词模板ID（可选）
+    :return: (标题列表, 完整提示词, 模板ID)
+    """
+    logger.info(f"开始异步生成标题: topic='{topic}', template_id={template_id}")
+    final_prompt, used_template_id = build_title_prompt(topic, template_id)
+    raw_output = await async_get_gemini_response(final_prompt, temperature=TITLE_TEMPERATURE,
+                                                 max_tokens=output_token_budget(final_prompt, TITLE_MAX_TOKENS),
+                                                 use_cache=use_cache, stage="title")
+    titles = parse_titles(raw_output)
+    logger.info(f"标题解析完成，共 {len(titles)} 个标题: {titles}")
+    return titles, final_prompt, used_template_id
+
+
+def stream_titles(topic: str, template_id: Optional[int] = None, use_cache: bool = True) -> Tuple[Iterator[str], str, Optional[int]]:
+    """
+    流式生成标题（原始文本片段，拼接后用 parse_titles 解析）
+    
+    :param topic: 文章主题
+    :param template_id: 提示词模板ID（可选）
+    :return: (文本片段生成器, 完整提示词, 模板ID)
+    """
+    logger.info(f"开始流式生成标题: topic='{topic}', template_id={template_id}")
+    final_prompt, used_template_id = build_title_prompt(topic, template_id)
+    chunks = stream_gemini_response(final_prompt, temperature=TITLE_TEMPERATURE,
+                                    max_tokens=output_token_budget(final_prompt, TITLE_MAX_TOKENS),
+                                    use_cache=use_cache, stage="title")
+    return chunks, final_prompt, used_template_id
+
+
+def insert_titles(db: Session, topic_id: int, titles: List[str], prompt_text: str, template_id: Optional[int] = None) -> List[int]:
+    """
+    在给定会话中批量插入同一批标题（不提交）
+    
+    支持 INSERT ... RETURNING 的数据库（SQLite 3.35+、PostgreSQL）用一条多行 INSERT 插入全部标题并取回ID；
+    其他数据库（如 MySQL）逐行插入。
+    
+    :param db: 数据库会话
+    :param topic_id: 主题ID
+    :param titles: 标题列表
+    :param prompt_text: 完整提示词（同一批标题共用）
+    :param template_id: 提示词模板ID（可选）
+    :return: 标题ID列表，顺序与 titles 一致
+    """
+    if not titles:
+        return []
+    
+    # 同一批标题共用一份提示词
+    prompt_hash = store_prompt(db, prompt_text)
+    rows = [{
+        'topic_id': topic_id,
+        'title_text': title_text,
+        'prompt_text': "",
+        'prompt_hash': prompt_hash,
+        'prompt_template_id': template_id,
+        'selected': False
+    } for title_text in titles]
+    
+    dialect = db.get_bind().dialect
+    if dialect.name == "sqlite" and dialect.insert_executemany_returning:
+        # SQLite 在一条语句内按 VALUES 顺序依次分配自增ID，排序后即与输入顺序一致
+        # （要求 SQLAlchemy 保证返回顺序时，SQLite 会退化为逐行插入）
+        result = db.execute(insert(Title).returning(Title.id), rows)
+        return sorted(title_id for (title_id,) in result)
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.execute(insert(Title).returning(Title.id, sort_by_parameter_order=True), rows)
+        return [title_id for (title_id,) in result]
+    
+    title_ids = []
+    for row in rows:
+        title = Title(**row)
+        db.add(title)
+        db.flush()  # 获取ID
+        title_ids.append(title.id)
+    return title_ids
+
+
+@traced(attrs=("topic_id",))
 def save_titles_to_db(topic_id: int, titles: List[str], prompt_text: str, template_id: Optional[int] = None) -> List[int]:
     """
     保存标题和提示词到数据库
@@ -114,29 +156,13 @@ def save_titles_to_db(topic_id: int, titles: List[str], prompt_text: str, templa
     :return: 保存的标题ID列表
     """
     logger.info(f"开始保存标题到数据库: topic_id={topic_id}, titles_count={len(titles)}")
-    db = get_db_session()
+    
     try:
-        title_ids = []
-        for idx, title_text in enumerate(titles, 1):
-            logger.debug(f"保存标题 {idx}/{len(titles)}: '{title_text[:30]}...'")
-            title = Title(
-                topic_id=topic_id,
-                title_text=title_text,
-                prompt_text=prompt_text,
-                prompt_template_id=template_id,
-                selected=False
-            )
-            db.add(title)
-            db.flush()  # 获取ID
-            title_ids.append(title.id)
-        
-        db.commit()
+        # 写操作交给单写线程提交，避免并发保存时抢锁
+        with DB_SAVE_SECONDS.time("titles"):
+            title_ids = run_write(lambda db: insert_titles(db, topic_id, titles, prompt_text, template_id))
         logger.info(f"标题保存成功，共 {len(title_ids)} 个，ID列表: {title_ids}")
         return title_ids
     except Exception as e:
-        db.rollback()
         logger.error(f"保存标题失败: {e}", exc_info=True)
         raise e
-    finally:
-        db.close()
-
@@ -59,6 +59,117 @@ async function apiCall(endpoint, options = {}) {
     }
 }
 
+/**
+ * 调用分页列表接口并取回全部数据
+ * 列表接口每页最多返回 LIST_PAGE_SIZE 条，按 next_cursor 依次请求后续页并合并
+ * @param {string} endpoint - API端点（会自动添加/api前缀），可带 fields 等查询参数
+ * @returns {Promise<object>} 与 apiCall 相同的响应结构，data 中的列表为全部页合并后的结果
+ */
+async function apiCallAllPages(endpoint) {
+    const separator = endpoint.includes('?') ? '&' : '?';
+    const result = await apiCall(endpoint);
+    let cursor = result.next_cursor;
+    while (cursor) {
+        const page = await apiCall(`${endpoint}${separator}cursor=${encodeURIComponent(cursor)}`);
+        if (Array.isArray(result.data)) {
+            result.data.push(...page.data);
+        } else {
+            // 标题列表的 data 为 {topic, titles}
+            for (const key of Object.keys(result.data)) {
+                if (Array.isArray(result.data[key])) {
+                    result.data[key].push(...page.data[key]);
+                }
+            }
+        }
+        cursor = page.next_cursor;
+    }
+    result.next_cursor = null;
+    return result;
+}
+
+/**
+ * 等待后台生成任务完成
+ * 生成类接口返回任务ID后，通过长轮询 /api/jobs/<id>?wait=N 等待任务结束
+ * @param {number} jobId - 任务ID
+ * @param {number} waitSeconds - 每次长轮询的最长等待秒数
+ * @returns {Promise<object>} 任务结果数据（与原同步接口返回的 data 结构一致）
+ */
+async function waitForJob(jobId, waitSeconds = 15) {
+    while (true) {
+        const result = await apiCall(`/jobs/${jobId}?wait=${waitSeconds}`);
+        const job = result.data;
+        if (job.status === 'completed') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || '任务执行失败');
+        }
+    }
+}
+
+/**
+ * 调用流式生成接口（Server-Sent Events）
+ * 每收到一个 token 事件调用 onToken，结束后返回 done 事件的数据
+ * @param {string} endpoint - API端点（会自动添加/api前缀）
+ * @param {object} body - 请求体
+ * @param {function} onToken - 回调函数 (片段文本, 已接收的完整文本)
+ * @returns {Promise<object>} done 事件数据（与非流式接口返回的 data 结构一致）
+ */
+async function streamApiCall(endpoint, body, onToken) {
+    if (!endpoint.startsWith('/')) {
+        endpoint = '/' + endpoint;
+    }
+    if (!endpoint.startsWith('/api')) {
+        endpoint = '/api' + endpoint;
+    }
+    
+    const response = await fetch(endpoint, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(body || {})
+    });
+    if (!response.ok) {
+        let errorMessage = `请求失败 (${response.status})`;
+        try {
+            errorMessage = (await response.json()).error || errorMessage;
+        } catch (e) {}
+        throw new Error(errorMessage);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    let fullText = '';
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, {stream: true});
+        
+        // 事件之间以空行分隔
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventName = 'message';
+            let dataStr = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataStr += line.slice(5).trim();
+            });
+            const data = dataStr ? JSON.parse(dataStr) : {};
+            if (eventName === 'token') {
+                fullText += data.text;
+                if (onToken) onToken(data.text, fullText);
+            } else if (eventName === 'done') {
+                return data;
+            } else if (eventName === 'error') {
+                throw new Error(data.error || '生成失败');
+            }
+        }
+    }
+    throw new Error('连接已断开，生成未完成');
+}
+
 /**
  * 显示错误信息
  * @param {HTMLElement|string} element - 目标元素或元素ID
@@ -0,0 +1,23 @@
+"""
+测试公共配置
+
+DATABASE_URL、LOG_DIR 等在导入 config 时读取，所以在导入任何项目模块之前指向临时目录，
+测试不会读写 data/ 和 logs/ 下的真实数据。
+"""
+import logging
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEST_DIR = tempfile.mkdtemp(prefix="article_tests_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(TEST_DIR, 'articles.db')}")
+os.environ["LOG_DIR"] = os.path.join(TEST_DIR, "logs")
+os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from utils.logger import logger  # noqa: E402
+
+logger.setLevel(logging.WARNING)
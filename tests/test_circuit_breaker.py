@@ -0,0 +1,54 @@
+"""
+熔断器状态切换测试
+"""
+import pytest
+
+from utils.circuit_breaker import (CircuitBreaker, CircuitOpenError, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN)
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    """连续失败熔断后，冷却时间已过的熔断器"""
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+    for _ in range(2):
+        breaker.after_call(breaker.before_call(), success=False)
+    assert breaker.state == STATE_OPEN
+    breaker.recovery_timeout = 0
+    assert breaker.state == STATE_HALF_OPEN
+    return breaker
+
+
+def test_late_success_does_not_close_open_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+    # 熔断前放行的慢请求
+    slow_call = breaker.before_call()
+    for _ in range(2):
+        breaker.after_call(breaker.before_call(), success=False)
+    assert breaker.state == STATE_OPEN
+
+    breaker.after_call(slow_call, success=True)
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_late_success_does_not_close_half_open_breaker():
+    breaker = _half_open_breaker()
+    breaker.after_call(False, success=True)
+    assert breaker.state == STATE_HALF_OPEN
+
+
+def test_probe_success_closes_breaker():
+    breaker = _half_open_breaker()
+    probe = breaker.before_call()
+    assert probe
+    breaker.after_call(probe, success=True)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.snapshot()['consecutive_failures'] == 0
+
+
+def test_probe_failure_reopens_breaker():
+    breaker = _half_open_breaker()
+    probe = breaker.before_call()
+    breaker.recovery_timeout = 60
+    breaker.after_call(probe, success=False)
+    assert breaker.state == STATE_OPEN
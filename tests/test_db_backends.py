@@ -0,0 +1,196 @@
+"""
+数据库后端兼容性测试
+
+实际运行：每个后端新建一个引擎，把 database 模块的引擎和会话工厂临时切换过去，
+执行 init_db（两次，验证迁移幂等）、保存标题/短文/HTML（含超过 64KB 的长文本）、提示词去重、
+列表游标分页、任务领取和 configs 唯一约束。默认只有临时 SQLite 文件；
+TEST_DATABASE_URLS 环境变量（逗号分隔）可追加 MySQL/PostgreSQL 等数据库，未安装对应驱动时跳过。
+这些数据库应使用专门的空库，测试写入的数据不会清理。
+
+离线检查：不需要数据库服务和驱动，用 SQLAlchemy mock engine 把全部建表语句和列表查询编译为 MySQL、PostgreSQL 方言。
+"""
+import os
+import tempfile
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_mock_engine, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query
+
+import database
+from database import Base, create_db_engine, init_db, get_db_session
+from migrations import schema_migrations
+from models import Topic, Title, Article, HTMLOutput, Config, GenerationJob, PromptBlob
+from services.title_service import save_titles_to_db
+from services.article_service import save_article_to_db
+from services.html_service import save_html_to_db
+from services.job_service import _claim_job
+from utils.compression import uses_binary_storage
+from utils.pagination import paginate, encode_cursor
+import app as app_module
+
+OFFLINE_DIALECTS = ("mysql", "postgresql")
+
+
+def _backend_urls():
+    """实际运行的数据库：临时 SQLite 文件 + TEST_DATABASE_URLS 中的数据库"""
+    urls = [f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='db_backends_'), 'articles.db')}"]
+    urls += [url.strip() for url in os.getenv("TEST_DATABASE_URLS", "").split(",") if url.strip()]
+    return urls
+
+
+def _backend_id(url: str) -> str:
+    return make_url(url).get_backend_name()
+
+
+@pytest.fixture(scope="module", params=_backend_urls(), ids=_backend_id)
+def backend(request):
+    """把 database 模块切换到指定数据库，返回引擎；模块结束后恢复原引擎"""
+    try:
+        engine = create_db_engine(request.param)
+    except ImportError as e:
+        pytest.skip(f"未安装数据库驱动: {e}")
+
+    original = (database.engine, database.SERIALIZE_WRITES)
+    database.SessionLocal.remove()
+    database.engine = engine
+    database.SERIALIZE_WRITES = engine.dialect.name == "sqlite"
+    database._session_factory.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        database.SessionLocal.remove()
+        database.engine, database.SERIALIZE_WRITES = original
+        database._session_factory.configure(bind=original[0])
+        engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def topic_id(backend):
+    init_db()
+    db = get_db_session()
+    try:
+        topic = Topic(topic_text="兼容性检查", status="draft")
+        db.add(topic)
+        db.commit()
+        return topic.id
+    finally:
+        db.close()
+
+
+def _prompt_blob_count() -> int:
+    db = get_db_session()
+    try:
+        return db.query(PromptBlob).count()
+    finally:
+        db.close()
+
+
+def test_init_db_is_idempotent(backend):
+    init_db()
+    init_db()
+
+
+def test_long_text_and_prompt_dedup(backend, topic_id):
+    blobs_before = _prompt_blob_count()
+    long_prompt = "p" * 70000
+    title_ids = save_titles_to_db(topic_id, [f"标题{i}" for i in range(5)], long_prompt)
+    article_text = "长文本" * 30000
+    article_id = save_article_to_db(title_ids[0], article_text, "p")
+    html_content = "<p>html</p>" * 10000
+    html_id = save_html_to_db(article_id, html_content, "p")
+
+    client = app_module.app.test_client()
+    for title_id in title_ids:
+        body = client.get(f"/api/titles/{title_id}/prompt").get_json()
+        assert body['data']['prompt_text'] == long_prompt
+    body = client.get(f"/api/html/{html_id}").get_json()
+    assert body['data']['html_content'] == html_content
+    db = get_db_session()
+    try:
+        assert db.get(Article, article_id).article_text == article_text
+    finally:
+        db.close()
+    # 5 个标题共用一份，短文与 HTML 的提示词相同
+    assert _prompt_blob_count() - blobs_before == 2
+
+
+def test_cursor_pagination(backend, topic_id):
+    title_ids = save_titles_to_db(topic_id, [f"分页标题{i}" for i in range(5)], "p")
+    client = app_module.app.test_client()
+    seen = []
+    cursor = None
+    while True:
+        url = f"/api/topics/{topic_id}/titles?fields=id,title_text&limit=2" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url).get_json()
+        assert body['success'], body
+        seen += [t['id'] for t in body['data']['titles']]
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen))
+    assert set(title_ids) <= set(seen)
+
+
+@pytest.mark.parametrize("url", ["/api/topics?limit=10", "/api/articles?fields=id,preview&limit=10", "/api/html?limit=10"])
+def test_list_endpoints(backend, topic_id, url):
+    body = app_module.app.test_client().get(url).get_json()
+    assert body['success'], body
+
+
+def test_claim_job_is_atomic(backend, topic_id):
+    db = get_db_session()
+    try:
+        job = GenerationJob(job_type="title", status="pending", params="{}", attempts=0)
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+    assert _claim_job(job_id) is not None
+    assert _claim_job(job_id) is None
+
+
+def test_config_unique_constraint(backend, topic_id):
+    name = f"check-{datetime.now().timestamp()}"
+    db = get_db_session()
+    try:
+        db.add(Config(name=name, key="WECHAT_APP_ID", value="a"))
+        db.commit()
+        db.add(Config(name=name, key="WECHAT_APP_ID", value="b"))
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.rollback()
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("dialect_name", OFFLINE_DIALECTS)
+def test_schema_and_list_queries_compile(dialect_name):
+    statements = []
+    mock_engine = create_mock_engine(f"{dialect_name}://", lambda sql, *a, **kw: statements.append(sql))
+    dialect = mock_engine.dialect
+    Base.metadata.create_all(mock_engine, checkfirst=False)
+    schema_migrations.create(mock_engine, checkfirst=False)
+    ddl = [str(statement.compile(dialect=dialect)) for statement in statements]
+
+    cursor = encode_cursor(datetime.now(), 100)
+    queries = [
+        paginate(Query([Topic.id, Topic.topic_text, func.count(Title.id)]).join(Title, Title.topic_id == Topic.id).group_by(Topic.id),
+                 Topic.created_at, Topic.id, 50, cursor),
+        paginate(Query([Article.id, Title.title_text, Article.preview]).join(Title, Article.title_id == Title.id),
+                 Article.created_at, Article.id, 50, cursor),
+        paginate(Query([HTMLOutput.id, Title.title_text]).join(Article, HTMLOutput.article_id == Article.id).join(Title, Article.title_id == Title.id),
+                 HTMLOutput.created_at, HTMLOutput.id, 50, None),
+    ]
+    for query in queries:
+        assert "LIMIT" in str(query.statement.compile(dialect=dialect)).upper()
+
+    long_text = "LONGTEXT" if dialect_name == "mysql" else "TEXT"
+    # 开启 TEXT_COMPRESSION 时短文/HTML 内容列为二进制类型
+    content_type = ("LONGBLOB" if dialect_name == "mysql" else "BYTEA") if uses_binary_storage(dialect_name) else long_text
+    articles_ddl = next(sql for sql in ddl if "CREATE TABLE articles" in sql)
+    assert f"article_text {content_type}" in articles_ddl
+    assert f"prompt_text {long_text}" in articles_ddl
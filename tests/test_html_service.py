@@ -0,0 +1,42 @@
+"""
+分段流式生成HTML的拼接测试
+
+模型输出的每段可能带代码块标记，流式拼接结果（也是保存到数据库的内容）应与非流式的 _stitch_sections 一致。
+"""
+import itertools
+
+import pytest
+
+from services import html_service
+from services.html_service import _stitch_sections, _strip_section_stream
+
+SECTIONS = [
+    "```html\n<section>第一段</section>\n```",
+    "<section>第二段 `code` ``</section>",
+    "  ```\n<section><pre>```x```</pre></section>\n```  \n",
+    "```HTML<section>第四段</section>```",
+    "\n\n<section>第五段</section>\n\n",
+    "```",
+]
+
+
+def _split(text: str, size: int):
+    """按固定长度切块，模拟流式输出的分块"""
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+@pytest.mark.parametrize("section, size", list(itertools.product(SECTIONS, (1, 2, 3, 5, 1000))))
+def test_strip_section_stream_matches_stitch(section, size):
+    assert "".join(_strip_section_stream(_split(section, size))) == _stitch_sections([section])
+
+
+def test_stream_html_stitches_sections(monkeypatch):
+    requests = [(f"prompt-{i}", 100) for i in range(len(SECTIONS))]
+    outputs = dict(zip((prompt for prompt, _ in requests), SECTIONS))
+    monkeypatch.setattr(html_service, "plan_html_requests", lambda *a, **kw: (requests, "final", None))
+    monkeypatch.setattr(html_service, "stream_gemini_response", lambda prompt, **kw: iter(_split(outputs[prompt], 4)))
+
+    chunks, prompt_text, template_id = html_service.stream_html("短文")
+    html = "".join(chunks)
+    assert html == _stitch_sections(SECTIONS)
+    assert "```html" not in html and not html.endswith("```")
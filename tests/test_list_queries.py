@@ -0,0 +1,110 @@
+"""
+列表查询 SQL 条数回归测试
+
+在同一个数据库上先写入少量数据、再追加到数千行，统计每个列表接口和 CLI 列表命令执行的 SQL 条数：
+条数不能超过 MAX_STATEMENTS，也不能随数据量增长（出现 N+1 查询时会随行数增长）。
+"""
+import contextlib
+import io
+
+import pytest
+from sqlalchemy import event
+
+from database import engine, get_db_session
+from models import Topic, Title, Article, HTMLOutput
+import app as app_module
+import cli
+from benchmarks.bench_list_queries import _seed as seed_rows
+
+# 每个列表请求最多允许的 SQL 条数（与数据量无关）
+MAX_STATEMENTS = 3
+# 两轮数据量：主题数（每个主题 3 个标题，每个标题一篇短文和一个HTML）
+SMALL_TOPICS = 10
+LARGE_TOPICS = 1000
+TITLES_PER_TOPIC = 3
+
+
+def _seed_topics(topics: int) -> int:
+    """追加测试数据（与基准测试相同的数据形态），返回最新一个有标题的主题ID"""
+    db = get_db_session()
+    try:
+        seed_rows(db, (Topic, Title, Article, HTMLOutput), topics, TITLES_PER_TOPIC)
+        return db.query(Title.topic_id).order_by(Title.id.desc()).first()[0]
+    finally:
+        db.close()
+
+
+# (名称, URL)；{topic_id} 替换为有标题的主题ID
+LIST_REQUESTS = [
+    ("GET /api/topics", "/api/topics"),
+    ("GET /api/topics?limit=50", "/api/topics?limit=50"),
+    ("GET /api/topics/<id>/titles", "/api/topics/{topic_id}/titles"),
+    ("GET /api/articles", "/api/articles"),
+    ("GET /api/articles?fields=prompt_text", "/api/articles?fields=id,prompt_text&limit=50"),
+    ("GET /api/html", "/api/html"),
+]
+CLI_COMMANDS = [
+    ("cli.list_topics", cli.list_topics),
+    ("cli.view_articles", cli.view_articles),
+    ("cli.view_html_outputs", cli.view_html_outputs),
+]
+CHECK_NAMES = [name for name, _ in LIST_REQUESTS + CLI_COMMANDS]
+
+
+def _run_checks(client, topic_id: int, statements: list) -> dict:
+    """依次调用每个列表接口和 CLI 命令，返回 {名称: SQL 条数}；接口调用同时检查返回成功"""
+    counts = {}
+    for name, url in LIST_REQUESTS:
+        url = url.format(topic_id=topic_id)
+        statements.clear()
+        response = client.get(url)
+        counts[name] = len(statements)
+        assert response.status_code == 200, (url, response.get_data(as_text=True))
+        assert response.get_json()['success'], url
+    for name, command in CLI_COMMANDS:
+        statements.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            command()
+        counts[name] = len(statements)
+    return counts
+
+
+@pytest.fixture(scope="module")
+def statement_counts():
+    """两轮数据量下每个列表调用执行的 SQL 条数：{名称: (少量数据时条数, 大量数据时条数)}"""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    client = app_module.app.test_client()
+    rounds = []
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for topics in (SMALL_TOPICS, LARGE_TOPICS - SMALL_TOPICS):
+            topic_id = _seed_topics(topics)
+            rounds.append(_run_checks(client, topic_id, statements))
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    db = get_db_session()
+    try:
+        # 大量数据一轮确实是数千行
+        assert db.query(Title).count() >= 2000
+    finally:
+        db.close()
+    small, large = rounds
+    return {name: (small[name], large[name]) for name in small}
+
+
+@pytest.mark.parametrize("name", CHECK_NAMES)
+def test_statement_count_is_bounded(statement_counts, name):
+    small, large = statement_counts[name]
+    assert large > 0, f"{name} 没有记录到 SQL（监听未生效）"
+    assert large <= MAX_STATEMENTS, f"{name} 执行了 {large} 条 SQL，超过上限 {MAX_STATEMENTS}"
+
+
+@pytest.mark.parametrize("name", CHECK_NAMES)
+def test_statement_count_does_not_grow_with_rows(statement_counts, name):
+    small, large = statement_counts[name]
+    assert small == large, f"{name} 的 SQL 条数随数据量变化: {small} -> {large}"
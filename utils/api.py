@@ -1,60 +1,144 @@
 """
 公共 API 调用工具
+
+get_gemini_response / stream_gemini_response 为同步调用（requests）；async_get_gemini_response 为协程版本
+（httpx，需安装），两者共用鉴权方式记录、响应缓存、限流、重试和熔断。
+输出达到 maxOutputTokens 被截断（finishReason=MAX_TOKENS）时，把已生成的内容作为模型回复发起续写请求并拼接，
+最多续写 GEMINI_MAX_CONTINUATIONS 次。
 """
 import requests
 import os
+import json
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from typing import AsyncContextManager, ContextManager, Dict, Iterator, Optional, Tuple
+from config import (BASE_URL, MODEL_NAME, GEMINI_TITLE_TIMEOUT, GEMINI_ARTICLE_TIMEOUT, GEMINI_HTML_TIMEOUT,
+                    GEMINI_DEFAULT_TIMEOUT, GEMINI_MAX_CONTINUATIONS)
+from utils.circuit_breaker import CircuitCall, get_circuit_breaker
+from utils.http_client import get_http_session, get_async_http_client, httpx
+from utils.metrics import GEMINI_REQUEST_SECONDS, GEMINI_REQUESTS, GEMINI_CONTINUATIONS, record_gemini_usage
+from utils.rate_limiter import Permit, estimate_tokens, get_gemini_limiter
+from utils.retry import call_with_retry, async_call_with_retry
+from utils.response_cache import get_response_cache, make_cache_key
+from utils.tracing import current_span, span, trace_headers, traced
 from utils.logger import logger
 
+# 鉴权方式：X-Goog-Api-Key 请求头 / URL 参数 ?key=
+AUTH_MODE_HEADER = "header"
+AUTH_MODE_QUERY = "query"
 
-def get_gemini_response(prompt: str, temperature: float = 0.7, max_tokens: int = 4096) -> str:
-    """
-    请求 Gemini 接口并返回生成的文本内容
-    
-    :param prompt: 提示词字符串
-    :param temperature: 温度参数，控制创造性（0.0-1.0）
-    :param max_tokens: 最大输出token数
-    :return: 模型生成的纯文本
-    """
+# 记录每个 BASE_URL 实际可用的鉴权方式，后续请求直接使用，省掉一次 401 往返
+_auth_modes: Dict[str, str] = {}
+
+# 各类调用的单次请求超时（秒）
+STAGE_TIMEOUTS = {
+    "title": GEMINI_TITLE_TIMEOUT,
+    "article": GEMINI_ARTICLE_TIMEOUT,
+    "html": GEMINI_HTML_TIMEOUT,
+    "default": GEMINI_DEFAULT_TIMEOUT,
+}
+
+# 输出被截断时的续写指令
+CONTINUE_PROMPT = "上一条回复因长度限制被截断。请从中断处直接接着输出剩余内容，不要重复已输出的部分，也不要添加任何说明。"
+
+
+class GeminiAPIError(Exception):
+    """Gemini 接口返回非 200 状态码"""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after  # 响应头 Retry-After（秒），重试时按其等待
+
+
+def _circuit_guard() -> ContextManager[CircuitCall]:
+    """在 Gemini 熔断器保护下执行一次请求；熔断时立即抛出 CircuitOpenError"""
+    breaker = get_circuit_breaker("gemini")
+    if breaker is None:
+        return nullcontext(CircuitCall())
+    return breaker.guard()
+
+
+def _rate_limited(prompt: str) -> ContextManager[Permit]:
+    """在进程内共享的限流器（RPM/TPM + 自适应并发）内执行一次调用；限流关闭时不做限制"""
+    limiter = get_gemini_limiter()
+    if limiter is None:
+        return nullcontext(Permit(0))
+    return limiter.limit(estimate_tokens(prompt))
+
+
+def _rate_limited_async(prompt: str) -> AsyncContextManager[Permit]:
+    """_rate_limited 的协程版本（async with），排队时不阻塞事件循环"""
+    limiter = get_gemini_limiter()
+    if limiter is None:
+        return nullcontext(Permit(0))
+    return limiter.limit_async(estimate_tokens(prompt))
+
+
+def _total_tokens(result: Dict) -> Optional[int]:
+    """从响应的 usageMetadata 中取实际消耗的 token 数"""
+    usage = result.get('usageMetadata') if isinstance(result, dict) else None
+    return usage.get('totalTokenCount') if isinstance(usage, dict) else None
+
+
+@contextmanager
+def _call_metrics(stage: str) -> Iterator[None]:
+    """记录一次 Gemini 调用（含重试）的耗时和结果；流式调用被调用方提前关闭时结果记为 cancelled"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - started, stage, MODEL_NAME)
+        GEMINI_REQUESTS.inc(stage, MODEL_NAME, outcome)
+
+
+def _mark_cache_hit():
+    """在当前调用的 span 上注明命中缓存"""
+    current = current_span()
+    if current is not None:
+        current.set_attribute('cache_hit', True)
+
+
+def _load_api_key() -> str:
+    """读取并清理 GEMINI_API_KEY，配置有误时抛出 ValueError"""
     API_KEY = os.getenv("GEMINI_API_KEY")
-    BASE_URL = "http://1003.2.gptuu.cc:1003"
-    MODEL_NAME = "gemini-3-pro-preview"
 
-    logger.info(f"开始调用Gemini API: temperature={temperature}, max_tokens={max_tokens}, prompt_length={len(prompt)}")
-    
     if not API_KEY:
         logger.error("GEMINI_API_KEY 未设置")
         raise ValueError("错误：环境变量 GEMINI_API_KEY 未设置！")
-    
+
     # 诊断信息：检查API_KEY格式
     api_key_preview = f"{API_KEY[:10]}...{API_KEY[-5:]}" if len(API_KEY) > 15 else "***"
-    logger.info(f"API_KEY 诊断信息: 长度={len(API_KEY)}, 预览={api_key_preview}")
-    
+    logger.debug(f"API_KEY 诊断信息: 长度={len(API_KEY)}, 预览={api_key_preview}")
+
     # 检查API_KEY是否包含换行符或空格
     if '\n' in API_KEY or '\r' in API_KEY:
         logger.warning("API_KEY 包含换行符，正在清理...")
         API_KEY = API_KEY.strip().replace('\n', '').replace('\r', '')
         logger.info(f"清理后的API_KEY长度: {len(API_KEY)}")
-    
+
     # 检查API_KEY是否包含前后空格
     if API_KEY != API_KEY.strip():
         logger.warning("API_KEY 包含前后空格，正在清理...")
         API_KEY = API_KEY.strip()
         logger.info(f"清理后的API_KEY长度: {len(API_KEY)}")
 
-    # 构造URL（不包含key）
-    url = f"{BASE_URL}/v1beta/models/{MODEL_NAME}:generateContent"
-
-    # 设置请求头
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
     # 检查API_KEY是否是占位符
     if "your_gemin" in API_KEY.lower() or "your_api_key" in API_KEY.lower() or "placeholder" in API_KEY.lower():
         logger.error(f"API_KEY 看起来是占位符文本，请检查 .env 文件中的 GEMINI_API_KEY 配置")
         raise ValueError("API_KEY 配置错误：检测到占位符文本，请设置真实的 API key")
 
-    payload = {
+    return API_KEY
+
+
+def _build_payload(prompt: str, temperature: float, max_tokens: int) -> Dict:
+    """构造 generateContent 请求体"""
+    return {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {
             "temperature": temperature,
@@ -62,61 +146,417 @@ def get_gemini_response(prompt: str, temperature: float = 0.7, max_tokens: int =
         }
     }
 
+
+def _continuation_payload(prompt: str, partial: str, temperature: float, max_tokens: int) -> Dict:
+    """续写请求体：原提示词、已生成的内容（作为模型回复）和续写指令"""
+    return {
+        "contents": [
+            {"role": "user", "parts": [{"text": prompt}]},
+            {"role": "model", "parts": [{"text": partial}]},
+            {"role": "user", "parts": [{"text": CONTINUE_PROMPT}]},
+        ],
+        "generationConfig": {
+            "temperature": temperature,
+            "maxOutputTokens": max_tokens
+        }
+    }
+
+
+def _finish_reason(result: Dict) -> Optional[str]:
+    """响应（或流式片段）中的 finishReason，没有时返回 None"""
     try:
-        logger.debug(f"发送API请求到: {BASE_URL}, 模型: {MODEL_NAME}")
-        logger.debug(f"请求URL: {url}")
-        logger.debug(f"请求方式: POST")
-        
-        # 尝试方式1: 使用 X-Goog-Api-Key header（Gemini API 标准方式）
-        headers_with_key = {**headers, "X-Goog-Api-Key": API_KEY}
-        logger.debug(f"尝试方式1: 使用 X-Goog-Api-Key header")
-        
-        response = requests.post(
-            url, 
-            headers=headers_with_key, 
-            json=payload, 
-            timeout=60
-        )
-        
-        # 如果401错误，尝试方式2: 使用URL参数（兼容旧方式）
-        if response.status_code == 401:
-            logger.warning("方式1失败（401），尝试方式2: 使用URL参数传递key")
-            response = requests.post(
-                url, 
-                headers=headers, 
-                json=payload, 
-                params={"key": API_KEY},
-                timeout=60
-            )
-        
-        # 记录实际请求的URL（隐藏key部分）
-        actual_url = response.url if hasattr(response, 'url') else url
-        if 'key=' in actual_url:
-            # 隐藏key部分
-            safe_url = actual_url.split('key=')[0] + 'key=***'
-            logger.debug(f"实际请求URL: {safe_url}")
-        else:
-            logger.debug(f"实际请求URL: {actual_url}")
-
-        if response.status_code != 200:
-            logger.error(f"API请求失败: status_code={response.status_code}")
-            logger.error(f"响应内容: {response.text[:500]}")
-            logger.error(f"请求URL (隐藏key): {url}?key=***")
-            raise Exception(f"API 请求失败 [Code: {response.status_code}]: {response.text}")
-
-        result = response.json()
-
-        # 尝试提取文本
-        try:
-            content = result['candidates'][0]['content']['parts'][0]['text']
-            logger.info(f"API调用成功，返回内容长度: {len(content)} 字符")
-            return content.strip()
-        except (KeyError, IndexError) as e:
-            logger.error(f"数据解析失败: {e}, result={result}")
-            # 兼容某些情况下没有content但有finishReason的情况
-            raise Exception(f"数据解析失败，API可能拒绝了生成: {result}")
+        return result['candidates'][0].get('finishReason')
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+
+def _should_continue(finish_reason: Optional[str], stage: str, continuations: int, length: int) -> bool:
+    """输出因 maxOutputTokens 被截断时是否续写；续写次数用完时记录警告并在 span 上注明"""
+    if finish_reason != "MAX_TOKENS":
+        return False
+    current = current_span()
+    if continuations >= GEMINI_MAX_CONTINUATIONS:
+        logger.warning(f"输出达到 maxOutputTokens 被截断，已续写 {continuations} 次，不再续写: stage={stage}, 当前长度={length}")
+        if current is not None:
+            current.set_attribute('truncated', True)
+        return False
+    logger.info(f"输出达到 maxOutputTokens 被截断，第 {continuations + 1} 次续写: stage={stage}, 当前长度={length}")
+    GEMINI_CONTINUATIONS.inc(stage, MODEL_NAME)
+    if current is not None:
+        current.set_attribute('continuations', continuations + 1)
+    return True
+
+
+def _post_with_auth(url: str, headers: Dict, payload: Dict, api_key: str, auth_mode: str, timeout: float,
+                    params: Optional[Dict] = None, stream: bool = False) -> requests.Response:
+    """使用指定鉴权方式发送请求"""
+    session = get_http_session()
+    params = dict(params or {})
+    if auth_mode == AUTH_MODE_HEADER:
+        headers = {**headers, "X-Goog-Api-Key": api_key}
+    else:
+        params["key"] = api_key
+    return session.post(url, headers=headers, json=payload, params=params or None, timeout=timeout, stream=stream)
+
+
+def _send_request(url: str, payload: Dict, api_key: str, timeout: float,
+                  params: Optional[Dict] = None, stream: bool = False) -> requests.Response:
+    """
+    发送请求，优先使用上次成功的鉴权方式，401 时切换另一种方式重试
+
+    :return: 状态码为 200 的响应对象
+    """
+    # 设置请求头
+    headers = {
+        "Content-Type": "application/json",
+        **trace_headers()
+    }
+
+    logger.debug(f"发送API请求到: {BASE_URL}, 模型: {MODEL_NAME}")
+    logger.debug(f"请求URL: {url}")
+    logger.debug(f"请求方式: POST")
+
+    # 优先使用上次成功的鉴权方式（默认 X-Goog-Api-Key header，Gemini API 标准方式）
+    auth_mode = _auth_modes.get(BASE_URL, AUTH_MODE_HEADER)
+    logger.debug(f"使用鉴权方式: {auth_mode}")
+    response = _post_with_auth(url, headers, payload, api_key, auth_mode, timeout, params=params, stream=stream)
+
+    # 如果401错误，切换到另一种鉴权方式重试（兼容只支持URL参数的中转服务）
+    if response.status_code == 401:
+        fallback_mode = AUTH_MODE_QUERY if auth_mode == AUTH_MODE_HEADER else AUTH_MODE_HEADER
+        logger.warning(f"鉴权方式 {auth_mode} 失败（401），尝试 {fallback_mode}")
+        response.close()
+        response = _post_with_auth(url, headers, payload, api_key, fallback_mode, timeout, params=params, stream=stream)
+        if response.status_code != 401:
+            auth_mode = fallback_mode
+
+    _check_response(url, response, auth_mode)
+    return response
+
+
+def _check_response(url: str, response, auth_mode: str) -> None:
+    """
+    记录可用的鉴权方式；状态码不是 200 时抛出 GeminiAPIError（同步和异步请求共用）
+
+    :param response: requests.Response 或 httpx.Response；状态码为 200 时不读取响应体（流式响应由调用方逐段读取）
+    """
+    status_code = response.status_code
+    if status_code != 401 and _auth_modes.get(BASE_URL) != auth_mode:
+        _auth_modes[BASE_URL] = auth_mode
+        logger.info(f"记录 {BASE_URL} 的可用鉴权方式: {auth_mode}")
+
+    # 记录实际请求的URL（隐藏key部分）
+    actual_url = str(response.url)
+    if 'key=' in actual_url:
+        # 隐藏key部分
+        safe_url = actual_url.split('key=')[0] + 'key=***'
+        logger.debug(f"实际请求URL: {safe_url}")
+    else:
+        logger.debug(f"实际请求URL: {actual_url}")
+
+    if status_code != 200:
+        logger.error(f"API请求失败: status_code={status_code}")
+        logger.error(f"响应内容: {response.text[:500]}")
+        logger.error(f"请求URL (隐藏key): {url}?key=***")
+        retry_after = response.headers.get("Retry-After")
+        raise GeminiAPIError(status_code, f"API 请求失败 [Code: {status_code}]: {response.text}",
+                             retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+
+async def _async_post_with_auth(url: str, headers: Dict, payload: Dict, api_key: str, auth_mode: str,
+                                timeout: float) -> "httpx.Response":
+    """_post_with_auth 的协程版本（读取完整响应）"""
+    client = get_async_http_client()
+    params = {}
+    if auth_mode == AUTH_MODE_HEADER:
+        headers = {**headers, "X-Goog-Api-Key": api_key}
+    else:
+        params["key"] = api_key
+    return await client.post(url, headers=headers, json=payload, params=params or None, timeout=timeout)
+
+
+async def _async_send_request(url: str, payload: Dict, api_key: str, timeout: float) -> "httpx.Response":
+    """_send_request 的协程版本：优先使用上次成功的鉴权方式，401 时切换另一种方式重试"""
+    headers = {
+        "Content-Type": "application/json",
+        **trace_headers()
+    }
+    auth_mode = _auth_modes.get(BASE_URL, AUTH_MODE_HEADER)
+    response = await _async_post_with_auth(url, headers, payload, api_key, auth_mode, timeout)
+    if response.status_code == 401:
+        fallback_mode = AUTH_MODE_QUERY if auth_mode == AUTH_MODE_HEADER else AUTH_MODE_HEADER
+        logger.warning(f"鉴权方式 {auth_mode} 失败（401），尝试 {fallback_mode}")
+        response = await _async_post_with_auth(url, headers, payload, api_key, fallback_mode, timeout)
+        if response.status_code != 401:
+            auth_mode = fallback_mode
+    _check_response(url, response, auth_mode)
+    return response
+
+
+@traced(attrs=("stage",))
+def get_gemini_response(prompt: str, temperature: float = 0.7, max_tokens: int = 4096, use_cache: bool = True,
+                        stage: str = "default") -> str:
+    """
+    请求 Gemini 接口并返回生成的文本内容
+
+    429/5xx、超时等可恢复的错误按 utils/retry.py 的策略重试（指数退避 + 抖动，总时间预算内），可选对冲请求。
+
+    :param prompt: 提示词字符串
+    :param temperature: 温度参数，控制创造性（0.0-1.0）
+    :param max_tokens: 最大输出token数
+    :param use_cache: 是否使用响应缓存（False 时强制重新生成，结果仍会写入缓存）
+    :param stage: 调用类型（title / article / html），决定单次请求超时，并分别统计耗时
+    :return: 模型生成的纯文本
+    """
+    logger.info(f"开始调用Gemini API: temperature={temperature}, max_tokens={max_tokens}, prompt_length={len(prompt)}")
+
+    cache = get_response_cache()
+    cache_key = make_cache_key(MODEL_NAME, prompt, temperature, max_tokens) if cache else None
+    if cache and use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"命中Gemini响应缓存，返回内容长度: {len(cached)} 字符")
+            GEMINI_REQUESTS.inc(stage, MODEL_NAME, "cache_hit")
+            _mark_cache_hit()
+            return cached
+
+    API_KEY = _load_api_key()
+
+    # 构造URL（不包含key）
+    url = f"{BASE_URL}/v1beta/models/{MODEL_NAME}:generateContent"
+    payload = _build_payload(prompt, temperature, max_tokens)
+
+    def make_attempt(request_payload: Dict, input_text: str):
+        def attempt(timeout: float) -> Dict:
+            """执行一次请求（每次重试都重新检查熔断、占用限流名额）"""
+            with span("gemini_http_request", timeout=timeout), _circuit_guard(), _rate_limited(input_text) as permit:
+                response = _send_request(url, request_payload, API_KEY, timeout=timeout)
+                result = response.json()
+                permit.record_usage(_total_tokens(result))
+                record_gemini_usage(stage, MODEL_NAME, result)
+                return result
+        return attempt
+
+    try:
+        started = time.monotonic()
+        stage_timeout = STAGE_TIMEOUTS.get(stage, GEMINI_DEFAULT_TIMEOUT)
+        with _call_metrics(stage):
+            result = call_with_retry(make_attempt(payload, prompt), stage, stage_timeout)
+
+            # 提取文本（兼容某些情况下没有content但有finishReason的情况）
+            content = _extract_text(result)
+            continuations = 0
+            while _should_continue(_finish_reason(result), stage, continuations, len(content)):
+                continuations += 1
+                continuation = _continuation_payload(prompt, content, temperature, max_tokens)
+                result = call_with_retry(make_attempt(continuation, prompt + content), stage, stage_timeout)
+                content += _extract_text(result)
+            content = content.strip()
+        if cache:
+            cache.put(cache_key, content, time.monotonic() - started)
+        return content
 
     except requests.exceptions.RequestException as e:
         logger.error(f"网络连接异常: {e}", exc_info=True)
         raise Exception(f"网络连接异常: {e}")
 
+
+def _extract_text(result: Dict) -> str:
+    """从 generateContent 响应中取出生成的文本，没有文本时抛出异常（内容被拒绝等）"""
+    try:
+        content = result['candidates'][0]['content']['parts'][0]['text']
+    except (KeyError, IndexError, TypeError) as e:
+        logger.error(f"数据解析失败: {e}, result={result}")
+        raise Exception(f"数据解析失败，API可能拒绝了生成: {result}")
+    logger.info(f"API调用成功，返回内容长度: {len(content)} 字符")
+    return content
+
+
+@traced(attrs=("stage",))
+async def async_get_gemini_response(prompt: str, temperature: float = 0.7, max_tokens: int = 4096,
+                                    use_cache: bool = True, stage: str = "default") -> str:
+    """
+    get_gemini_response 的协程版本（httpx.AsyncClient），在事件循环中并发执行时不占用线程
+
+    参数、返回值、缓存、限流、重试和熔断行为与 get_gemini_response 一致。
+
+    :param prompt: 提示词字符串
+    :param temperature: 温度参数，控制创造性（0.0-1.0）
+    :param max_tokens: 最大输出token数
+    :param use_cache: 是否使用响应缓存
+    :param stage: 调用类型（title / article / html），决定单次请求超时，并分别统计耗时
+    :return: 模型生成的纯文本
+    """
+    if httpx is None:
+        raise RuntimeError("异步调用需要安装 httpx：pip install httpx")
+    logger.info(f"开始异步调用Gemini API: temperature={temperature}, max_tokens={max_tokens}, prompt_length={len(prompt)}")
+
+    cache = get_response_cache()
+    cache_key = make_cache_key(MODEL_NAME, prompt, temperature, max_tokens) if cache else None
+    if cache and use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"命中Gemini响应缓存，返回内容长度: {len(cached)} 字符")
+            GEMINI_REQUESTS.inc(stage, MODEL_NAME, "cache_hit")
+            _mark_cache_hit()
+            return cached
+
+    API_KEY = _load_api_key()
+    url = f"{BASE_URL}/v1beta/models/{MODEL_NAME}:generateContent"
+    payload = _build_payload(prompt, temperature, max_tokens)
+
+    def make_attempt(request_payload: Dict, input_text: str):
+        async def attempt(timeout: float) -> Dict:
+            """执行一次请求（每次重试都重新检查熔断、占用限流名额）"""
+            with span("gemini_http_request", timeout=timeout), _circuit_guard():
+                async with _rate_limited_async(input_text) as permit:
+                    response = await _async_send_request(url, request_payload, API_KEY, timeout=timeout)
+                    result = response.json()
+                    permit.record_usage(_total_tokens(result))
+                    record_gemini_usage(stage, MODEL_NAME, result)
+                    return result
+        return attempt
+
+    started = time.monotonic()
+    stage_timeout = STAGE_TIMEOUTS.get(stage, GEMINI_DEFAULT_TIMEOUT)
+    with _call_metrics(stage):
+        try:
+            result = await async_call_with_retry(make_attempt(payload, prompt), stage, stage_timeout)
+            content = _extract_text(result)
+            continuations = 0
+            while _should_continue(_finish_reason(result), stage, continuations, len(content)):
+                continuations += 1
+                continuation = _continuation_payload(prompt, content, temperature, max_tokens)
+                result = await async_call_with_retry(make_attempt(continuation, prompt + content), stage,
+                                                     stage_timeout)
+                content += _extract_text(result)
+        except httpx.HTTPError as e:
+            logger.error(f"网络连接异常: {e}", exc_info=True)
+            raise Exception(f"网络连接异常: {e}")
+        content = content.strip()
+    if cache:
+        cache.put(cache_key, content, time.monotonic() - started)
+    return content
+
+
+def _open_stream(url: str, payload: Dict, api_key: str, prompt: str,
+                 timeout: float) -> Tuple[ExitStack, CircuitCall, Permit, requests.Response]:
+    """
+    检查熔断、占用限流名额并建立流式连接；名额由返回的 ExitStack 持有，直到流读取结束
+
+    :return: (ExitStack, 熔断调用记录, Permit, 响应对象)
+    """
+    stack = ExitStack()
+    circuit = stack.enter_context(_circuit_guard())
+    try:
+        permit = stack.enter_context(_rate_limited(prompt))
+        response = _send_request(url, payload, api_key, timeout=timeout, params={"alt": "sse"}, stream=True)
+    except BaseException as e:
+        # 让熔断器和限流器按错误类型记录结果，再把错误交给重试策略
+        stack.__exit__(type(e), e, e.__traceback__)
+        raise
+    return stack, circuit, permit, response
+
+
+@traced(attrs=("stage",))
+def stream_gemini_response(prompt: str, temperature: float = 0.7, max_tokens: int = 4096,
+                           use_cache: bool = True, stage: str = "default") -> Iterator[str]:
+    """
+    以流式方式请求 Gemini 接口（streamGenerateContent），逐段返回生成的文本
+
+    请求在第一次迭代时才发出，调用方拼接所有片段即得到完整文本。命中响应缓存时一次性返回缓存内容。
+    建立连接阶段的可恢复错误会重试；开始输出片段后中断不再重试（避免重复内容）。
+    输出被截断（finishReason=MAX_TOKENS）时发起流式续写请求，续写的片段接着返回。
+
+    :param prompt: 提示词字符串
+    :param temperature: 温度参数，控制创造性（0.0-1.0）
+    :param max_tokens: 最大输出token数
+    :param use_cache: 是否使用响应缓存（False 时强制重新生成，结果仍会写入缓存）
+    :param stage: 调用类型（title / article / html），决定单次请求超时
+    :return: 文本片段生成器
+    """
+    logger.info(f"开始流式调用Gemini API: temperature={temperature}, max_tokens={max_tokens}, prompt_length={len(prompt)}")
+
+    cache = get_response_cache()
+    cache_key = make_cache_key(MODEL_NAME, prompt, temperature, max_tokens) if cache else None
+    if cache and use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"命中Gemini响应缓存，返回内容长度: {len(cached)} 字符")
+            GEMINI_REQUESTS.inc(stage, MODEL_NAME, "cache_hit")
+            yield cached
+            return
+
+    API_KEY = _load_api_key()
+
+    url = f"{BASE_URL}/v1beta/models/{MODEL_NAME}:streamGenerateContent"
+    payload = _build_payload(prompt, temperature, max_tokens)
+
+    with _call_metrics(stage):
+        started = time.monotonic()
+        chunks = []
+        total_length = 0
+        request_payload, input_text = payload, prompt
+        continuations = 0
+        while True:
+            try:
+                stack, circuit, permit, response = call_with_retry(
+                    lambda timeout: _open_stream(url, request_payload, API_KEY, input_text, timeout),
+                    stage, STAGE_TIMEOUTS.get(stage, GEMINI_DEFAULT_TIMEOUT), hedge=False
+                )
+            except requests.exceptions.RequestException as e:
+                logger.error(f"网络连接异常: {e}", exc_info=True)
+                raise Exception(f"网络连接异常: {e}")
+
+            # 限流名额在整个流式读取期间保持占用
+            with stack:
+                last_event = None
+                usage_event = None
+                finish_reason = None
+                try:
+                    response.encoding = "utf-8"
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data_str = line[5:].strip()
+                        if not data_str or data_str == "[DONE]":
+                            continue
+                        try:
+                            last_event = json.loads(data_str)
+                            # usageMetadata 一般在最后一个片段中
+                            permit.record_usage(_total_tokens(last_event))
+                            if 'usageMetadata' in last_event:
+                                usage_event = last_event
+                            finish_reason = _finish_reason(last_event) or finish_reason
+                            parts = last_event['candidates'][0]['content']['parts']
+                        except (ValueError, KeyError, IndexError):
+                            # 只包含 usageMetadata / finishReason 的片段没有文本
+                            logger.debug(f"跳过无文本的流式片段: {data_str[:200]}")
+                            continue
+                        text = "".join(part.get('text', '') for part in parts)
+                        if text:
+                            chunks.append(text)
+                            total_length += len(text)
+                            yield text
+                except requests.exceptions.RequestException as e:
+                    logger.error(f"流式读取中断: {e}", exc_info=True)
+                    circuit.mark_failure()
+                    raise Exception(f"网络连接异常: {e}")
+                finally:
+                    response.close()
+
+            # usageMetadata 为累计值，取每次请求的最后一个
+            record_gemini_usage(stage, MODEL_NAME, usage_event)
+            if total_length == 0:
+                logger.error(f"流式响应中没有文本内容: last_event={last_event}")
+                raise Exception(f"数据解析失败，API可能拒绝了生成: {last_event}")
+            if not _should_continue(finish_reason, stage, continuations, total_length):
+                break
+            # 输出被截断：把已输出的内容作为模型回复续写，续写的片段接着返回给调用方
+            continuations += 1
+            partial = "".join(chunks)
+            request_payload = _continuation_payload(prompt, partial, temperature, max_tokens)
+            input_text = prompt + partial
+    logger.info(f"流式API调用完成，返回内容长度: {total_length} 字符")
+    if cache:
+        cache.put(cache_key, "".join(chunks).strip(), time.monotonic() - started)
@@ -0,0 +1,77 @@
+"""
+进程内共享的事件循环
+
+后台线程运行一个事件循环，同步代码（Flask 视图、后台任务、CLI）通过 run_async 把协程提交到该循环执行并等待结果。
+所有异步上游调用都在这一个循环中进行，几百个并发请求只占用一个线程，共用同一个 httpx 连接池。
+以 ASGI 方式运行时（asgi.py）直接使用服务器的事件循环，不再单独启动线程。
+"""
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+from utils.logger import logger
+from utils.tracing import bind_span_async
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """获取共享事件循环（首次调用时启动后台线程）"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=_run_loop, args=(loop,), name="async-upstream", daemon=True).start()
+                _loop = loop
+                logger.info("共享事件循环已启动")
+    return _loop
+
+
+def use_event_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    """
+    把已在运行的事件循环（如 ASGI 服务器的循环）设为共享循环，之后 run_async 提交的协程都在该循环中执行
+
+    :return: 是否设置成功（共享循环已经启动时保持不变）
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is not None and _loop is not loop:
+            logger.warning("共享事件循环已启动，继续使用原循环")
+            return False
+        _loop = loop
+    logger.info("使用 ASGI 服务器的事件循环作为共享事件循环")
+    return True
+
+
+def run_async(coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+    """
+    在共享事件循环中执行协程，阻塞等待结果（不能在共享循环自身的线程中调用）
+
+    :param coro: 协程对象
+    :param timeout: 最长等待秒数，None 表示一直等待；超时后协程被取消
+    :return: 协程的返回值
+    """
+    loop = get_event_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_async 不能在共享事件循环中调用，请直接 await")
+    # 协程在共享循环中作为新任务执行，带上调用方当前的 span
+    future = asyncio.run_coroutine_threadsafe(bind_span_async(coro), loop)
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
@@ -0,0 +1,203 @@
+"""
+上游服务熔断器
+
+每个上游（Gemini 中转服务、Coze）一个熔断器，三种状态：
+- closed（闭合）：正常放行；连续失败达到阈值后转为 open
+- open（熔断）：调用立即抛出 CircuitOpenError，不再等待超时；冷却 recovery_timeout 秒后转为 half_open
+- half_open（半开）：最多放行 half_open_max_calls 个探测请求，成功则恢复 closed，失败则重新 open
+
+只有超时、连接错误和 5xx 计为失败；4xx、429（配额）等说明上游仍在正常响应，计为成功。
+状态通过 snapshot() 获取（/api/circuit-breakers）。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from config import (CIRCUIT_BREAKER_ENABLED, GEMINI_CIRCUIT_FAILURE_THRESHOLD, GEMINI_CIRCUIT_RECOVERY_TIMEOUT,
+                    COZE_CIRCUIT_FAILURE_THRESHOLD, COZE_CIRCUIT_RECOVERY_TIMEOUT, CIRCUIT_HALF_OPEN_MAX_CALLS)
+from utils.logger import logger
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 各上游的失败阈值和冷却时间
+UPSTREAM_SETTINGS = {
+    "gemini": (GEMINI_CIRCUIT_FAILURE_THRESHOLD, GEMINI_CIRCUIT_RECOVERY_TIMEOUT),
+    "coze": (COZE_CIRCUIT_FAILURE_THRESHOLD, COZE_CIRCUIT_RECOVERY_TIMEOUT),
+}
+
+
+class CircuitOpenError(Exception):
+    """上游已熔断，调用被直接拒绝"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} 上游服务不可用（已熔断），{retry_in:.0f}s 后重新探测")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """错误是否说明上游不可用（超时、连接错误、5xx）"""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                          requests.exceptions.ChunkedEncodingError)):
+        return True
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and status_code >= 500
+
+
+class CircuitCall:
+    """一次受熔断器保护的调用；响应本身表示失败（如 5xx 状态码）时调用 mark_failure"""
+
+    def __init__(self):
+        self.failed = False
+
+    def mark_failure(self):
+        self.failed = True
+
+
+class CircuitBreaker:
+    """单个上游的熔断器"""
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float,
+                 half_open_max_calls: int = CIRCUIT_HALF_OPEN_MAX_CALLS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._lock = threading.Lock()
+        self._counters = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def _current_state(self) -> str:
+        """当前状态（冷却时间已过的 open 视为 half_open），调用方需持有锁"""
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = STATE_HALF_OPEN
+            self._half_open_in_flight = 0
+            logger.info(f"{self.name} 熔断冷却结束，进入半开状态，放行探测请求")
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _open(self):
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._counters['opened'] += 1
+
+    def before_call(self) -> bool:
+        """
+        检查是否允许调用，不允许时抛出 CircuitOpenError
+
+        :return: 本次调用是否为半开状态的探测请求（after_call 时传回）
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return False
+            if state == STATE_HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._counters['rejected'] += 1
+            retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(self.name, retry_in)
+
+    def after_call(self, probe: bool, success: bool):
+        """记录调用结果并切换状态"""
+        with self._lock:
+            if probe:
+                self._half_open_in_flight -= 1
+            if success:
+                self._counters['successes'] += 1
+                # 只有探测请求能恢复熔断；熔断前已放行、熔断后才成功返回的请求不改变状态
+                if probe and self._state == STATE_HALF_OPEN:
+                    self._state = STATE_CLOSED
+                    self._consecutive_failures = 0
+                    logger.info(f"{self.name} 探测请求成功，熔断恢复")
+                elif self._state == STATE_CLOSED:
+                    self._consecutive_failures = 0
+                return
+            self._counters['failures'] += 1
+            self._consecutive_failures += 1
+            if probe and self._state == STATE_HALF_OPEN:
+                self._open()
+                logger.warning(f"{self.name} 探测请求失败，继续熔断 {self.recovery_timeout:.0f}s")
+            elif self._state == STATE_CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._open()
+                logger.error(f"{self.name} 连续失败 {self._consecutive_failures} 次，熔断 {self.recovery_timeout:.0f}s")
+
+    @contextmanager
+    def guard(self) -> Iterator[CircuitCall]:
+        """
+        在熔断器保护下执行一次调用
+
+        with 块内抛出 is_upstream_failure 判定的错误或调用了 mark_failure 时计为失败，其他情况计为成功。
+        """
+        probe = self.before_call()
+        call = CircuitCall()
+        try:
+            yield call
+        except BaseException as e:
+            self.after_call(probe, success=not is_upstream_failure(e) and not call.failed)
+            raise
+        self.after_call(probe, success=not call.failed)
+
+    def reset(self):
+        """手动恢复为闭合状态"""
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._consecutive_failures = 0
+        logger.info(f"{self.name} 熔断器已手动重置")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            snapshot = dict(self._counters)
+            snapshot.update({
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                'retry_in': (round(max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at)), 1)
+                             if state == STATE_OPEN else None),
+            })
+        return snapshot
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> Optional[CircuitBreaker]:
+    """获取指定上游（gemini / coze）的熔断器；CIRCUIT_BREAKER_ENABLED 关闭时返回 None"""
+    if not CIRCUIT_BREAKER_ENABLED:
+        return None
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                failure_threshold, recovery_timeout = UPSTREAM_SETTINGS[name]
+                breaker = _breakers[name] = CircuitBreaker(name, failure_threshold, recovery_timeout)
+    return breaker
+
+
+def get_circuit_breakers() -> List[CircuitBreaker]:
+    """所有上游的熔断器（熔断关闭时为空列表）"""
+    return [breaker for breaker in (get_circuit_breaker(name) for name in UPSTREAM_SETTINGS) if breaker]
@@ -0,0 +1,118 @@
+"""
+大文本列的透明压缩
+
+CompressedText 列类型在写入时按 TEXT_COMPRESSION 压缩内容，读取时自动解压，ORM 和查询代码仍然读写 str。
+压缩后的值以 4 字节头区分编码方式（b"\x00CZ" + 编码标识），未压缩的旧数据原样读取，
+因此开启、关闭压缩或切换编码都不需要一次性改写所有行（迁移工具见 migrate_text_compression.py）。
+
+存储方式：
+- SQLite：列类型不变，压缩值以 BLOB 存放在原来的 TEXT 列中
+- MySQL/PostgreSQL：开启压缩时列类型为 LONGBLOB/BYTEA（已有数据库需先用迁移工具转换列类型）
+"""
+import zlib
+from typing import Optional, Union
+
+from sqlalchemy import LargeBinary, Text
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import TypeDecorator
+
+from config import TEXT_COMPRESSION, TEXT_COMPRESSION_LEVEL, TEXT_COMPRESSION_MIN_BYTES
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，只有 TEXT_COMPRESSION=zstd 或读取 zstd 压缩的数据时需要
+    zstandard = None
+
+_HEADER_PREFIX = b"\x00CZ"
+_CODEC_IDS = {"zlib": b"z", "zstd": b"s"}
+_CODEC_NAMES = {codec_id: name for name, codec_id in _CODEC_IDS.items()}
+CODECS = ("none",) + tuple(_CODEC_IDS)
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise RuntimeError("使用 zstd 压缩需要安装 zstandard（pip install zstandard）")
+
+
+def compress_text(text: str, codec: str = TEXT_COMPRESSION, level: int = TEXT_COMPRESSION_LEVEL,
+                  min_bytes: int = TEXT_COMPRESSION_MIN_BYTES) -> Union[str, bytes]:
+    """
+    按指定编码压缩文本
+
+    :param text: 原始文本
+    :param codec: none / zlib / zstd
+    :param level: 压缩级别
+    :param min_bytes: 短于该字节数的内容不压缩
+    :return: 压缩后的字节串（带头）；不压缩或压缩后没有变小时返回原文本
+    """
+    if codec == "none":
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < min_bytes:
+        return text
+    if codec == "zlib":
+        body = zlib.compress(raw, level)
+    elif codec == "zstd":
+        _require_zstandard()
+        body = zstandard.ZstdCompressor(level=level).compress(raw)
+    else:
+        raise ValueError(f"不支持的压缩方式: {codec}（可选: {', '.join(CODECS)}）")
+    compressed = _HEADER_PREFIX + _CODEC_IDS[codec] + body
+    return compressed if len(compressed) < len(raw) else text
+
+
+def is_compressed(value) -> bool:
+    """判断数据库中的值是否为压缩格式"""
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:3]) == _HEADER_PREFIX
+
+
+def decompress_text(value: Optional[Union[str, bytes, memoryview]]) -> Optional[str]:
+    """
+    把数据库中的值还原为文本（兼容未压缩的 str 和 UTF-8 字节串）
+
+    :param value: 数据库中的原始值
+    :return: 文本
+    """
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value.startswith(_HEADER_PREFIX):
+        return value.decode("utf-8")
+    codec = _CODEC_NAMES.get(value[3:4])
+    body = value[4:]
+    if codec == "zlib":
+        return zlib.decompress(body).decode("utf-8")
+    if codec == "zstd":
+        _require_zstandard()
+        return zstandard.ZstdDecompressor().decompress(body).decode("utf-8")
+    raise ValueError(f"未知的压缩格式: {value[3:4]!r}")
+
+
+def uses_binary_storage(dialect_name: str, codec: str = TEXT_COMPRESSION) -> bool:
+    """压缩列在该数据库上是否使用二进制列类型（SQLite 的 TEXT 列可以直接存放 BLOB）"""
+    return codec != "none" and dialect_name != "sqlite"
+
+
+class CompressedText(TypeDecorator):
+    """透明压缩的长文本列：写入时压缩，读取时解压"""
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if uses_binary_storage(dialect.name):
+            binary = mysql.LONGBLOB() if dialect.name == "mysql" else LargeBinary()
+            return dialect.type_descriptor(binary)
+        text_type = mysql.LONGTEXT() if dialect.name == "mysql" else Text()
+        return dialect.type_descriptor(text_type)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        stored = compress_text(value)
+        if isinstance(stored, str) and uses_binary_storage(dialect.name):
+            return stored.encode("utf-8")
+        return stored
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
@@ -0,0 +1,105 @@
+"""
+共享 HTTP 客户端
+
+所有上游调用复用同一个 requests.Session：每个主机维护一个有上限的 keep-alive 连接池，
+避免每次请求都重新进行 TCP/TLS 握手。连接池大小通过 config.py 中的 HTTP_POOL_* 配置。
+
+异步调用使用 httpx.AsyncClient（可选依赖）。AsyncClient 的连接绑定在创建它的事件循环上，
+因此每个事件循环各自创建一个，连接数上限通过 ASYNC_HTTP_* 配置。
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_POOL_BLOCK, ASYNC_HTTP_MAX_CONNECTIONS,
+                    ASYNC_HTTP_MAX_KEEPALIVE)
+from utils.logger import logger
+
+try:
+    import httpx
+    # httpx 默认每个请求记一条 INFO 日志，与 requests（urllib3 只记 DEBUG）保持一致
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+except ImportError:
+    httpx = None
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def create_http_session(pool_connections: int = HTTP_POOL_CONNECTIONS,
+                        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                        pool_block: bool = HTTP_POOL_BLOCK) -> requests.Session:
+    """
+    创建带连接池的 Session
+
+    :param pool_connections: 缓存的主机连接池数量
+    :param pool_maxsize: 每个主机最多保持的连接数
+    :param pool_block: 连接池耗尽时是否阻塞等待空闲连接
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """获取进程内共享的 Session（首次调用时创建）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_http_session()
+                logger.info(f"HTTP连接池已创建: pool_connections={HTTP_POOL_CONNECTIONS}, "
+                            f"pool_maxsize={HTTP_POOL_MAXSIZE}, pool_block={HTTP_POOL_BLOCK}")
+    return _session
+
+
+def close_http_session():
+    """关闭共享 Session 并释放所有连接"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def async_http_available() -> bool:
+    """是否安装了 httpx（异步调用依赖）"""
+    return httpx is not None
+
+
+def get_async_http_client() -> "httpx.AsyncClient":
+    """获取当前事件循环共享的 httpx.AsyncClient（首次调用时创建），需在协程中调用"""
+    if httpx is None:
+        raise RuntimeError("异步调用需要安装 httpx：pip install httpx")
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=ASYNC_HTTP_MAX_KEEPALIVE),
+            headers={"Connection": "keep-alive"},
+        )
+        _async_clients[loop] = client
+        logger.info(f"异步HTTP客户端已创建: max_connections={ASYNC_HTTP_MAX_CONNECTIONS}, "
+                    f"max_keepalive={ASYNC_HTTP_MAX_KEEPALIVE}")
+    return client
+
+
+async def close_async_http_client():
+    """关闭当前事件循环的 AsyncClient"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
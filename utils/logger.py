@@ -1,35 +1,130 @@
 """
 日志配置模块
+
+调用方线程只把日志记录放入内存队列，由后台线程（QueueListener）写文件和控制台，写盘不阻塞请求和生成任务。
+- 文件按大小（LOG_ROTATION=size，默认）或按时间（LOG_ROTATION=time）轮转，保留 LOG_BACKUP_COUNT 个旧文件
+- LOG_FORMAT=json 时每条记录输出为一行 JSON（时间、级别、线程、消息，以及 extra 传入的字段），便于日志系统检索
+- 超过 LOG_MAX_MESSAGE_CHARS 的消息被截断（保留开头并注明原长度），大段 HTML/响应体不会整段写入日志
+- 处于请求/任务追踪中的记录带有 trace_id（由 utils/tracing.py 附加），文本格式在消息前注明
+
+开销较大的格式化（如 json.dumps 整个响应）应先用 logger.isEnabledFor 判断级别，或使用 truncate 只保留开头。
 """
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+from datetime import datetime, timezone
+
+from config import (LOG_LEVEL, LOG_FORMAT, LOG_DIR, LOG_ROTATION, LOG_MAX_BYTES, LOG_ROTATE_WHEN, LOG_BACKUP_COUNT,
+                    LOG_MAX_MESSAGE_CHARS, LOG_QUEUE_SIZE)
 
-# 日志目录
-LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# 日志文件路径
-LOG_FILE = os.path.join(LOG_DIR, f"app_{datetime.now().strftime('%Y%m%d')}.log")
+# 日志文件路径（轮转后的旧文件为 app.log.1 ...，按时间轮转时为 app.log.2026-01-01 ...）
+LOG_FILE = os.path.join(LOG_DIR, "app.log")
 
-# 配置日志格式
-LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# 文本格式
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
-# 配置根日志记录器
-logging.basicConfig(
-    level=logging.INFO,
-    format=LOG_FORMAT,
-    datefmt=DATE_FORMAT,
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()  # 同时输出到控制台
-    ]
-)
+# LogRecord 自带的属性，其余属性视为 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def truncate(text, limit: int = LOG_MAX_MESSAGE_CHARS) -> str:
+    """截断过长的文本，保留开头并注明原长度"""
+    text = str(text)
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[截断，原长度 {len(text)} 字符]"
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式；记录带有 trace_id 时在消息前注明"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            # 同一条记录会依次交给文件和控制台处理器，复制后再修改
+            record = copy.copy(record)
+            record.msg = f"[trace={trace_id}] {record.getMessage()}"
+            record.args = None
+        return super().format(record)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    在调用方线程合并消息参数并截断，异常堆栈预先转为文本，其余格式化在后台线程进行
+
+    队列满时（后台线程写盘跟不上）丢弃记录而不是阻塞调用方。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _build_handlers():
+    """文件和控制台处理器（在后台线程中执行）"""
+    if LOG_ROTATION == "time":
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    stream_handler = logging.StreamHandler()  # 同时输出到控制台
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT, DATE_FORMAT)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+    return file_handler, stream_handler
+
+
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_listener = logging.handlers.QueueListener(_log_queue, *_build_handlers(), respect_handler_level=True)
+_listener.start()
+# 进程退出时写完队列中剩余的记录
+atexit.register(_listener.stop)
+
+# 配置根日志记录器（所有记录经 log_handler 放入队列）
+log_handler = _QueueHandler(_log_queue)
+logging.basicConfig(level=LOG_LEVEL, handlers=[log_handler])
 
 # 创建日志记录器
 logger = logging.getLogger('article_generator')
 
 # 设置日志级别
-logger.setLevel(logging.INFO)
-
+logger.setLevel(LOG_LEVEL)
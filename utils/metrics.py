@@ -0,0 +1,184 @@
+"""
+进程内指标（Prometheus 文本格式，由 /metrics 输出）
+
+- 直方图：Gemini 调用耗时（按调用类型和模型）、Coze 调用耗时、数据库保存耗时、HTTP 路由耗时
+- 计数器：各上游的调用次数（按结果）、Gemini 提示词/输出 token 数（取自响应的 usageMetadata）、截断后续写次数
+
+记录一次观测只做一次字典查找、一次二分查找和几次整数加法（持有该指标自己的锁），不做格式化；
+格式化只在 render_metrics() 时进行。METRICS_ENABLED=false 时所有记录操作直接返回。
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from config import METRICS_ENABLED
+
+# 耗时直方图的桶上限（秒）
+UPSTREAM_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+COZE_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值元组分别记录"""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = super().render()
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """累积分桶的直方图（每个标签组合记录各桶计数、总和与次数）"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数（不累积，最后一个为 +Inf）, 总和]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """记录 with 块的耗时（抛出异常时同样记录）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        with self._lock:
+            series = self._series.get(label_values)
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((labels, list(series[0]), series[1]) for labels, series in self._series.items())
+        lines = super().render()
+        for label_values, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+_registry: List[_Metric] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    _registry.append(metric)
+    return metric
+
+
+GEMINI_REQUEST_SECONDS = _register(Histogram(
+    "gemini_request_duration_seconds", "Gemini 调用耗时（含重试和排队，不含缓存命中）",
+    ("stage", "model"), UPSTREAM_BUCKETS))
+GEMINI_REQUESTS = _register(Counter(
+    "gemini_requests_total", "Gemini 调用次数，outcome 为 success / error / cancelled（流式调用被提前关闭） / cache_hit",
+    ("stage", "model", "outcome")))
+GEMINI_PROMPT_TOKENS = _register(Counter(
+    "gemini_prompt_tokens_total", "Gemini 提示词 token 数（usageMetadata.promptTokenCount）", ("stage", "model")))
+GEMINI_OUTPUT_TOKENS = _register(Counter(
+    "gemini_output_tokens_total", "Gemini 输出 token 数（usageMetadata.candidatesTokenCount）", ("stage", "model")))
+GEMINI_CONTINUATIONS = _register(Counter(
+    "gemini_continuations_total", "Gemini 输出达到 maxOutputTokens 被截断后自动续写的次数", ("stage", "model")))
+COZE_REQUEST_SECONDS = _register(Histogram(
+    "coze_request_duration_seconds", "Coze 工作流调用耗时（到读完最后一个事件）", (), COZE_BUCKETS))
+COZE_REQUESTS = _register(Counter(
+    "coze_requests_total", "Coze 工作流调用次数，outcome 为 success / error", ("outcome",)))
+DB_SAVE_SECONDS = _register(Histogram(
+    "db_save_duration_seconds", "生成结果保存到数据库的耗时（含排队等待单写线程）", ("table",), DB_BUCKETS))
+HTTP_REQUEST_SECONDS = _register(Histogram(
+    "http_request_duration_seconds", "HTTP 路由耗时（流式响应到发送结束）", ("method", "route"), HTTP_BUCKETS))
+HTTP_REQUESTS = _register(Counter(
+    "http_requests_total", "HTTP 请求数", ("method", "route", "status")))
+
+
+def record_gemini_usage(stage: str, model: str, result: Dict):
+    """按响应中的 usageMetadata 累加提示词和输出 token 数"""
+    usage = result.get('usageMetadata') if isinstance(result, dict) else None
+    if not isinstance(usage, dict):
+        return
+    prompt_tokens = usage.get('promptTokenCount')
+    output_tokens = usage.get('candidatesTokenCount')
+    if prompt_tokens:
+        GEMINI_PROMPT_TOKENS.inc(stage, model, amount=prompt_tokens)
+    if output_tokens:
+        GEMINI_OUTPUT_TOKENS.inc(stage, model, amount=output_tokens)
+
+
+def render_metrics() -> str:
+    """所有指标的 Prometheus 文本格式（text/plain; version=0.0.4）"""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,109 @@
+"""
+列表接口的游标分页与字段投影
+
+列表按 (created_at, id) 倒序排列，游标为上一页最后一行的 (created_at, id)，
+下一页只取比游标更早的行（keyset 分页），翻页开销与页码无关。
+fields 参数指定返回哪些字段，只查询对应的列，大文本列不在列表中传输。
+"""
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+
+from config import LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """把 (created_at, id) 编码为不透明的游标字符串"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标字符串，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+def parse_list_args(args, field_map: Dict, default_fields: Sequence[str]) -> Tuple[List[str], int, Optional[str]]:
+    """
+    解析列表接口的查询参数
+
+    未传 limit 时使用默认页大小 LIST_PAGE_SIZE（不再一次返回全部数据），需要全部数据的调用方按 next_cursor 继续请求。
+
+    :param args: request.args
+    :param field_map: 可选字段名 -> 列表达式
+    :param default_fields: 未传 fields 时返回的字段
+    :return: (字段列表, 每页条数, 游标或 None)
+    """
+    fields_arg = args.get('fields')
+    if fields_arg:
+        fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in field_map]
+        if unknown:
+            raise ValueError(f"未知的字段: {', '.join(unknown)}（可选: {', '.join(field_map)}）")
+    else:
+        fields = list(default_fields)
+
+    cursor = args.get('cursor') or None
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError(f"无效的 limit: {limit}")
+        if limit <= 0:
+            raise ValueError("limit 必须大于 0")
+        limit = min(limit, LIST_MAX_PAGE_SIZE)
+    else:
+        limit = LIST_PAGE_SIZE
+    return fields, limit, cursor
+
+
+def select_columns(field_map: Dict, fields: Sequence[str], created_col, id_col) -> List:
+    """构造查询列：请求的字段 + 分页需要的 created_at/id"""
+    columns = [field_map[f].label(f) for f in fields]
+    columns.append(created_col.label('_cursor_created_at'))
+    columns.append(id_col.label('_cursor_id'))
+    return columns
+
+
+def paginate(query, created_col, id_col, limit: Optional[int], cursor: Optional[str]):
+    """按 (created_at, id) 倒序排序，并应用游标条件和 limit（多取一行用于判断是否还有下一页）"""
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_col < cursor_created_at,
+            and_(created_col == cursor_created_at, id_col < cursor_id)
+        ))
+    query = query.order_by(created_col.desc(), id_col.desc())
+    if limit:
+        query = query.limit(limit + 1)
+    return query
+
+
+def build_page(rows: Sequence, fields: Sequence[str], limit: Optional[int]) -> Tuple[List[Dict], Optional[str]]:
+    """
+    把查询结果转换为字典列表，并计算下一页游标
+
+    :return: (数据列表, 下一页游标；没有更多数据时为 None)
+    """
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last._cursor_created_at, last._cursor_id)
+
+    items = []
+    for row in rows:
+        item = {}
+        for f in fields:
+            value = getattr(row, f)
+            item[f] = value.isoformat() if isinstance(value, datetime) else value
+        items.append(item)
+    return items, next_cursor
@@ -0,0 +1,107 @@
+"""
+提示词 token 预算
+
+调用 Gemini 前估算提示词的 token 数（与限流器相同的本地估算，不额外请求 countTokens 接口），
+在单次调用的总预算 PROMPT_TOKEN_BUDGET 内选择 maxOutputTokens：
+- maxOutputTokens 取预计输出（各调用类型的默认值，HTML 按正文长度估算），不超过 PROMPT_MAX_OUTPUT_TOKENS 和剩余预算
+- 提示词过长、剩余预算不足 PROMPT_MIN_OUTPUT_TOKENS 时抛出 PromptTooLargeError，不发出请求
+HTML 生成在正文过长时用 split_text 按段落拆分后分段生成（services/html_service.py）。
+"""
+import re
+from typing import List
+
+from config import PROMPT_TOKEN_BUDGET, PROMPT_MAX_OUTPUT_TOKENS, PROMPT_MIN_OUTPUT_TOKENS
+from utils.rate_limiter import estimate_tokens
+
+# 句末标点（段落过长时在句子之间拆分）
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？；!?;])")
+
+
+class PromptTooLargeError(ValueError):
+    """提示词超出 token 预算"""
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    return estimate_tokens(text)
+
+
+def available_output_tokens(prompt_tokens: int) -> int:
+    """提示词为 prompt_tokens 时单次调用最多可用的输出 token 数"""
+    return min(PROMPT_MAX_OUTPUT_TOKENS, PROMPT_TOKEN_BUDGET - prompt_tokens)
+
+
+def output_token_budget(prompt: str, expected_output_tokens: int) -> int:
+    """
+    为提示词选择 maxOutputTokens
+
+    :param prompt: 完整提示词
+    :param expected_output_tokens: 预计输出的 token 数（各调用类型的默认值或按输入估算）
+    :return: maxOutputTokens（预计输出放不进预算时取剩余预算，超出部分由续写补全）
+    :raises PromptTooLargeError: 提示词过长，剩余预算不足 PROMPT_MIN_OUTPUT_TOKENS
+    """
+    prompt_tokens = count_tokens(prompt)
+    available = available_output_tokens(prompt_tokens)
+    if available < PROMPT_MIN_OUTPUT_TOKENS:
+        raise PromptTooLargeError(
+            f"提示词过长：估算 {prompt_tokens} token，超出单次调用预算 {PROMPT_TOKEN_BUDGET} token"
+            f"（需为输出保留至少 {PROMPT_MIN_OUTPUT_TOKENS} token）")
+    return max(PROMPT_MIN_OUTPUT_TOKENS, min(expected_output_tokens, available))
+
+
+def _split_long(paragraph: str, max_tokens: int) -> List[str]:
+    """把超过 max_tokens 的段落按句子拆开，单句仍过长时按字符截断"""
+    pieces, current = [], ""
+    for sentence in _SENTENCE_END_RE.split(paragraph):
+        if not sentence:
+            continue
+        while count_tokens(sentence) > max_tokens:
+            # 按字节估算，截取不超过 max_tokens 的前缀
+            cut = len(sentence)
+            while cut > 1 and count_tokens(sentence[:cut]) > max_tokens:
+                cut = cut * max_tokens // count_tokens(sentence[:cut]) or cut - 1
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+        if current and count_tokens(current + sentence) > max_tokens:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """
+    按段落把文本拆成若干段，每段估算不超过 max_tokens，各段长度尽量均匀
+
+    :return: 分段列表（文本本身不超过 max_tokens 时只有一段）
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return [text]
+    # 均匀分段的目标长度：段数取能满足上限的最小值
+    count = -(-total // max_tokens)
+    target = -(-total // count)
+
+    paragraphs = []
+    for paragraph in text.split("\n"):
+        if count_tokens(paragraph) > max_tokens:
+            paragraphs.extend(_split_long(paragraph, max_tokens))
+        else:
+            paragraphs.append(paragraph)
+
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in paragraphs:
+        tokens = count_tokens(paragraph) + 1  # 加上换行符并向上取整，各段之和不低于拼接后的估算值
+        if current and (current_tokens + tokens > max_tokens or current_tokens >= target):
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
@@ -0,0 +1,394 @@
+"""
+Gemini 调用限流与自适应并发控制
+
+进程内所有 Gemini 调用共用一个限流器，依次经过：
+- 令牌桶：每分钟请求数（RPM）和每分钟 token 数（TPM）。按预约方式排队，先到先得，不轮询；
+  TPM 先按提示词长度估算预占，响应返回后按 usageMetadata 的实际用量多退少补
+- AIMD 并发控制：同时进行中的请求数不超过当前上限；成功时上限缓慢增加（每轮约 +1），
+  遇到 429/5xx 时减半，之后逐步恢复
+
+同步调用使用 limit()，协程使用 limit_async()，两者共用同一组配额和并发名额；协程排队时不占用线程。
+排队中的请求数、当前上限等指标通过 stats() 获取（/api/limiter/stats）。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config import (GEMINI_RATE_LIMIT_ENABLED, GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT, GEMINI_CONCURRENCY_INITIAL,
+                    GEMINI_CONCURRENCY_MIN, GEMINI_CONCURRENCY_MAX, GEMINI_ACQUIRE_TIMEOUT)
+from utils.logger import logger
+
+OUTCOME_SUCCESS = "success"
+OUTCOME_OVERLOAD = "overload"  # 429 / 5xx：上游过载，需要降低并发
+OUTCOME_ERROR = "error"  # 其他错误：不影响并发上限
+
+
+class RateLimitTimeout(Exception):
+    """排队等待配额超时"""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（中文约 1 个字 1 个 token，英文约 4 个字符 1 个 token，按 UTF-8 字节数 / 3 估算）"""
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """是否为上游过载错误（HTTP 429 或 5xx）"""
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+class TokenBucket:
+    """
+    令牌桶：每分钟补充 rate_per_minute 个令牌，最多积累 capacity 个
+
+    reserve 直接扣除令牌（允许为负，表示欠账），返回需要等待的秒数，
+    后来的请求排在欠账之后，因此等待顺序与调用顺序一致。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity or rate_per_minute
+        self._rate = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        预约 amount 个令牌
+
+        :return: 需要等待的秒数（0 表示立即可用）
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+
+    def adjust(self, amount: float):
+        """补扣（amount > 0）或退还（amount < 0）令牌"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def available(self) -> float:
+        """当前可用令牌数（负数表示排队中的欠账）"""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class AIMDConcurrencyController:
+    """
+    AIMD 并发控制：加性增（每次成功 +1/上限）、乘性减（过载时 ×decrease_factor）
+
+    同一批并发请求同时失败时只降一次：只有在上次降低之后才开始的请求失败，才会再次降低。
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, decrease_factor: float = 0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.decrease_factor = decrease_factor
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._queue: Deque[object] = deque()  # 等待名额的请求，按到达顺序分配
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []  # 等待名额的协程
+
+    def _notify_all(self):
+        """唤醒所有等待者（线程和协程）检查名额，调用方需持有锁"""
+        self._cond.notify_all()
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+        self._async_waiters.clear()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        等待并占用一个并发名额
+
+        :param timeout: 最长等待秒数，None 表示一直等待
+        :return: 占用时刻（release 时传回）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while self._queue[0] is not ticket or self._in_flight >= int(self._limit):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise RateLimitTimeout(f"等待 Gemini 并发名额超时（当前上限 {int(self._limit)}）")
+                    self._cond.wait(remaining)
+            finally:
+                self._queue.remove(ticket)
+                # 队首变化，唤醒下一个等待者检查
+                self._notify_all()
+            self._in_flight += 1
+            return time.monotonic()
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> float:
+        """
+        acquire 的协程版本：排队顺序与同步调用共用，等待期间不阻塞事件循环
+
+        :param timeout: 最长等待秒数，None 表示一直等待
+        :return: 占用时刻（release 时传回）
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self._queue[0] is ticket and self._in_flight < int(self._limit):
+                        self._queue.remove(ticket)
+                        self._notify_all()
+                        self._in_flight += 1
+                        return time.monotonic()
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RateLimitTimeout(f"等待 Gemini 并发名额超时（当前上限 {int(self._limit)}）")
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._notify_all()
+            raise
+
+    def release(self, acquired_at: float, outcome: str):
+        """释放名额，并按结果调整并发上限"""
+        with self._cond:
+            self._in_flight -= 1
+            if outcome == OUTCOME_SUCCESS:
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            elif outcome == OUTCOME_OVERLOAD and acquired_at >= self._last_decrease:
+                previous = int(self._limit)
+                self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                self._last_decrease = time.monotonic()
+                logger.warning(f"Gemini 上游过载，并发上限 {previous} -> {int(self._limit)}")
+            self._notify_all()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                'concurrency_limit': int(self._limit),
+                'concurrency_limit_exact': round(self._limit, 3),
+                'in_flight': self._in_flight,
+                'waiting_for_slot': len(self._queue),
+            }
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Permit:
+    """一次调用的配额凭证，响应返回后用 record_usage 记录实际 token 用量"""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+    def record_usage(self, total_tokens: Optional[int]):
+        if total_tokens:
+            self.actual_tokens = int(total_tokens)
+
+
+class GeminiRateLimiter:
+    """RPM/TPM 令牌桶 + AIMD 并发控制"""
+
+    def __init__(self, rpm: int = GEMINI_RPM_LIMIT, tpm: int = GEMINI_TPM_LIMIT,
+                 initial_concurrency: int = GEMINI_CONCURRENCY_INITIAL, min_concurrency: int = GEMINI_CONCURRENCY_MIN,
+                 max_concurrency: int = GEMINI_CONCURRENCY_MAX, acquire_timeout: Optional[float] = GEMINI_ACQUIRE_TIMEOUT):
+        self.rpm_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.concurrency = AIMDConcurrencyController(initial_concurrency, min_concurrency, max_concurrency)
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._waiting_for_quota = 0
+        self._counters = {
+            'requests': 0,
+            'throttled': 0,  # 排队等待过（RPM/TPM 配额或并发名额）的请求数
+            'wait_seconds': 0.0,
+            'successes': 0,
+            'overloads': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'tokens_used': 0,
+        }
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._counters[key] += value
+
+    def _reserve_quota(self, estimated_tokens: int) -> float:
+        """按 RPM/TPM 预约配额，返回需要等待的秒数；超过排队上限时归还预约并抛出 RateLimitTimeout"""
+        wait = 0.0
+        if self.rpm_bucket:
+            wait = max(wait, self.rpm_bucket.reserve(1))
+        if self.tpm_bucket:
+            wait = max(wait, self.tpm_bucket.reserve(estimated_tokens))
+        if wait <= 0:
+            return 0.0
+        if self.acquire_timeout is not None and wait > self.acquire_timeout:
+            # 预约作废，归还令牌
+            if self.rpm_bucket:
+                self.rpm_bucket.adjust(-1)
+            if self.tpm_bucket:
+                self.tpm_bucket.adjust(-estimated_tokens)
+            raise RateLimitTimeout(f"Gemini 配额不足，需要等待 {wait:.1f}s，超过 {self.acquire_timeout}s")
+        return wait
+
+    def _wait_for_quota(self, estimated_tokens: int) -> float:
+        """按 RPM/TPM 预约配额并等待，返回等待秒数"""
+        wait = self._reserve_quota(estimated_tokens)
+        if wait <= 0:
+            return 0.0
+        with self._lock:
+            self._waiting_for_quota += 1
+        try:
+            time.sleep(wait)
+        finally:
+            with self._lock:
+                self._waiting_for_quota -= 1
+        return wait
+
+    async def _wait_for_quota_async(self, estimated_tokens: int) -> float:
+        """_wait_for_quota 的协程版本"""
+        wait = self._reserve_quota(estimated_tokens)
+        if wait <= 0:
+            return 0.0
+        with self._lock:
+            self._waiting_for_quota += 1
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                self._waiting_for_quota -= 1
+        return wait
+
+    def _record_wait(self, waited: float):
+        if waited > 0.001:
+            self._count(throttled=1, wait_seconds=waited)
+            logger.info(f"Gemini 调用排队 {waited:.2f}s")
+
+    def _release(self, permit: Permit, acquired_at: float, outcome: str):
+        """归还并发名额，按实际 token 用量调整 TPM 并记录结果"""
+        self.concurrency.release(acquired_at, outcome)
+        if permit.actual_tokens is not None and self.tpm_bucket:
+            self.tpm_bucket.adjust(permit.actual_tokens - permit.estimated_tokens)
+        self._count(**{
+            {OUTCOME_SUCCESS: 'successes', OUTCOME_OVERLOAD: 'overloads', OUTCOME_ERROR: 'errors'}[outcome]: 1,
+            'tokens_used': permit.actual_tokens or 0,
+        })
+
+    @contextmanager
+    def limit(self, estimated_tokens: int) -> Iterator[Permit]:
+        """
+        在配额和并发上限内执行一次调用
+
+        with 块内抛出 429/5xx 错误（带 status_code 属性）时降低并发上限，正常结束时缓慢提高。
+
+        :param estimated_tokens: 预估的 token 数（用于 TPM 预占）
+        :return: Permit
+        """
+        self._count(requests=1)
+        try:
+            waited = self._wait_for_quota(estimated_tokens)
+            started = time.monotonic()
+            acquired_at = self.concurrency.acquire(self.acquire_timeout)
+        except RateLimitTimeout:
+            self._count(timeouts=1)
+            raise
+        self._record_wait(waited + acquired_at - started)
+
+        permit = Permit(estimated_tokens)
+        outcome = OUTCOME_ERROR
+        try:
+            yield permit
+            outcome = OUTCOME_SUCCESS
+        except Exception as e:
+            outcome = OUTCOME_OVERLOAD if is_overload_error(e) else OUTCOME_ERROR
+            raise
+        finally:
+            self._release(permit, acquired_at, outcome)
+
+    @asynccontextmanager
+    async def limit_async(self, estimated_tokens: int) -> AsyncIterator[Permit]:
+        """limit 的协程版本（async with），排队等待配额和并发名额时不阻塞事件循环"""
+        self._count(requests=1)
+        try:
+            waited = await self._wait_for_quota_async(estimated_tokens)
+            started = time.monotonic()
+            acquired_at = await self.concurrency.acquire_async(self.acquire_timeout)
+        except RateLimitTimeout:
+            self._count(timeouts=1)
+            raise
+        self._record_wait(waited + acquired_at - started)
+
+        permit = Permit(estimated_tokens)
+        outcome = OUTCOME_ERROR
+        try:
+            yield permit
+            outcome = OUTCOME_SUCCESS
+        except Exception as e:
+            outcome = OUTCOME_OVERLOAD if is_overload_error(e) else OUTCOME_ERROR
+            raise
+        finally:
+            self._release(permit, acquired_at, outcome)
+
+    def stats(self) -> Dict:
+        """当前限额、排队深度和累计统计"""
+        with self._lock:
+            stats = dict(self._counters)
+            waiting_for_quota = self._waiting_for_quota
+        stats.update(self.concurrency.snapshot())
+        stats['waiting_for_quota'] = waiting_for_quota
+        stats['queue_depth'] = waiting_for_quota + stats['waiting_for_slot']
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        stats['rpm_limit'] = self.rpm_bucket.rate_per_minute if self.rpm_bucket else None
+        stats['rpm_available'] = round(self.rpm_bucket.available(), 2) if self.rpm_bucket else None
+        stats['tpm_limit'] = self.tpm_bucket.rate_per_minute if self.tpm_bucket else None
+        stats['tpm_available'] = round(self.tpm_bucket.available(), 2) if self.tpm_bucket else None
+        stats['enabled'] = True
+        return stats
+
+
+_limiter: Optional[GeminiRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_gemini_limiter() -> Optional[GeminiRateLimiter]:
+    """获取进程内共享的 Gemini 限流器；GEMINI_RATE_LIMIT_ENABLED 关闭时返回 None"""
+    global _limiter
+    if not GEMINI_RATE_LIMIT_ENABLED:
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = GeminiRateLimiter()
+                logger.info(f"Gemini 限流已启用: rpm={GEMINI_RPM_LIMIT or '不限'}, tpm={GEMINI_TPM_LIMIT or '不限'}, "
+                            f"并发={GEMINI_CONCURRENCY_INITIAL}（{GEMINI_CONCURRENCY_MIN}-{GEMINI_CONCURRENCY_MAX}）")
+    return _limiter
@@ -0,0 +1,174 @@
+"""
+Gemini 响应缓存
+
+以 (模型, 最终提示词, temperature, max_tokens) 的哈希为键缓存生成结果，分两级：
+- 内存 LRU：容量由 RESPONSE_CACHE_MAX_ENTRIES 控制
+- 磁盘：data/ 下独立的 SQLite 文件，进程重启后仍然有效
+
+两级缓存都按 RESPONSE_CACHE_TTL 过期。命中时累计节省的调用耗时，便于评估缓存收益。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import (RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+                    RESPONSE_CACHE_DISK_PATH)
+from utils.logger import logger
+
+
+def make_cache_key(model: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    """计算缓存键（内容哈希）"""
+    raw = json.dumps([model, prompt, float(temperature), int(max_tokens)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """内存 LRU + 磁盘 SQLite 两级缓存"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL,
+                 disk_path: Optional[str] = RESPONSE_CACHE_DISK_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path or None
+        # key -> (文本, 原始调用耗时, 过期时间)
+        self._memory: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'saved_seconds': 0.0,
+            'saved_chars': 0
+        }
+        if self.disk_path:
+            self._open_disk()
+
+    def _open_disk(self):
+        """打开磁盘缓存文件（失败时只使用内存缓存）"""
+        try:
+            os.makedirs(os.path.dirname(self.disk_path) or ".", exist_ok=True)
+            self._disk = sqlite3.connect(self.disk_path, check_same_thread=False, timeout=5)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL, latency REAL NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_expires_at ON response_cache (expires_at)")
+            self._disk.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"磁盘响应缓存不可用，仅使用内存缓存: {e}")
+            self._disk = None
+
+    def _remember(self, key: str, text: str, latency: float, expires_at: float):
+        """写入内存 LRU（调用方持有锁）"""
+        self._memory[key] = (text, latency, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _record_hit(self, kind: str, text: str, latency: float):
+        self._counters[kind] += 1
+        self._counters['saved_seconds'] += latency
+        self._counters['saved_chars'] += len(text)
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                text, latency, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._record_hit('memory_hits', text, latency)
+                    return text
+                del self._memory[key]
+
+            if self._disk is not None:
+                try:
+                    row = self._disk.execute(
+                        "SELECT response, latency, expires_at FROM response_cache WHERE key = ? AND expires_at > ?",
+                        (key, now)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"读取磁盘响应缓存失败: {e}")
+                    row = None
+                if row:
+                    text, latency, expires_at = row
+                    self._remember(key, text, latency, expires_at)
+                    self._record_hit('disk_hits', text, latency)
+                    return text
+
+            self._counters['misses'] += 1
+            return None
+
+    def put(self, key: str, text: str, latency: float):
+        """写入缓存"""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, text, latency, expires_at)
+            self._counters['writes'] += 1
+            if self._disk is not None:
+                try:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO response_cache (key, response, latency, created_at, expires_at)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (key, text, latency, now, expires_at)
+                    )
+                    # 顺带清理过期记录
+                    if self._counters['writes'] % 100 == 0:
+                        self._disk.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"写入磁盘响应缓存失败: {e}")
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM response_cache")
+                self._disk.commit()
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            if self._disk is not None:
+                try:
+                    stats['disk_entries'] = self._disk.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+                except sqlite3.Error:
+                    stats['disk_entries'] = None
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['saved_seconds'] = round(stats['saved_seconds'], 3)
+        stats['enabled'] = RESPONSE_CACHE_ENABLED
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程内共享的响应缓存；RESPONSE_CACHE_ENABLED 关闭时返回 None"""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+                logger.info(f"Gemini响应缓存已启用: max_entries={RESPONSE_CACHE_MAX_ENTRIES}, "
+                            f"ttl={RESPONSE_CACHE_TTL}s, disk={RESPONSE_CACHE_DISK_PATH or '未启用'}")
+    return _cache
@@ -0,0 +1,284 @@
+"""
+Gemini 调用的重试策略
+
+- 错误分类：429、408、5xx、超时和连接错误可以重试；其他 4xx、响应解析失败（如内容被拒绝）不重试
+- 指数退避 + 全抖动：第 n 次重试前随机等待 0 ~ min(上限, 基数 * 2^(n-1)) 秒；响应带 Retry-After 时按其等待
+- 总时间预算：所有请求和等待共用一个截止时间，单次请求的超时不超过剩余预算，预算不足时不再重试
+- 对冲请求（可选）：按调用类型（标题/短文/HTML）统计近期耗时，单次请求超过 P95 仍未返回时再发一次，
+  取先成功的结果（另一个请求在后台结束后丢弃）
+
+协程使用 async_call_with_retry，策略和统计与同步调用共用；对冲时输掉的请求直接取消。
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import requests
+
+from config import (GEMINI_RETRY_MAX_ATTEMPTS, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY, GEMINI_RETRY_DEADLINE,
+                    GEMINI_HEDGE_ENABLED, GEMINI_HEDGE_PERCENTILE, GEMINI_HEDGE_MIN_SAMPLES)
+from utils.logger import logger
+from utils.tracing import bind_span
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NETWORK_ERRORS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                            requests.exceptions.ChunkedEncodingError)
+if httpx is not None:
+    # 超时、连接错误、连接中断（httpx.TransportError 包含这几类）
+    RETRYABLE_NETWORK_ERRORS += (httpx.TransportError,)
+
+
+class DeadlineExceeded(Exception):
+    """调用的总时间预算已用完"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """错误是否值得重试"""
+    if isinstance(error, RETRYABLE_NETWORK_ERRORS):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+class RetryPolicy:
+    """重试次数、退避和总时间预算"""
+
+    def __init__(self, max_attempts: int = GEMINI_RETRY_MAX_ATTEMPTS, base_delay: float = GEMINI_RETRY_BASE_DELAY,
+                 max_delay: float = GEMINI_RETRY_MAX_DELAY, deadline: float = GEMINI_RETRY_DEADLINE):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, retry_number: int, error: BaseException) -> float:
+        """
+        第 retry_number 次重试前的等待秒数
+
+        :param retry_number: 重试序号（从 1 开始）
+        :param error: 上一次请求的错误（带 retry_after 属性时优先使用）
+        """
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry_number - 1))))
+
+
+class LatencyTracker:
+    """记录某类调用最近的成功耗时，用于计算对冲阈值"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = 1) -> Optional[float]:
+        """耗时分位数；样本不足时返回 None"""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+# 对冲请求在独立线程中执行，输掉的请求在后台结束
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini-hedge")
+
+
+def _tracker(stage: str) -> LatencyTracker:
+    with _stats_lock:
+        if stage not in _trackers:
+            _trackers[stage] = LatencyTracker()
+            _stats[stage] = {'calls': 0, 'attempts': 0, 'retries': 0, 'failures': 0,
+                             'deadline_exceeded': 0, 'hedges': 0, 'hedge_wins': 0}
+        return _trackers[stage]
+
+
+def _count(stage: str, **deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            _stats[stage][key] += value
+
+
+def get_retry_stats() -> Dict[str, Dict]:
+    """按调用类型返回重试/对冲次数和耗时分位数"""
+    result = {}
+    for stage, tracker in list(_trackers.items()):
+        with _stats_lock:
+            stats = dict(_stats[stage])
+        stats['samples'] = len(tracker)
+        for name, p in (('p50', 0.5), ('p95', 0.95)):
+            value = tracker.percentile(p)
+            stats[f'latency_{name}'] = round(value, 3) if value is not None else None
+        result[stage] = stats
+    return result
+
+
+def _attempt_with_hedge(attempt: Callable[[float], T], timeout: float, hedge_delay: Optional[float], stage: str) -> T:
+    """
+    执行一次请求；超过 hedge_delay 仍未返回时再发一次，返回先成功的结果
+
+    两个请求都失败时抛出后失败的那个错误。
+    """
+    if hedge_delay is None or hedge_delay >= timeout:
+        return attempt(timeout)
+    started = time.monotonic()
+    attempt = bind_span(attempt)  # 在对冲线程中执行时仍记录在当前调用的 span 下
+    primary = _hedge_executor.submit(attempt, timeout)
+    done, _ = wait([primary], timeout=hedge_delay)
+    if done:
+        return primary.result()
+
+    _count(stage, hedges=1)
+    logger.info(f"Gemini {stage} 请求 {hedge_delay:.2f}s 未返回（P{int(GEMINI_HEDGE_PERCENTILE * 100)}），发起对冲请求")
+    hedge = _hedge_executor.submit(attempt, max(1.0, timeout - (time.monotonic() - started)))
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    _count(stage, hedge_wins=1)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_retry(attempt: Callable[[float], T], stage: str, timeout: float,
+                    policy: Optional[RetryPolicy] = None, hedge: bool = GEMINI_HEDGE_ENABLED) -> T:
+    """
+    按重试策略执行调用
+
+    :param attempt: 执行一次请求的函数，参数为本次请求的超时秒数；失败时抛出原始异常
+                    （GeminiAPIError / requests 异常），由 is_retryable 判断是否重试
+    :param stage: 调用类型（title / article / html / default），分别统计耗时和对冲阈值
+    :param timeout: 单次请求的超时秒数
+    :param policy: 重试策略（默认取配置）
+    :param hedge: 是否启用对冲请求
+    :return: attempt 的返回值
+    """
+    policy = policy or RetryPolicy()
+    tracker = _tracker(stage)
+    _count(stage, calls=1)
+    deadline = time.monotonic() + policy.deadline
+    for attempt_number in range(1, policy.max_attempts + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _count(stage, failures=1, deadline_exceeded=1)
+            raise DeadlineExceeded(f"Gemini {stage} 调用超过总时间预算 {policy.deadline:.0f}s")
+        attempt_timeout = min(timeout, remaining)
+        hedge_delay = tracker.percentile(GEMINI_HEDGE_PERCENTILE, GEMINI_HEDGE_MIN_SAMPLES) if hedge else None
+        _count(stage, attempts=1)
+        started = time.monotonic()
+        try:
+            result = _attempt_with_hedge(attempt, attempt_timeout, hedge_delay, stage)
+        except Exception as e:
+            if not is_retryable(e) or attempt_number == policy.max_attempts:
+                _count(stage, failures=1)
+                raise
+            delay = policy.backoff(attempt_number, e)
+            if time.monotonic() + delay >= deadline:
+                logger.warning(f"Gemini {stage} 请求失败且剩余时间预算不足以重试: {e}")
+                _count(stage, failures=1, deadline_exceeded=1)
+                raise
+            logger.warning(f"Gemini {stage} 第 {attempt_number} 次请求失败，{delay:.2f}s 后重试: {str(e)[:200]}")
+            _count(stage, retries=1)
+            time.sleep(delay)
+            continue
+        tracker.record(time.monotonic() - started)
+        return result
+
+
+async def _attempt_with_hedge_async(attempt: Callable[[float], Awaitable[T]], timeout: float,
+                                    hedge_delay: Optional[float], stage: str) -> T:
+    """_attempt_with_hedge 的协程版本：先完成的请求成功后取消另一个请求"""
+    if hedge_delay is None or hedge_delay >= timeout:
+        return await attempt(timeout)
+    started = time.monotonic()
+    primary = asyncio.ensure_future(attempt(timeout))
+    done, _ = await asyncio.wait([primary], timeout=hedge_delay)
+    if done:
+        return primary.result()
+
+    _count(stage, hedges=1)
+    logger.info(f"Gemini {stage} 请求 {hedge_delay:.2f}s 未返回（P{int(GEMINI_HEDGE_PERCENTILE * 100)}），发起对冲请求")
+    hedge = asyncio.ensure_future(attempt(max(1.0, timeout - (time.monotonic() - started))))
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        _count(stage, hedge_wins=1)
+                    return future.result()
+                error = future.exception()
+    finally:
+        for future in pending:
+            future.cancel()
+    raise error
+
+
+async def async_call_with_retry(attempt: Callable[[float], Awaitable[T]], stage: str, timeout: float,
+                                policy: Optional[RetryPolicy] = None, hedge: bool = GEMINI_HEDGE_ENABLED) -> T:
+    """
+    call_with_retry 的协程版本，退避等待期间不阻塞事件循环
+
+    :param attempt: 执行一次请求的协程函数，参数为本次请求的超时秒数
+    :param stage: 调用类型（title / article / html / default）
+    :param timeout: 单次请求的超时秒数
+    :param policy: 重试策略（默认取配置）
+    :param hedge: 是否启用对冲请求
+    :return: attempt 的返回值
+    """
+    policy = policy or RetryPolicy()
+    tracker = _tracker(stage)
+    _count(stage, calls=1)
+    deadline = time.monotonic() + policy.deadline
+    for attempt_number in range(1, policy.max_attempts + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _count(stage, failures=1, deadline_exceeded=1)
+            raise DeadlineExceeded(f"Gemini {stage} 调用超过总时间预算 {policy.deadline:.0f}s")
+        attempt_timeout = min(timeout, remaining)
+        hedge_delay = tracker.percentile(GEMINI_HEDGE_PERCENTILE, GEMINI_HEDGE_MIN_SAMPLES) if hedge else None
+        _count(stage, attempts=1)
+        started = time.monotonic()
+        try:
+            result = await _attempt_with_hedge_async(attempt, attempt_timeout, hedge_delay, stage)
+        except Exception as e:
+            if not is_retryable(e) or attempt_number == policy.max_attempts:
+                _count(stage, failures=1)
+                raise
+            delay = policy.backoff(attempt_number, e)
+            if time.monotonic() + delay >= deadline:
+                logger.warning(f"Gemini {stage} 请求失败且剩余时间预算不足以重试: {e}")
+                _count(stage, failures=1, deadline_exceeded=1)
+                raise
+            logger.warning(f"Gemini {stage} 第 {attempt_number} 次请求失败，{delay:.2f}s 后重试: {str(e)[:200]}")
+            _count(stage, retries=1)
+            await asyncio.sleep(delay)
+            continue
+        tracker.record(time.monotonic() - started)
+        return result
@@ -0,0 +1,462 @@
+"""
+请求追踪
+
+每个 HTTP 请求、每次后台任务执行各对应一个 trace（追踪ID），其中的 generate_* / save_*_to_db /
+get_gemini_response / call_coze_api 等调用各记录一个 span（开始时间、耗时、父 span、属性、错误），
+用于查看一次请求的时间花在了哪一步。
+
+- 当前 span 保存在 contextvars 中：同一线程内嵌套调用、协程（含 asyncio.to_thread）自动继承；
+  提交到线程池的函数用 bind_span 包装，提交到共享事件循环的协程用 bind_span_async 包装
+- 日志记录带上当前的 trace_id（文本格式在消息前注明，JSON 格式为 trace_id 字段），同一请求的日志可以串起来
+- 调用上游时附带 W3C traceparent 请求头；收到带 traceparent 的请求时沿用其中的追踪ID
+- 最近 TRACE_MAX_TRACES 个 trace 保存在内存中（/debug/traces/<trace_id> 查看瀑布图）；
+  TRACE_EXPORTER=file 时由后台线程把 span 逐行写入 JSONL 文件，=otlp 时以 OTLP/HTTP JSON 批量发送到采集器
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+import requests
+
+from config import (TRACING_ENABLED, TRACE_MAX_TRACES, TRACE_MAX_SPANS_PER_TRACE, TRACE_EXPORTER, TRACE_EXPORT_FILE,
+                    TRACE_OTLP_ENDPOINT, TRACE_SERVICE_NAME)
+from utils.logger import logger, log_handler
+
+T = TypeVar("T")
+
+_TRACEPARENT_RE = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    """一次被追踪的调用"""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_time", "_started", "duration", "attributes",
+                 "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self, error: Optional[BaseException] = None):
+        """结束 span 并交给存储和导出（只生效一次）"""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.set_error(error)
+        _store.add(self)
+        if _exporter is not None:
+            _exporter.export(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def start_span(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+               **attributes) -> Optional[Span]:
+    """
+    创建 span（不设为当前 span），调用方负责 end()；追踪关闭时返回 None
+
+    :param trace_id: 指定追踪ID时作为该追踪的根 span（如沿用 traceparent），否则作为当前 span 的子 span，没有当前 span 时新建追踪
+    """
+    if not TRACING_ENABLED:
+        return None
+    if trace_id is None:
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id = new_trace_id()
+    return Span(name, trace_id, parent_id, attributes)
+
+
+def activate(span: Optional[Span]) -> contextvars.Token:
+    """把 span 设为当前 span，返回用于 deactivate 的 token"""
+    return _current_span.set(span)
+
+
+def deactivate(token: contextvars.Token):
+    _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """在当前 span 下记录一个子 span（with 块内为当前 span），抛出异常时记录错误"""
+    current = start_span(name, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def _arg_getter(func: Callable, names: Sequence[str]) -> Callable[[tuple, dict], Dict[str, Any]]:
+    """按参数名从调用参数中取值（预先算好位置，调用时不做签名绑定）"""
+    params = list(inspect.signature(func).parameters.values())
+    positions = {p.name: (i, p.default) for i, p in enumerate(params)}
+
+    def get(args: tuple, kwargs: dict) -> Dict[str, Any]:
+        values = {}
+        for name in names:
+            index, default = positions[name]
+            if name in kwargs:
+                value = kwargs[name]
+            elif index < len(args):
+                value = args[index]
+            elif default is not inspect.Parameter.empty:
+                value = default
+            else:
+                continue
+            values[name] = value
+        return values
+
+    return get
+
+
+def traced(name: Optional[str] = None, attrs: Sequence[str] = ()) -> Callable[[Callable], Callable]:
+    """
+    装饰器：每次调用记录一个 span，支持普通函数、协程函数和生成器函数
+
+    生成器的 span 从第一次迭代持续到生成结束或被关闭，期间不设为当前 span（迭代发生在调用方的上下文中）。
+
+    :param name: span 名称，默认为函数名
+    :param attrs: 作为 span 属性记录的参数名（如 stage、title_id）
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+        get_attrs = _arg_getter(func, attrs) if attrs else (lambda args, kwargs: {})
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **get_attrs(args, kwargs)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                current = start_span(span_name, **get_attrs(args, kwargs))
+                try:
+                    yield from func(*args, **kwargs)
+                except GeneratorExit:
+                    if current:
+                        current.set_attribute('cancelled', True)
+                    raise
+                except BaseException as e:
+                    if current:
+                        current.end(e)
+                    raise
+                finally:
+                    if current:
+                        current.end()
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **get_attrs(args, kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def bind_span(func: Callable[..., T]) -> Callable[..., T]:
+    """包装提交到线程池的函数，使其在提交时的 span 下执行（每次调用单独设置，可并发调用）"""
+    parent = _current_span.get()
+    if parent is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return wrapper
+
+
+async def _run_with_span(parent: Span, coro: Awaitable[T]) -> T:
+    _current_span.set(parent)  # 在新任务自己的上下文中设置，不影响其他任务
+    return await coro
+
+
+def bind_span_async(coro: Awaitable[T]) -> Awaitable[T]:
+    """包装提交到其他事件循环（run_coroutine_threadsafe）的协程，使其在提交时的 span 下执行"""
+    parent = _current_span.get()
+    if parent is None:
+        return coro
+    return _run_with_span(parent, coro)
+
+
+def bind_iterator(iterable: Iterable[T]) -> Iterator[T]:
+    """
+    包装在请求结束后才被迭代的生成器（如 SSE 响应体），每次取下一个元素时设为创建时的 span
+
+    只在取元素期间设置，不影响迭代方自己的上下文。
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return iter(iterable)
+
+    def iterate() -> Iterator[T]:
+        iterator = iter(iterable)
+        try:
+            while True:
+                token = _current_span.set(parent)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current_span.reset(token)
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                token = _current_span.set(parent)
+                try:
+                    close()
+                finally:
+                    _current_span.reset(token)
+
+    return iterate()
+
+
+def parse_traceparent(header: Optional[str]):
+    """解析 W3C traceparent 请求头，返回 (trace_id, parent_span_id)，格式不对时返回 (None, None)"""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def trace_headers() -> Dict[str, str]:
+    """调用上游时附带的追踪请求头（当前没有 span 时为空）"""
+    current = _current_span.get()
+    if current is None:
+        return {}
+    return {"traceparent": f"00-{current.trace_id}-{current.span_id}-01"}
+
+
+class _TraceStore:
+    """最近的 trace（按最后一次记录 span 的时间淘汰最旧的）"""
+
+    def __init__(self, max_traces: int, max_spans: int):
+        self.max_traces = max(1, max_traces)
+        self.max_spans = max(1, max_spans)
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, finished: Span):
+        with self._lock:
+            spans = self._traces.get(finished.trace_id)
+            if spans is None:
+                spans = self._traces[finished.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            else:
+                self._traces.move_to_end(finished.trace_id)
+            if len(spans) < self.max_spans:
+                spans.append(finished)
+
+    def get(self, trace_id: str) -> Optional[List[Span]]:
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            return list(spans) if spans is not None else None
+
+    def recent(self) -> List[List[Span]]:
+        with self._lock:
+            return [list(spans) for spans in reversed(self._traces.values())]
+
+
+_store = _TraceStore(TRACE_MAX_TRACES, TRACE_MAX_SPANS_PER_TRACE)
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(finished: Span) -> Dict:
+    start_ns = int(finished.start_time * 1e9)
+    otlp = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": 1,
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + int((finished.duration or 0) * 1e9)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in finished.attributes.items()],
+        "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+    }
+    if finished.parent_id:
+        otlp["parentSpanId"] = finished.parent_id
+    return otlp
+
+
+class _SpanExporter:
+    """后台线程批量导出已结束的 span；队列满时丢弃，不阻塞调用方"""
+
+    BATCH_SIZE = 256
+    FLUSH_INTERVAL = 2.0
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        threading.Thread(target=self._loop, name="trace-exporter", daemon=True).start()
+
+    def export(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.FLUSH_INTERVAL
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning(f"导出追踪数据失败（丢弃 {len(batch)} 个 span）: {e}")
+
+    def _write(self, batch: List[Span]):
+        if self.kind == "file":
+            with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in batch)
+            return
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "utils.tracing"}, "spans": [_otlp_span(s) for s in batch]}],
+        }]}
+        response = requests.post(f"{TRACE_OTLP_ENDPOINT.rstrip('/')}/v1/traces", json=body, timeout=5)
+        response.raise_for_status()
+
+
+_exporter: Optional[_SpanExporter] = None
+if TRACING_ENABLED and TRACE_EXPORTER in ("file", "otlp"):
+    if TRACE_EXPORTER == "file":
+        os.makedirs(os.path.dirname(TRACE_EXPORT_FILE) or ".", exist_ok=True)
+    if TRACE_EXPORTER == "otlp" and not TRACE_OTLP_ENDPOINT:
+        logger.warning("TRACE_EXPORTER=otlp 但未设置 TRACE_OTLP_ENDPOINT，不导出追踪数据")
+    else:
+        _exporter = _SpanExporter(TRACE_EXPORTER)
+
+
+def get_trace(trace_id: str) -> Optional[List[Dict]]:
+    """某个 trace 已结束的 span（按开始时间排序），不存在时返回 None"""
+    spans = _store.get(trace_id)
+    if spans is None:
+        return None
+    return [s.to_dict() for s in sorted(spans, key=lambda s: s.start_time)]
+
+
+def list_traces(limit: int = 50, filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """
+    最近的 trace 摘要（最近活动的在前）
+
+    :param filters: 属性过滤条件（如 {'job_id': '12'}），trace 中任一 span 的属性匹配即可
+    """
+    summaries = []
+    for spans in _store.recent():
+        if len(summaries) >= limit:
+            break
+        if filters and not all(any(str(s.attributes.get(key)) == value for s in spans)
+                               for key, value in filters.items()):
+            continue
+        root = next((s for s in spans if s.parent_id is None or all(s.parent_id != o.span_id for o in spans)), spans[0])
+        start = min(s.start_time for s in spans)
+        end = max(s.start_time + (s.duration or 0) for s in spans)
+        summaries.append({
+            'trace_id': root.trace_id,
+            'name': root.name,
+            'attributes': root.attributes,
+            'start_time': start,
+            'duration_ms': round((end - start) * 1000, 3),
+            'span_count': len(spans),
+            'error': any(s.error for s in spans),
+        })
+    return summaries
+
+
+class _TraceIdFilter(logging.Filter):
+    """在日志记录上附加当前的 trace_id（在调用方线程中执行）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = _current_span.get()
+        if current is not None:
+            record.trace_id = current.trace_id
+        return True
+
+
+if TRACING_ENABLED:
+    log_handler.addFilter(_TraceIdFilter())